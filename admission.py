@@ -0,0 +1,208 @@
+"""Admission control for chat requests.
+
+Each chat turn costs a classifier pass and an LLM call, so requests are
+admitted before any of that work starts:
+
+- token buckets per user and per client IP answer 429 with Retry-After once a
+  client sends faster than its refill rate (after an initial burst);
+- a cap on chat turns in flight answers 503 instead of letting every request
+  queue until the server times out.
+
+Buckets live in-process by default; ``RedisBucketStore`` keeps them in a
+shared Redis-compatible server so the limits hold across workers. The
+in-flight cap is always per process.
+"""
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class Decision:
+    def __init__(self, allowed: bool, status: int = 200, reason: Optional[str] = None, retry_after: float = 0.0,
+                 on_release: Optional[Callable[[], None]] = None):
+        self.allowed = allowed
+        self.status = status
+        self.reason = reason
+        self.retry_after = retry_after
+        self._on_release = on_release
+
+    def release(self):
+        """Give back the in-flight slot, if this decision holds one; safe to call more than once"""
+        on_release, self._on_release = self._on_release, None
+        if on_release is not None:
+            on_release()
+
+    @property
+    def retry_after_header(self) -> str:
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+class LocalBucketStore:
+    """Token buckets in a bounded LRU; an evicted bucket simply starts full again"""
+
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key: str, rate: float, burst: float) -> Tuple[bool, float]:
+        """Take one token; returns (allowed, seconds until one is available)"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            if tokens >= 1:
+                allowed, wait = True, 0.0
+                tokens -= 1
+            else:
+                allowed, wait = False, (1 - tokens) / rate
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return allowed, wait
+
+    def refund(self, key: str):
+        """Return a token taken for a request that was then refused by another limit"""
+        with self._lock:
+            if key in self._buckets:
+                tokens, updated = self._buckets[key]
+                self._buckets[key] = (tokens + 1, updated)
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+# Refill and take in one round trip; the server clock keeps workers on
+# different hosts consistent
+_TAKE_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(bucket[1]) or burst
+local updated = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+local allowed = 0
+local wait = 0
+if tokens >= 1 then
+  tokens = tokens - 1
+  allowed = 1
+else
+  wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return {allowed, tostring(wait)}
+"""
+
+
+class RedisBucketStore:
+    """Shared token buckets; if the server can't be reached requests are let through"""
+
+    def __init__(self, url: str, prefix: str = "admission:"):
+        import redis
+
+        self.client = redis.Redis.from_url(url, socket_timeout=0.05, socket_connect_timeout=0.05)
+        self.prefix = prefix
+        self._take = self.client.register_script(_TAKE_SCRIPT)
+        self.errors = 0
+
+    def take(self, key: str, rate: float, burst: float) -> Tuple[bool, float]:
+        try:
+            allowed, wait = self._take(keys=[self.prefix + key], args=[rate, burst])
+        except Exception as e:
+            self.errors += 1
+            logger.debug("Shared rate limit check failed: %s", e)
+            return True, 0.0
+        return bool(int(allowed)), float(wait)
+
+    def refund(self, key: str):
+        # The next take caps the count at the burst size again
+        try:
+            self.client.hincrbyfloat(self.prefix + key, 'tokens', 1)
+        except Exception as e:
+            self.errors += 1
+            logger.debug("Shared rate limit refund failed: %s", e)
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        store=None,
+        user_rate: float = 20 / 60,
+        user_burst: float = 10,
+        ip_rate: float = 60 / 60,
+        ip_burst: float = 30,
+        max_inflight: int = 32,
+    ):
+        # A rate of 0 turns that limit off, as does max_inflight=0
+        self.store = store if store is not None else LocalBucketStore()
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.ip_rate = ip_rate
+        self.ip_burst = ip_burst
+        self.max_inflight = max_inflight
+        self._inflight = 0
+        self._lock = threading.Lock()
+
+        self.admitted = 0
+        self.rejected: Dict[str, int] = {'user_rate': 0, 'ip_rate': 0, 'overloaded': 0}
+
+    def _acquire_slot(self) -> bool:
+        with self._lock:
+            if self.max_inflight and self._inflight >= self.max_inflight:
+                return False
+            self._inflight += 1
+            return True
+
+    def _release_slot(self):
+        with self._lock:
+            self._inflight -= 1
+
+    def _reject(self, status: int, reason: str, retry_after: float) -> Decision:
+        with self._lock:
+            self.rejected[reason] += 1
+        return Decision(False, status, reason, retry_after)
+
+    def admit(self, user_id, ip: Optional[str]) -> Decision:
+        """Check the limits for one chat turn; call ``release()`` on the decision once the turn is done"""
+        # Checked first so a shed request doesn't also spend the client's tokens
+        if not self._acquire_slot():
+            return self._reject(503, 'overloaded', 1.0)
+        checks = (('user_rate', f"user:{user_id}", self.user_rate, self.user_burst),
+                  ('ip_rate', f"ip:{ip}", self.ip_rate, self.ip_burst if ip else 0))
+        taken = []
+        for reason, key, rate, burst in checks:
+            if not rate or not burst:
+                continue
+            allowed, wait = self.store.take(key, rate, burst)
+            if not allowed:
+                for key in taken:
+                    self.store.refund(key)
+                self._release_slot()
+                return self._reject(429, reason, wait)
+            taken.append(key)
+        with self._lock:
+            self.admitted += 1
+        return Decision(True, on_release=self._release_slot)
+
+    @property
+    def inflight(self) -> int:
+        return self._inflight
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'inflight': self._inflight,
+                'max_inflight': self.max_inflight,
+                'admitted': self.admitted,
+                'rejected': dict(self.rejected),
+                'store': type(self.store).__name__,
+                'store_errors': getattr(self.store, 'errors', 0),
+            }
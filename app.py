@@ -1,28 +1,101 @@
+import time
+
+_import_started = time.perf_counter()
+
+import asyncio
+import functools
+import gc
+import hmac
 import os
 import json
+import logging
 import random
-from typing import Dict
-from flask import Flask, request, jsonify, render_template, session, redirect, url_for, flash
+from concurrent.futures import Future
+from datetime import datetime, timezone
+from typing import Dict, Iterator, Tuple
+import click
+from flask import Flask, Response, g, request, jsonify, render_template, session, redirect, url_for, flash, stream_with_context
 from flask_cors import CORS
-from transformers import pipeline
-from langchain_groq import ChatGroq
-from langchain.prompts import PromptTemplate
-from werkzeug.security import generate_password_hash, check_password_hash
 from sqlalchemy import (
     create_engine,
     Column,
+    Date,
     DateTime,
+    Float,
+    Index,
     Integer,
+    LargeBinary,
     MetaData,
     String,
     Table,
     Text,
+    and_,
+    inspect,
+    or_,
     select,
+    text,
 )
-from sqlalchemy.exc import IntegrityError
+from sqlalchemy.schema import CreateColumn
+from sqlalchemy.exc import DBAPIError, IntegrityError
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.sql import func
 
+from admission import AdmissionController, Decision, LocalBucketStore, RedisBucketStore
+from auth import AuthBusy, PasswordHasher, UserLookupCache
+from batching import MicroBatcher
+from context_cache import ContextCache
+from context_store import RedisContextStore, SQLContextStore, VersionConflict
+from conversation_context import ConversationContext
+from conversation_context import decode as decode_context
+from crisis import DEFAULT_PHRASES_PATH, CrisisDetector
+from emotion_cache import EmotionCache, RedisLabelStore
+from export import FORMATS as EXPORT_FORMATS
+from export import export_chunks
+from keyed_executor import KeyedExecutor
+from llm_gateway import CircuitBreaker, CircuitOpen, DeadlineExceeded, LLMGateway, http_clients
+from emotion_backends import create_backend, export_onnx, load_samples, parity_check
+from metrics import ProfileLog, SamplingProfiler, registry
+from model_loader import LazyResource, startup_timings, timed_phase
+from mood_rollups import PERIODS as MOOD_SUMMARY_PERIODS
+from mood_rollups import MoodRollups
+from retrieval import Retriever, create_embedder, create_index
+from summarizer import Compactor, extractive_summary, llm_summary
+from tagging import Checkpoint, JournalTagger
+from write_behind import WriteBehindQueue, WriteQueueFull
+
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
+logger = logging.getLogger(__name__)
+
+STAGE_SECONDS = registry.histogram(
+    "chat_stage_seconds", "Time spent in each stage of a chat turn", ["stage"]
+)
+LLM_FIRST_TOKEN_SECONDS = registry.histogram(
+    "llm_time_to_first_token_seconds", "Time from sending a streaming prompt to the first token"
+)
+REQUEST_SECONDS = registry.histogram(
+    "http_request_seconds", "Request latency by endpoint", ["endpoint", "method", "status"]
+)
+FALLBACK_RESPONSES = registry.counter(
+    "chat_fallback_responses_total", "Canned emotion_responses replies served instead of the LLM", ["reason"]
+)
+CRISIS_DETECTIONS = registry.counter(
+    "crisis_detections_total", "Messages answered with the crisis response"
+)
+ERRORS = registry.counter(
+    "errors_total", "Errors caught and handled on the request path", ["where"]
+)
+EMOTION_CACHE_LOOKUPS = registry.counter(
+    "emotion_cache_lookups_total", "Emotion label cache lookups by tier (local, shared) and result", ["tier", "result"]
+)
+ADMISSION_REJECTIONS = registry.counter(
+    "chat_admission_rejections_total", "Chat requests turned away before any work (user_rate, ip_rate, overloaded)", ["reason"]
+)
+
+# lazy: load models on first use; preload: load at import (in the gunicorn
+# master when preload_app is on, so workers share the pages copy-on-write);
+# background: start loading at import without blocking startup
+MODEL_LOAD_MODE = os.getenv("MODEL_LOAD_MODE", "lazy").lower()
+
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///users.db")
 is_sqlite = DATABASE_URL.startswith("sqlite")
 engine = create_engine(
@@ -31,6 +104,20 @@ engine = create_engine(
     pool_pre_ping=True,
 )
 SessionLocal = sessionmaker(bind=engine)
+
+# Batches chat, check-in and journal writes into multi-row statements off the request path
+write_queue = WriteBehindQueue(
+    engine,
+    max_batch=int(os.getenv("WRITE_BEHIND_MAX_BATCH", "500")),
+    flush_interval=float(os.getenv("WRITE_BEHIND_FLUSH_MS", "50")) / 1000.0,
+    max_pending=int(os.getenv("WRITE_BEHIND_MAX_PENDING", "10000")),
+    enqueue_timeout=float(os.getenv("WRITE_BEHIND_ENQUEUE_TIMEOUT", "2")),
+).register_atexit()
+# Post-response persistence runs here, in order per user (see complete_turn).
+# Registered after write_queue so it drains first at exit.
+persist_executor = KeyedExecutor(
+    max_workers=int(os.getenv("PERSIST_WORKERS", "4")), name="persist"
+).register_atexit()
 metadata = MetaData()
 
 users_table = Table(
@@ -51,6 +138,97 @@ user_chat_history_table = Table(
     Column("last_updated", DateTime(timezone=True), server_default=func.now(), onupdate=func.now()),
 )
 
+# Append-only log of chat turns; one row per message, ordered per user by seq
+chat_messages_table = Table(
+    "chat_messages",
+    metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("user_id", Integer, nullable=False),
+    Column("seq", Integer, nullable=False),
+    Column("message", Text, nullable=False),
+    Column("response", Text),
+    Column("emotion", String(20)),
+    Column("created_at", DateTime(timezone=True), server_default=func.now()),
+    Index("ix_chat_messages_user_seq", "user_id", "seq", unique=True),
+)
+
+# Small per-user summary row, rewritten each turn at constant size
+chat_state_table = Table(
+    "chat_state",
+    metadata,
+    Column("user_id", Integer, primary_key=True),
+    Column("current_emotion", String(20)),
+    Column("conversation_depth", Integer, nullable=False, default=0),
+    Column("last_topic", String(200)),
+    Column("last_seq", Integer, nullable=False, default=0),
+    # Rolling summary of every message up to summarized_seq
+    Column("summary", Text),
+    Column("summarized_seq", Integer, default=0),
+    # Encoded ConversationContext, recent messages included, so a cache miss is one read
+    Column("context", LargeBinary),
+    # Bumped on every write; writers compare-and-swap on it (see context_store.py)
+    Column("version", Integer),
+    Column("last_updated", DateTime(timezone=True), server_default=func.now(), onupdate=func.now()),
+)
+
+# Number of recent messages kept in a user's context
+CHAT_HISTORY_WINDOW = int(os.getenv("CHAT_HISTORY_WINDOW", "20"))
+# Encoded contexts at least this big are zstd-compressed (when zstandard is installed)
+CONTEXT_COMPRESS_MIN_BYTES = int(os.getenv("CONTEXT_COMPRESS_MIN_BYTES", "512"))
+# With the database store, check a cached context's version before reusing it
+# (one primary-key read); the Redis store pushes invalidations instead
+CONTEXT_VERSION_CHECK = os.getenv("CONTEXT_VERSION_CHECK", "true").lower() == "true"
+CONTEXT_CAS_ATTEMPTS = 5
+
+
+def rebuild_context(conn, state) -> ConversationContext:
+    """Context for a chat_state row saved before the encoded context column existed:
+    the summary row plus the last N messages the rolling summary doesn't cover yet"""
+    summarized_seq = state.summarized_seq or 0
+    recent = conn.execute(
+        select(chat_messages_table.c.message)
+        .where(
+            chat_messages_table.c.user_id == state.user_id,
+            chat_messages_table.c.seq > summarized_seq,
+        )
+        .order_by(chat_messages_table.c.seq.desc())
+        .limit(CHAT_HISTORY_WINDOW)
+    ).fetchall()
+    return ConversationContext(
+        emotional_history=[row.message for row in reversed(recent)],
+        current_emotion=state.current_emotion,
+        conversation_depth=state.conversation_depth,
+        last_topic=state.last_topic,
+        last_seq=state.last_seq,
+        summary=state.summary,
+        summarized_seq=summarized_seq,
+    )
+
+
+def create_context_store():
+    durable = SQLContextStore(engine, chat_state_table, rebuild=rebuild_context,
+                              compress_min_bytes=CONTEXT_COMPRESS_MIN_BYTES)
+    if os.getenv("CONTEXT_STORE", "sql").lower() == "redis":
+        try:
+            return RedisContextStore(
+                os.getenv("CONTEXT_STORE_REDIS_URL", "redis://localhost:6379/0"),
+                durable,
+                ttl_seconds=int(os.getenv("CONTEXT_STORE_TTL_SECONDS", "86400")),
+            )
+        except ImportError:
+            logger.warning("CONTEXT_STORE=redis but the redis package is not installed; using the database")
+    return durable
+
+
+# The copy of every user's context that all workers agree on; each worker's
+# user_conversations cache sits in front of it
+context_store = create_context_store()
+
+SUMMARY_BACKEND = os.getenv("SUMMARY_BACKEND", "llm")
+SUMMARY_KEEP_TURNS = int(os.getenv("SUMMARY_KEEP_TURNS", "3"))
+SUMMARY_EVERY_TURNS = int(os.getenv("SUMMARY_EVERY_TURNS", "6"))
+SUMMARY_MAX_CHARS = int(os.getenv("SUMMARY_MAX_CHARS", "800"))
+
 mood_checkins_table = Table(
     "mood_checkins",
     metadata,
@@ -59,8 +237,31 @@ mood_checkins_table = Table(
     Column("mood", Integer, nullable=False),
     Column("note", Text),
     Column("created_at", DateTime(timezone=True), server_default=func.now()),
+    # Serves per-user history newest-first and the keyset cursor below
+    Index("ix_mood_checkins_user_created", "user_id", "created_at", "id"),
 )
 
+def _mood_rollup_table(name):
+    return Table(
+        name,
+        metadata,
+        Column("user_id", Integer, primary_key=True),
+        Column("bucket_start", Date, primary_key=True),
+        Column("checkin_count", Integer, nullable=False),
+        Column("mood_sum", Integer, nullable=False),
+        Column("mood_min", Integer, nullable=False),
+        Column("mood_max", Integer, nullable=False),
+        Column("last_note_at", DateTime(timezone=True)),
+    )
+
+
+# Per-user aggregates of mood_checkins, kept current as check-ins are written
+mood_daily_rollups_table = _mood_rollup_table("mood_daily_rollups")
+mood_weekly_rollups_table = _mood_rollup_table("mood_weekly_rollups")
+mood_rollups = MoodRollups(mood_daily_rollups_table, mood_weekly_rollups_table)
+# Rollups are updated in the same transaction as the check-ins they summarize
+write_queue.add_insert_hook(mood_checkins_table, mood_rollups.apply)
+
 journal_entries_table = Table(
     "journal_entries",
     metadata,
@@ -69,37 +270,178 @@ journal_entries_table = Table(
     Column("title", String(200)),
     Column("content", Text, nullable=False),
     Column("created_at", DateTime(timezone=True), server_default=func.now()),
+    # Filled in offline by the tag-journal-emotions command
+    Column("emotion", String(20)),
+    Column("emotion_score", Float),
+    Index("ix_journal_entries_user_created", "user_id", "created_at", "id"),
 )
 
-CRISIS_KEYWORDS = {
-    "suicide",
-    "kill myself",
-    "end my life",
-    "self harm",
-    "self-harm",
-    "hurt myself",
-    "can't go on",
-    "cant go on",
-}
+crisis_detector = CrisisDetector.from_file(os.getenv("CRISIS_PHRASES_PATH", DEFAULT_PHRASES_PATH))
+
+def load_emotion_classifier():
+    return create_backend(os.getenv("EMOTION_BACKEND", "transformers"))
+
+
+# Parsed into a PromptTemplate once per process by chat_prompt_template()
+CHAT_PROMPT_VARIABLES = ["emotion", "message", "summary", "context", "memories", "length_guidance", "depth"]
+CHAT_PROMPT = """
+            You are a compassionate and emotionally intelligent mental health support chatbot.
+
+Your tone should be warm, natural, and sincere—like a trusted friend who truly listens without judgment. 
+Be gentle and emotionally present. Respond in a conversational, human way that doesn’t sound robotic or rehearsed.
+
+Emotion detected: {emotion}
+Summary of earlier conversation: {summary}
+Recent conversation: {context}
+Things they've shared before that may be relevant: {memories}
+Conversation depth: {depth}
+
+User: {message}
+
+{length_guidance}
+
+Your job:
+- Start by validating what they’re feeling in a real, personal way.
+- Don’t overanalyze. Just *be there* with them.
+- Sound human. Use contractions (“I’m”, “you’re”, “it’s”, etc).
+- Avoid clichés—be specific and emotionally grounded.
+- Offer one clear, gentle suggestion if appropriate, but don’t force solutions.
+- End with a caring, open-ended follow-up or gentle question to keep the door open. But dont be blunt if he wants to stop convo then give a comforting endingss
+If the user seems like they’re wrapping up or feeling calmer, respond without pushing another question
+
+Keep it supportive, short-to-medium length, and sincere.
+If the user seems done or at peace, let the conversation soften to a natural close.
+Respond:"""
+
+
+def create_emotion_cache():
+    shared = None
+    redis_url = os.getenv("EMOTION_CACHE_REDIS_URL")
+    ttl_seconds = int(os.getenv("EMOTION_CACHE_TTL_SECONDS", "600"))
+    if redis_url:
+        try:
+            shared = RedisLabelStore(redis_url, ttl_seconds)
+        except ImportError:
+            logger.warning("EMOTION_CACHE_REDIS_URL is set but the redis package is not installed")
+    return EmotionCache(
+        max_entries=int(os.getenv("EMOTION_CACHE_MAX_ENTRIES", "10000")),
+        ttl_seconds=ttl_seconds,
+        max_chars=int(os.getenv("EMOTION_CACHE_MAX_CHARS", "200")),
+        shared=shared,
+        on_lookup=lambda tier, hit: EMOTION_CACHE_LOOKUPS.inc(tier=tier, result="hit" if hit else "miss"),
+    )
+
+
+@functools.lru_cache(maxsize=1)
+def chat_prompt_template():
+    """The chat PromptTemplate, parsed once per process instead of on every turn"""
+    from langchain.prompts import PromptTemplate
+
+    return PromptTemplate(
+        input_variables=CHAT_PROMPT_VARIABLES,
+        template=CHAT_PROMPT,
+    )
+
+
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "20"))
+
+
+def load_llm():
+    from langchain_groq import ChatGroq
+
+    http_client, http_async_client = http_clients(
+        timeout=LLM_TIMEOUT_SECONDS,
+        connect_timeout=float(os.getenv("LLM_CONNECT_TIMEOUT_SECONDS", "3")),
+        max_connections=int(os.getenv("LLM_MAX_CONNECTIONS", "100")),
+    )
+    llm = ChatGroq(
+        temperature=0.7,
+        groq_api_key=os.getenv("GROQ_API_KEY", ""),
+        groq_api_base=os.getenv("GROQ_BASE_URL") or None,
+        model_name="llama-3.3-70b-versatile",
+        request_timeout=LLM_TIMEOUT_SECONDS,
+        # Retries are the gateway's job, within the call's deadline
+        max_retries=0,
+        http_client=http_client,
+        http_async_client=http_async_client,
+    )
+    return LLMGateway(
+        llm,
+        timeout=LLM_TIMEOUT_SECONDS,
+        max_retries=int(os.getenv("LLM_MAX_RETRIES", "2")),
+        backoff_base=float(os.getenv("LLM_RETRY_BACKOFF_MS", "200")) / 1000.0,
+        hedge=os.getenv("LLM_HEDGE_ENABLED", "false").lower() == "true",
+        hedge_min_delay=float(os.getenv("LLM_HEDGE_MIN_DELAY_MS", "500")) / 1000.0,
+        breaker=CircuitBreaker(
+            failure_threshold=int(os.getenv("LLM_BREAKER_FAILURES", "5")),
+            reset_seconds=float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30")),
+        ),
+    )
+
+
+def llm_failure_reason(error: BaseException) -> str:
+    """Label for the fallback metric"""
+    if isinstance(error, CircuitOpen):
+        return "circuit_open"
+    if isinstance(error, DeadlineExceeded):
+        return "timeout"
+    return "llm_error"
+
+
+RETRIEVAL_ENABLED = os.getenv("RETRIEVAL_ENABLED", "true").lower() == "true"
+
+
+def create_retriever():
+    max_distance = os.getenv("RETRIEVAL_MAX_DISTANCE")
+    return Retriever(
+        lambda: create_embedder(os.getenv("RETRIEVAL_EMBEDDER", "sentence_transformers")),
+        lambda: create_index(os.getenv("RETRIEVAL_INDEX", "chroma")),
+        top_k=int(os.getenv("RETRIEVAL_TOP_K", "3")),
+        max_chars=int(os.getenv("RETRIEVAL_MAX_CHARS", "600")),
+        max_distance=float(max_distance) if max_distance else None,
+        query_timeout=float(os.getenv("RETRIEVAL_TIMEOUT_MS", "50")) / 1000.0,
+    )
+
 
 class AdvancedMentalHealthChatbot:
     def __init__(self):
-        # Emotion Detection
-        self.emotion_classifier = pipeline(
-            "text-classification", 
-            model="j-hartmann/emotion-english-distilroberta-base", 
-            return_all_scores=True
+        # Emotion Detection (loaded on first use or by load_models)
+        self._emotion_classifier = LazyResource("emotion_model", load_emotion_classifier)
+        # Concurrent requests share classifier passes through a micro-batcher
+        self.emotion_batcher = MicroBatcher(
+            self._classify_batch,
+            max_batch_size=int(os.getenv("EMOTION_BATCH_MAX_SIZE", "16")),
+            window_ms=float(os.getenv("EMOTION_BATCH_WINDOW_MS", "5")),
+            max_queue_size=int(os.getenv("EMOTION_BATCH_QUEUE_SIZE", "1024")),
+            name="emotion",
         )
         
+        # Labels of repeated short messages, checked before the classifier
+        self.emotion_cache = create_emotion_cache()
+
         # LLM Initialization
-        self.llm = ChatGroq(
-            temperature=0.7,
-            groq_api_key=os.getenv("GROQ_API_KEY", ""),
-            model_name="llama-3.3-70b-versatile"
+        self._llm = LazyResource("llm_client", load_llm)
+
+        # Older turns are folded into a rolling summary in the background
+        self.compactor = Compactor(
+            self._summarize,
+            self._load_turns,
+            self._apply_summary,
+            keep_turns=SUMMARY_KEEP_TURNS,
+            every_turns=SUMMARY_EVERY_TURNS,
         )
+
+        # Semantic recall over the user's journal and earlier messages (optional)
+        self.retriever = create_retriever() if RETRIEVAL_ENABLED else None
         
-        # Store conversation contexts for each user
-        self.user_conversations = {}
+        # Bounded per-worker cache of conversation contexts; evicted contexts are
+        # written back to the database and reloaded on the next miss
+        self.user_conversations = ContextCache(
+            max_entries=int(os.getenv("CONTEXT_CACHE_MAX_ENTRIES", "1000")),
+            ttl_seconds=float(os.getenv("CONTEXT_CACHE_TTL_SECONDS", "1800")),
+            max_bytes=int(os.getenv("CONTEXT_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+        )
+        context_store.subscribe(self._on_context_changed, self.user_conversations.clear)
         
         # Predefined Emotion Response Templates
         self.emotion_responses = {
@@ -125,107 +467,353 @@ class AdvancedMentalHealthChatbot:
             ]
         }
     
+    @property
+    def emotion_classifier(self):
+        return self._emotion_classifier.get()
+
+    @property
+    def llm(self):
+        return self._llm.get()
+
+    def load_models(self):
+        """Load every model up front instead of on the first request"""
+        self._emotion_classifier.load()
+        self._llm.load()
+        if self.retriever:
+            # Retrieval is optional; chat works without it if the model can't load
+            try:
+                self.retriever.load()
+            except Exception as e:
+                logger.warning("Retrieval disabled, embedding model failed to load: %s", e)
+
+    def load_models_in_background(self):
+        self._emotion_classifier.load_in_background()
+        self._llm.load_in_background()
+        if self.retriever:
+            self.retriever.load_in_background()
+
+    @property
+    def models_ready(self) -> bool:
+        return self._emotion_classifier.loaded and self._llm.loaded
+
+    def llm_gateway_stats(self):
+        if not self._llm.loaded or not isinstance(self.llm, LLMGateway):
+            return None
+        return self.llm.stats()
+
+    def model_status(self) -> Dict:
+        return {
+            'emotion_model': self._emotion_classifier.status(),
+            'llm_client': self._llm.status(),
+            **(self.retriever.status() if self.retriever else {}),
+        }
+
+    @STAGE_SECONDS.timed(stage="context_load")
     def get_user_context(self, user_id):
         """Get or create a conversation context for a specific user"""
-        if user_id not in self.user_conversations:
-            self.user_conversations[user_id] = {
-                'emotional_history': [],
-                'current_emotion': None,
-                'conversation_depth': 0,
-                'last_topic': None
-            }
-            
-            # Try to load from database if exists
+        context = self.user_conversations.get(user_id)
+        if context is not None and self._is_stale(user_id, context):
+            context = None
+        if context is None:
+            context = ConversationContext()
             try:
-                db_session = SessionLocal()
-                result = db_session.execute(
-                    select(user_chat_history_table.c.chat_history)
-                    .where(user_chat_history_table.c.user_id == user_id)
-                ).fetchone()
-                db_session.close()
-                
-                if result and result[0]:
-                    # Load saved history from database
-                    history_data = json.loads(result[0])
-                    self.user_conversations[user_id] = history_data
+                # Make sure this worker's queued writes for the user land before reading them back.
+                # If they are stuck, read what is stored: those writes are compare-and-swap, so
+                # a turn built on the older copy is rebased rather than lost.
+                if not persist_executor.wait(user_id, timeout=WRITE_SYNC_TIMEOUT):
+                    logger.warning("Queued writes for user %s still pending after %ss", user_id, WRITE_SYNC_TIMEOUT)
+                    ERRORS.inc(where="context_load_wait")
+                context = context_store.load(user_id) or context
             except Exception as e:
-                print(f"Error loading chat history for user {user_id}: {e}")
-                
-        return self.user_conversations[user_id]
-        
-    def save_user_context(self, user_id, context):
-        """Save a user's conversation context to the database"""
+                logger.exception("Error loading chat history for user %s", user_id)
+                ERRORS.inc(where="context_load")
+
+            self.user_conversations.put(user_id, context)
+
+        return context
+
+    def _is_stale(self, user_id, context) -> bool:
+        """Whether another worker has written this user's context since it was cached"""
+        if context_store.push_invalidation or not CONTEXT_VERSION_CHECK:
+            return False
+        # Our own write is still queued, so the versions can't be compared yet;
+        # if another worker wrote too, that write's CAS fails and is rebased
+        if persist_executor.pending(user_id):
+            return False
         try:
-            db_session = SessionLocal()
-            context_json = json.dumps(context)
-            existing = db_session.execute(
-                select(user_chat_history_table.c.user_id)
-                .where(user_chat_history_table.c.user_id == user_id)
-            ).fetchone()
-            if existing:
-                db_session.execute(
-                    user_chat_history_table.update()
-                    .where(user_chat_history_table.c.user_id == user_id)
-                    .values(chat_history=context_json, last_updated=func.now())
-                )
-            else:
-                db_session.execute(
-                    user_chat_history_table.insert()
-                    .values(user_id=user_id, chat_history=context_json)
+            return context_store.version(user_id) != context.version
+        except Exception as e:
+            logger.warning("Context version check failed for user %s: %s", user_id, e)
+            return False
+
+    def _on_context_changed(self, user_id, version):
+        """Another worker wrote this user's context; drop an older cached copy"""
+        context = self.user_conversations.get(user_id)
+        if context is not None and context.version < version:
+            self.user_conversations.pop(user_id)
+
+    @staticmethod
+    def _apply_turn(context: ConversationContext, user_message: str, emotion: str) -> int:
+        """Add a turn to the context, keeping only the recent window in memory; returns its seq"""
+        context.emotional_history.append(user_message)
+        del context.emotional_history[:-CHAT_HISTORY_WINDOW]
+        context.conversation_depth += 1
+        context.current_emotion = emotion
+        context.last_seq += 1
+        return context.last_seq
+
+    @staticmethod
+    def _fold_summary(context: ConversationContext, summary: str, upto_seq: int):
+        """Take a new rolling summary and drop the messages it now covers"""
+        context.summary = summary
+        context.summarized_seq = upto_seq
+        history = context.emotional_history
+        del history[:max(0, len(history) - (context.last_seq - upto_seq))]
+
+    def _store_turn(self, user_id, context, snapshot, user_message, emotion):
+        """Compare-and-swap the turn's state; returns (its seq, the user's current context)
+
+        ``snapshot`` is ``context`` as of this turn and is written if the store is
+        still at the version this worker last saw. Otherwise another worker wrote
+        in between, and the turn is applied again on top of what it wrote.
+        """
+        for attempt in range(CONTEXT_CAS_ATTEMPTS):
+            if (context.summarized_seq or 0) > (snapshot.summarized_seq or 0):
+                # A summary stored after this turn was taken must not be undone
+                self._fold_summary(snapshot, context.summary, context.summarized_seq)
+            try:
+                version = context_store.compare_and_set(user_id, snapshot, context.version)
+            except VersionConflict:
+                logger.info("Context for user %s changed elsewhere, re-applying turn", user_id)
+                context = context_store.load(user_id) or ConversationContext()
+                self._apply_turn(context, user_message, emotion)
+                self.user_conversations.put(user_id, context)
+                snapshot = context.copy()
+                continue
+            context.version = version
+            return snapshot.last_seq, context
+        raise VersionConflict(f"gave up saving the context for user {user_id} after {CONTEXT_CAS_ATTEMPTS} attempts")
+
+    @STAGE_SECONDS.timed(stage="save")
+    def persist_turn(self, user_id, context, snapshot, user_message, response, emotion):
+        """Write one turn and do the follow-up work that doesn't affect the reply"""
+        try:
+            seq, context = self._store_turn(user_id, context, snapshot, user_message, emotion)
+            write_queue.insert(chat_messages_table, {
+                'user_id': user_id,
+                'seq': seq,
+                'message': user_message,
+                'response': response,
+                'emotion': emotion,
+            })
+        except Exception as e:
+            logger.exception("Error saving chat history for user %s", user_id)
+            ERRORS.inc(where="context_save")
+        # Re-measure the entry now that its history has grown
+        self.user_conversations.put(user_id, context)
+        if self.retriever:
+            self.retriever.add(user_id, user_message, 'chat')
+        self.compactor.maybe_schedule(user_id, context)
+
+    def _summarize(self, previous, turns) -> str:
+        if SUMMARY_BACKEND == "llm":
+            try:
+                return llm_summary(self.llm, previous, turns, SUMMARY_MAX_CHARS)
+            except Exception as e:
+                logger.warning("LLM summary failed, using extractive summary: %s", e)
+        return extractive_summary(previous, turns, SUMMARY_MAX_CHARS)
+
+    def _load_turns(self, user_id, after_seq, upto_seq):
+        # The newest of these may still be queued
+        write_queue.flush()
+        with engine.connect() as conn:
+            rows = conn.execute(
+                select(chat_messages_table.c.message, chat_messages_table.c.response)
+                .where(
+                    chat_messages_table.c.user_id == user_id,
+                    chat_messages_table.c.seq > after_seq,
+                    chat_messages_table.c.seq <= upto_seq,
                 )
-            db_session.commit()
-            db_session.close()
+                .order_by(chat_messages_table.c.seq)
+            ).fetchall()
+        return [(row.message, row.response) for row in rows]
+
+    def _apply_summary(self, user_id, summary, upto_seq):
+        """Store a new rolling summary, in order with the user's turns"""
+        persist_executor.submit(user_id, self._store_summary, user_id, summary, upto_seq).result(
+            timeout=WRITE_SYNC_TIMEOUT
+        )
+
+    def _store_summary(self, user_id, summary, upto_seq):
+        context = self.user_conversations.get(user_id) or context_store.load(user_id)
+        for attempt in range(CONTEXT_CAS_ATTEMPTS):
+            if context is None or (context.summarized_seq or 0) >= upto_seq:
+                return
+            snapshot = context.copy()
+            self._fold_summary(snapshot, summary, upto_seq)
+            try:
+                version = context_store.compare_and_set(user_id, snapshot, context.version)
+            except VersionConflict:
+                context = context_store.load(user_id)
+                if context is not None:
+                    self.user_conversations.put(user_id, context)
+                continue
+            self._fold_summary(context, summary, upto_seq)
+            context.version = version
+            self.user_conversations.put(user_id, context)
+            return
+        logger.warning("Gave up storing a summary for user %s after %d attempts", user_id, CONTEXT_CAS_ATTEMPTS)
+
+    @staticmethod
+    def recent_messages(context: ConversationContext) -> list:
+        """Messages not yet in the rolling summary, capped so the prompt stays a bounded size"""
+        unsummarized = context['last_seq'] - (context.get('summarized_seq') or 0)
+        count = min(max(unsummarized, SUMMARY_KEEP_TURNS), SUMMARY_KEEP_TURNS + SUMMARY_EVERY_TURNS)
+        return context['emotional_history'][-count:]
+
+    def _classify_batch(self, messages):
+        """Run a batch of messages through the emotion classifier in one pass"""
+        return self.emotion_classifier.classify(messages)
+
+    @staticmethod
+    def map_emotion_scores(emotions) -> str:
+        """Collapse classifier scores into one of the emotions we have responses for"""
+        emotion_map = {e['label']: e['score'] for e in emotions}
+        primary_emotion = max(emotion_map, key=emotion_map.get)
+        
+        emotion_mapping = {
+            'anger': 'anger',
+            'sadness': 'sadness',
+            'joy': 'joy',
+            'love': 'joy',
+            'surprise': 'neutral',
+            'fear': 'sadness',
+            'disgust': 'anger'
+        }
+        
+        return emotion_mapping.get(primary_emotion, 'neutral')
+
+    def _cached_emotion(self, message: str):
+        """(cache key, cached label or None) for a message"""
+        key = self.emotion_cache.key_for(message)
+        return key, (self.emotion_cache.get(key) if key is not None else None)
+
+    def _start_classification(self, message: str) -> Future:
+        """Queue a message on the micro-batcher without waiting for it"""
+        try:
+            return self.emotion_batcher.submit_async(message)
         except Exception as e:
-            print(f"Error saving chat history for user {user_id}: {e}")
-    
+            future = Future()
+            future.set_exception(e)
+            return future
+
+    def _emotion_from_batch(self, key, pending: Future) -> str:
+        try:
+            label = self.map_emotion_scores(pending.result())
+        except Exception as e:
+            logger.exception("Emotion detection error")
+            ERRORS.inc(where="emotion")
+            return 'neutral'
+        if key is not None:
+            self.emotion_cache.put(key, label)
+        return label
+
+    @STAGE_SECONDS.timed(stage="emotion")
     def detect_emotion(self, message: str) -> str:
         """Detect primary emotion in the message"""
+        key, label = self._cached_emotion(message)
+        if label is not None:
+            return label
+        return self._emotion_from_batch(key, self._start_classification(message))
+
+    @STAGE_SECONDS.timed(stage="emotion")
+    async def adetect_emotion(self, message: str) -> str:
+        """Async detect_emotion; waits on the micro-batcher without holding a thread"""
+        cache = self.emotion_cache
+        key = cache.key_for(message)
+        loop = asyncio.get_running_loop()
+        if key is not None:
+            label = cache.get_local(key)
+            if label is None and cache.shared is not None:
+                # The shared tier is a network round trip; keep it off the event loop
+                label = await loop.run_in_executor(None, cache.get_shared, key)
+            if label is not None:
+                return label
         try:
-            emotions = self.emotion_classifier(message)[0]
-            emotion_map = {e['label']: e['score'] for e in emotions}
-            primary_emotion = max(emotion_map, key=emotion_map.get)
-            
-            emotion_mapping = {
-                'anger': 'anger',
-                'sadness': 'sadness',
-                'joy': 'joy',
-                'love': 'joy',
-                'surprise': 'neutral',
-                'fear': 'sadness',
-                'disgust': 'anger'
-            }
-            
-            return emotion_mapping.get(primary_emotion, 'neutral')
+            emotions = await asyncio.wrap_future(self.emotion_batcher.submit_async(message))
+            label = self.map_emotion_scores(emotions)
         except Exception as e:
-            print(f"Emotion detection error: {e}")
+            logger.exception("Emotion detection error")
+            ERRORS.inc(where="emotion")
             return 'neutral'
+        if key is not None:
+            if cache.shared is not None:
+                loop.run_in_executor(None, cache.put, key, label)
+            else:
+                cache.put(key, label)
+        return label
     
-    def generate_contextual_response(self, user_id: int, user_message: str) -> Dict:
-        """Generate a contextually aware and empathetic response for a specific user"""
-        normalized_message = user_message.lower()
-        if any(keyword in normalized_message for keyword in CRISIS_KEYWORDS):
-            return {
-                'response': (
-                    "I'm really sorry you're feeling this way. You deserve support, and you don't have "
-                    "to go through this alone. If you're in immediate danger or thinking about harming "
-                    "yourself, please contact local emergency services right now. If you're in the U.S., "
-                    "you can call or text 988 for the Suicide & Crisis Lifeline. If you're elsewhere, I can "
-                    "help find a local crisis line."
-                ),
-                'emotion': 'sadness',
-                'interactive_options': [
-                    "Find local help",
-                    "I'm safe right now",
-                    "Talk to me"
-                ],
-                'crisis_resources': True
-            }
+    def crisis_response(self) -> Dict:
+        """Fixed safety response returned whenever crisis language is detected"""
+        return {
+            'response': (
+                "I'm really sorry you're feeling this way. You deserve support, and you don't have "
+                "to go through this alone. If you're in immediate danger or thinking about harming "
+                "yourself, please contact local emergency services right now. If you're in the U.S., "
+                "you can call or text 988 for the Suicide & Crisis Lifeline. If you're elsewhere, I can "
+                "help find a local crisis line."
+            ),
+            'emotion': 'sadness',
+            'interactive_options': [
+                "Find local help",
+                "I'm safe right now",
+                "Talk to me"
+            ],
+            'crisis_resources': True
+        }
+
+    def is_crisis_message(self, user_message: str) -> bool:
+        matched = crisis_detector.find(user_message)
+        if matched:
+            logger.info("Crisis phrases matched: %s", matched)
+            CRISIS_DETECTIONS.inc()
+        return bool(matched)
+
+    def fallback_response(self, emotion: str, reason: str = "llm_error") -> str:
+        FALLBACK_RESPONSES.inc(reason=reason)
+        return random.choice(
+            self.emotion_responses.get(emotion,
+            self.emotion_responses['neutral'])
+        )
+
+    @STAGE_SECONDS.timed(stage="retrieval")
+    def retrieve(self, user_id: int, user_message: str, context: ConversationContext):
+        """Earlier journal entries and messages related to this one, minus what the prompt already has"""
+        if not self.retriever:
+            return []
+        recent = self.recent_messages(context) + [user_message]
+        return self.retriever.search(user_id, user_message, exclude=recent)
+
+    def prepare_turn(self, user_id: int, user_message: str):
+        """Load the user's context, detect emotion and build the LLM prompt for one turn"""
+        key, current_emotion = self._cached_emotion(user_message)
+        # The classifier runs on the batcher thread while the context loads here
+        pending = None if current_emotion is not None else self._start_classification(user_message)
+
         # Get user-specific context
         context = self.get_user_context(user_id)
         
-        current_emotion = self.detect_emotion(user_message)
+        if pending is not None:
+            # Only the part of classification that didn't overlap the load is timed
+            with STAGE_SECONDS.time(stage="emotion"):
+                current_emotion = self._emotion_from_batch(key, pending)
         context['current_emotion'] = current_emotion
+        memories = self.retrieve(user_id, user_message, context)
         
+        return context, current_emotion, self.build_prompt(context, current_emotion, user_message, memories)
+
+    @STAGE_SECONDS.timed(stage="prompt")
+    def build_prompt(self, context: ConversationContext, current_emotion: str, user_message: str, memories=()) -> str:
         # Adjust response length based on conversation depth
         conversation_depth = context['conversation_depth']
         if conversation_depth < 3:
@@ -235,60 +823,31 @@ class AdvancedMentalHealthChatbot:
         else:
             length_guidance = "You can provide a more detailed response if needed(max 35 words), but remain focused and concise."
         
-        prompt_template = PromptTemplate(
-            input_variables=["emotion", "message", "context", "length_guidance", "depth"],
-            template="""
-            You are a compassionate and emotionally intelligent mental health support chatbot.
-
-Your tone should be warm, natural, and sincere—like a trusted friend who truly listens without judgment. 
-Be gentle and emotionally present. Respond in a conversational, human way that doesn’t sound robotic or rehearsed.
-
-Emotion detected: {emotion}
-Recent conversation: {context}
-Conversation depth: {depth}
-
-User: {message}
+        prompt_template = chat_prompt_template()
+        
+        context_history = " ".join(self.recent_messages(context))
+        
+        prompt = prompt_template.format(
+            emotion=current_emotion,
+            message=user_message,
+            summary=context.get('summary') or "None",
+            context=context_history,
+            memories=" | ".join(memories) if memories else "None",
+            length_guidance=length_guidance,
+            depth=conversation_depth
+        )
+        return prompt
 
-{length_guidance}
+    def complete_turn(self, user_id: int, context: ConversationContext, user_message: str, response: str, current_emotion: str) -> Dict:
+        """Record the turn in the user's context and build the response payload"""
+        self._apply_turn(context, user_message, current_emotion)
 
-Your job:
-- Start by validating what they’re feeling in a real, personal way.
-- Don’t overanalyze. Just *be there* with them.
-- Sound human. Use contractions (“I’m”, “you’re”, “it’s”, etc).
-- Avoid clichés—be specific and emotionally grounded.
-- Offer one clear, gentle suggestion if appropriate, but don’t force solutions.
-- End with a caring, open-ended follow-up or gentle question to keep the door open. But dont be blunt if he wants to stop convo then give a comforting endingss
-If the user seems like they’re wrapping up or feeling calmer, respond without pushing another question
-
-Keep it supportive, short-to-medium length, and sincere.
-If the user seems done or at peace, let the conversation soften to a natural close.
-Respond:"""
+        # The in-memory context is current now; writing it out happens after the
+        # reply is returned, in turn order for this user
+        persist_executor.submit(
+            user_id, self.persist_turn, user_id, context, context.copy(), user_message, response, current_emotion,
         )
         
-        context_history = " ".join(context['emotional_history'][-3:])
-        
-        try:
-            prompt = prompt_template.format(
-                emotion=current_emotion,
-                message=user_message,
-                context=context_history,
-                length_guidance=length_guidance,
-                depth=conversation_depth
-            )
-            response = self.llm.invoke(prompt).content
-        except Exception as e:
-            response = random.choice(
-                self.emotion_responses.get(current_emotion, 
-                self.emotion_responses['neutral'])
-            )
-        
-        # Update user context
-        context['emotional_history'].append(user_message)
-        context['conversation_depth'] += 1
-        
-        # Save updated context
-        self.save_user_context(user_id, context)
-        
         return {
             'response': response,
             'emotion': current_emotion,
@@ -299,6 +858,60 @@ Respond:"""
             ]
         }
 
+    def generate_contextual_response(self, user_id: int, user_message: str) -> Dict:
+        """Generate a contextually aware and empathetic response for a specific user"""
+        if self.is_crisis_message(user_message):
+            return self.crisis_response()
+
+        context, current_emotion, prompt = self.prepare_turn(user_id, user_message)
+        try:
+            with STAGE_SECONDS.time(stage="llm"):
+                response = self.llm.invoke(prompt).content
+        except Exception as e:
+            logger.warning("LLM call failed for user %s: %s", user_id, e)
+            response = self.fallback_response(current_emotion, reason=llm_failure_reason(e))
+        
+        return self.complete_turn(user_id, context, user_message, response, current_emotion)
+
+    def stream_contextual_response(self, user_id: int, user_message: str) -> Iterator[Tuple[str, Dict]]:
+        """Like generate_contextual_response, but yields (event, data) pairs as LLM tokens arrive.
+
+        The final ``done`` event carries the same payload as the non-streaming path;
+        the context is saved only after the stream has finished.
+        """
+        if self.is_crisis_message(user_message):
+            payload = self.crisis_response()
+            yield 'token', {'content': payload['response']}
+            yield 'done', payload
+            return
+
+        context, current_emotion, prompt = self.prepare_turn(user_id, user_message)
+        yield 'emotion', {'emotion': current_emotion}
+
+        chunks = []
+        started = time.perf_counter()
+        reason = "empty_stream"
+        try:
+            for chunk in self.llm.stream(prompt):
+                if chunk.content:
+                    if not chunks:
+                        LLM_FIRST_TOKEN_SECONDS.observe(time.perf_counter() - started)
+                    chunks.append(chunk.content)
+                    yield 'token', {'content': chunk.content}
+        except CircuitOpen as e:
+            reason = llm_failure_reason(e)
+        except Exception as e:
+            logger.exception("Streaming error for user %s", user_id)
+            ERRORS.inc(where="llm_stream")
+            reason = llm_failure_reason(e)
+        STAGE_SECONDS.observe(time.perf_counter() - started, stage="llm")
+        response = "".join(chunks)
+        if not response:
+            response = self.fallback_response(current_emotion, reason=reason)
+            yield 'token', {'content': response}
+
+        yield 'done', self.complete_turn(user_id, context, user_message, response, current_emotion)
+
 # Flask App Setup
 app = Flask(__name__)
 CORS(app)
@@ -313,8 +926,208 @@ chatbot = AdvancedMentalHealthChatbot()
 
 def init_db():
     metadata.create_all(engine)
+    # create_all skips tables that already exist, so add indexes introduced
+    # after those tables were first created
+    for table in metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
+    add_missing_columns()
+
+
+# Key for pg_advisory_xact_lock; every worker runs init_db at import, so schema changes are serialized
+SCHEMA_LOCK_KEY = 7041936
+
+
+def _missing_columns(conn):
+    inspector = inspect(conn)
+    missing = []
+    for table in metadata.sorted_tables:
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        missing.extend((table, column) for column in table.columns if column.name not in existing)
+    return missing
+
+
+def add_missing_columns():
+    """ALTER existing tables to add nullable columns defined after they were created.
+
+    On PostgreSQL the check and the ALTERs run under an advisory lock, so workers
+    starting together wait for the first one instead of racing it. Elsewhere, a
+    worker whose ALTER fails accepts the result if another process added the columns.
+    """
+    try:
+        with engine.begin() as conn:
+            if conn.dialect.name == 'postgresql':
+                conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {'key': SCHEMA_LOCK_KEY})
+            for table, column in _missing_columns(conn):
+                if not column.nullable:
+                    logger.warning("Cannot add NOT NULL column %s.%s automatically", table.name, column.name)
+                    continue
+                conn.exec_driver_sql(
+                    f"ALTER TABLE {table.name} ADD COLUMN {CreateColumn(column).compile(dialect=engine.dialect)}"
+                )
+                logger.info("Added column %s.%s", table.name, column.name)
+    except DBAPIError:
+        with engine.connect() as conn:
+            if any(column.nullable for _, column in _missing_columns(conn)):
+                raise
+        logger.info("Missing columns were added by another process")
+
+
+with timed_phase("db_init"):
+    init_db()
+
+if MODEL_LOAD_MODE == "preload":
+    chatbot.load_models()
+    # Keep the loaded objects out of future GC passes so forked workers don't
+    # touch (and un-share) their pages
+    gc.freeze()
+elif MODEL_LOAD_MODE == "background":
+    chatbot.load_models_in_background()
+
+
+def migrate_legacy_chat_history() -> int:
+    """Copy JSON chat_history blobs into chat_messages/chat_state; returns users migrated"""
+    migrated = 0
+    db_session = SessionLocal()
+    try:
+        legacy_rows = db_session.execute(
+            select(user_chat_history_table.c.user_id, user_chat_history_table.c.chat_history)
+        ).fetchall()
+        for row in legacy_rows:
+            already_migrated = db_session.execute(
+                select(chat_state_table.c.user_id)
+                .where(chat_state_table.c.user_id == row.user_id)
+            ).fetchone()
+            if already_migrated or not row.chat_history:
+                continue
+
+            legacy = decode_context(row.chat_history)
+            messages = legacy.emotional_history
+            if messages:
+                db_session.execute(
+                    chat_messages_table.insert(),
+                    [
+                        {'user_id': row.user_id, 'seq': seq, 'message': message}
+                        for seq, message in enumerate(messages, start=1)
+                    ],
+                )
+            db_session.execute(
+                chat_state_table.insert().values(
+                    user_id=row.user_id,
+                    current_emotion=legacy.current_emotion,
+                    conversation_depth=legacy.conversation_depth,
+                    last_topic=legacy.last_topic,
+                    last_seq=len(messages),
+                )
+            )
+            db_session.commit()
+            migrated += 1
+    finally:
+        db_session.close()
+    return migrated
+
+
+@app.cli.command("backfill-mood-rollups")
+def backfill_mood_rollups_command():
+    """Rebuild daily and weekly mood rollups from all existing check-ins.
+
+    Outside PostgreSQL, stop check-in writes while this runs.
+    """
+    write_queue.flush()
+    with engine.begin() as conn:
+        seen = mood_rollups.backfill(conn, mood_checkins_table)
+    print(f"Rebuilt mood rollups from {seen} check-ins.")
+
+
+@app.cli.command("index-retrieval")
+@click.option("--batch-size", default=256, show_default=True, help="Documents embedded per batch.")
+def index_retrieval_command(batch_size):
+    """Embed existing journal entries and chat messages into the retrieval index."""
+    if not chatbot.retriever:
+        raise click.ClickException("Retrieval is disabled (RETRIEVAL_ENABLED=false).")
+    chatbot.retriever.load()
+    seen = added = 0
+    with engine.connect() as conn:
+        sources = (
+            (select(journal_entries_table.c.user_id, journal_entries_table.c.title, journal_entries_table.c.content),
+             lambda row: (row.user_id, f"{row.title}: {row.content}" if row.title else row.content, 'journal')),
+            (select(chat_messages_table.c.user_id, chat_messages_table.c.message),
+             lambda row: (row.user_id, row.message, 'chat')),
+        )
+        for query, to_item in sources:
+            result = conn.execution_options(stream_results=True, yield_per=batch_size).execute(query)
+            for partition in result.partitions():
+                seen += len(partition)
+                added += chatbot.retriever.index_many([to_item(row) for row in partition])
+    print(f"Indexed {added} of {seen} documents (the rest were already indexed).")
+
+
+@app.cli.command("export-data")
+@click.option("--output", default="-", show_default=True, help="File to write, or - for stdout.")
+@click.option("--format", "fmt", type=click.Choice(sorted(EXPORT_FORMATS)), default="ndjson", show_default=True)
+@click.option("--user-id", type=int, default=None, help="Export one user instead of everyone.")
+@click.option("--batch-size", default=None, type=int, help="Rows fetched per round trip (default EXPORT_BATCH_SIZE).")
+def export_data_command(output, fmt, user_id, batch_size):
+    """Stream chat history, mood check-ins and journal entries for all users (or one) to a file."""
+    write_queue.flush()
+    with click.open_file(output, "w", encoding="utf-8") as out:
+        for chunk in export_chunks(engine, EXPORT_SOURCES, fmt, user_id, batch_size or EXPORT_BATCH_SIZE):
+            out.write(chunk)
+
+
+@app.cli.command("tag-journal-emotions")
+@click.option("--workers", default=2, show_default=True, help="Classifier processes, each with its own model copy (0 runs inline).")
+@click.option("--threads-per-worker", default=1, show_default=True, help="Torch threads per process.")
+@click.option("--batch-size", default=64, show_default=True, help="Entries per classifier pass.")
+@click.option("--chunk-size", default=1000, show_default=True, help="Entries read and written back per round.")
+@click.option("--checkpoint", "checkpoint_path", default="data/tag-journal-emotions.json", show_default=True,
+              help="Progress file used to resume an interrupted run.")
+@click.option("--reset", is_flag=True, help="Ignore the checkpoint and scan from the first entry.")
+@click.option("--limit", default=None, type=int, help="Stop after this many entries.")
+@click.option("--backend", default=lambda: os.getenv("EMOTION_BACKEND", "transformers"), show_default="EMOTION_BACKEND")
+@click.option("--nice", default=10, show_default=True, help="Niceness for the worker processes.")
+def tag_journal_emotions_command(workers, threads_per_worker, batch_size, chunk_size, checkpoint_path, reset, limit,
+                                 backend, nice):
+    """Label untagged journal entries with an emotion and score, in batches across a process pool."""
+    if reset and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    checkpoint = Checkpoint(checkpoint_path)
+    tagger = JournalTagger(
+        engine, journal_entries_table, AdvancedMentalHealthChatbot.map_emotion_scores,
+        backend=backend, workers=workers, threads_per_worker=threads_per_worker, nice=nice,
+        chunk_size=chunk_size, batch_size=batch_size,
+    )
+    tagged = tagger.run(checkpoint, limit=limit)
+    print(f"Tagged {tagged} journal entries ({checkpoint.tagged} in total, last id {checkpoint.last_id}).")
+
+
+@app.cli.command("migrate-chat-history")
+def migrate_chat_history_command():
+    """One-shot migration of legacy JSON chat history into the append-only message table."""
+    migrated = migrate_legacy_chat_history()
+    print(f"Migrated chat history for {migrated} users.")
+
+@app.cli.command("export-emotion-onnx")
+@click.option("--output", default=lambda: os.getenv("EMOTION_ONNX_DIR", "models/emotion-onnx"), show_default="EMOTION_ONNX_DIR or models/emotion-onnx")
+@click.option("--no-quantize", is_flag=True, help="Skip int8 dynamic quantization.")
+def export_emotion_onnx_command(output, no_quantize):
+    """Export the emotion classifier to ONNX (int8-quantized by default)."""
+    path = export_onnx(output, quantize=not no_quantize)
+    print(f"Exported emotion model to {path}")
+
+
+@app.cli.command("check-emotion-parity")
+@click.option("--backend", default="onnx", show_default=True, help="Backend to compare against the PyTorch pipeline.")
+@click.option("--samples", "samples_path", default=None, help="File with one sample message per line.")
+@click.option("--min-agreement", default=1.0, show_default=True, help="Minimum fraction of matching top labels.")
+def check_emotion_parity_command(backend, samples_path, min_agreement):
+    """Check that an alternative emotion backend gives the same labels as PyTorch."""
+    samples = load_samples(samples_path) if samples_path else load_samples()
+    report = parity_check(create_backend("transformers"), create_backend(backend), samples)
+    print(json.dumps(report, indent=2))
+    if report['label_agreement'] < min_agreement:
+        raise SystemExit(1)
 
-init_db()
 
 @app.route('/')
 def home():
@@ -326,6 +1139,58 @@ def home():
     ]
     return render_template("home.html", quotes=quotes)
 
+# Password KDF work runs in a small process pool so login bursts don't tie up
+# the threads serving chat; stored hashes made with other parameters are
+# upgraded on the next successful login
+password_hasher = PasswordHasher(
+    method=os.getenv("PASSWORD_HASH_METHOD", "scrypt:32768:8:1"),
+    workers=int(os.getenv("AUTH_HASH_WORKERS", "2")),
+    max_pending=int(os.getenv("AUTH_HASH_MAX_PENDING", "32")),
+    timeout=float(os.getenv("AUTH_HASH_TIMEOUT", "10")),
+)
+
+
+def load_login_user(username):
+    db_session = SessionLocal()
+    try:
+        user = db_session.execute(
+            select(users_table.c.id, users_table.c.username, users_table.c.password)
+            .where(users_table.c.username == username)
+        ).fetchone()
+    finally:
+        db_session.close()
+    return dict(user._mapping) if user else None
+
+
+user_lookup = UserLookupCache(
+    load_login_user,
+    ttl_seconds=float(os.getenv("AUTH_USER_CACHE_TTL_SECONDS", "60")),
+    negative_ttl_seconds=float(os.getenv("AUTH_USER_CACHE_NEGATIVE_TTL_SECONDS", "5")),
+    max_entries=int(os.getenv("AUTH_USER_CACHE_MAX_ENTRIES", "10000")),
+)
+
+
+def auth_busy_response(template):
+    flash('Too many sign-ins right now, please try again in a moment.', 'error')
+    return render_template(template), 503, {'Retry-After': '1'}
+
+
+def rehash_password(user, password):
+    """Re-hash with the current parameters after a successful login"""
+    new_hash = password_hasher.hash(password)
+    db_session = SessionLocal()
+    try:
+        db_session.execute(
+            users_table.update()
+            .where(users_table.c.id == user['id'], users_table.c.password == user['password'])
+            .values(password=new_hash)
+        )
+        db_session.commit()
+    finally:
+        db_session.close()
+    user_lookup.put(user['username'], {**user, 'password': new_hash})
+
+
 @app.route('/signup', methods=['GET', 'POST'])
 def signup():
     if request.method == 'POST':
@@ -338,7 +1203,10 @@ def signup():
             flash("Passwords don't match!", 'error')
             return redirect(url_for('signup'))
 
-        hashed_password = generate_password_hash(password)
+        try:
+            hashed_password = password_hasher.hash(password)
+        except AuthBusy:
+            return auth_busy_response('signup.html')
 
         db_session = SessionLocal()
         try:
@@ -350,6 +1218,8 @@ def signup():
                 )
             )
             db_session.commit()
+            # Drop a cached "no such user" from a failed login before signup
+            user_lookup.invalidate(username)
             flash('Account created! Please log in.', 'success')
             return redirect(url_for('login'))
         except IntegrityError:
@@ -366,16 +1236,21 @@ def login():
         username = request.form['username']
         password = request.form['password']
 
-        db_session = SessionLocal()
-        user = db_session.execute(
-            select(users_table)
-            .where(users_table.c.username == username)
-        ).fetchone()
-        db_session.close()
+        user = user_lookup.get(username)
+        try:
+            valid = user is not None and password_hasher.verify(user['password'], password)
+            if valid and password_hasher.needs_rehash(user['password']):
+                try:
+                    rehash_password(user, password)
+                except Exception as e:
+                    # The old hash still works; try again next login
+                    logger.warning("Password rehash failed for user %s: %s", user['id'], e)
+        except AuthBusy:
+            return auth_busy_response('login.html')
 
-        if user and check_password_hash(user.password, password):
-            session['user_id'] = user.id
-            session['username'] = user.username
+        if valid:
+            session['user_id'] = user['id']
+            session['username'] = user['username']
             flash('Logged in successfully!', 'success')
             return redirect(url_for('chat'))
         else:
@@ -390,6 +1265,45 @@ def logout():
     flash('You have been logged out.', 'info')
     return redirect(url_for('login'))
 
+def create_admission():
+    store = None
+    redis_url = os.getenv("ADMISSION_REDIS_URL")
+    if redis_url:
+        try:
+            store = RedisBucketStore(redis_url)
+        except ImportError:
+            logger.warning("ADMISSION_REDIS_URL is set but the redis package is not installed")
+    return AdmissionController(
+        store=store or LocalBucketStore(),
+        user_rate=float(os.getenv("CHAT_USER_RATE_PER_MINUTE", "20")) / 60.0,
+        user_burst=float(os.getenv("CHAT_USER_BURST", "10")),
+        ip_rate=float(os.getenv("CHAT_IP_RATE_PER_MINUTE", "60")) / 60.0,
+        ip_burst=float(os.getenv("CHAT_IP_BURST", "30")),
+        max_inflight=int(os.getenv("CHAT_MAX_INFLIGHT", "32")),
+    )
+
+
+# Rate limits and an in-flight cap for chat turns, checked before any model work
+admission = create_admission()
+
+
+def admit_chat_turn(user_id, user_message, ip) -> Decision:
+    """Admission decision for one chat turn; crisis messages are always let through"""
+    # matches() rather than is_crisis_message(): the response path counts and logs the detection
+    if crisis_detector.matches(user_message):
+        return Decision(True)
+    decision = admission.admit(user_id, ip)
+    if not decision.allowed:
+        ADMISSION_REJECTIONS.inc(reason=decision.reason)
+    return decision
+
+
+def admission_rejected_body(decision: Decision) -> Dict:
+    if decision.status == 429:
+        return {'error': "You're sending messages faster than I can keep up. Please wait a moment."}
+    return {'error': 'Server is busy, please try again shortly'}
+
+
 @app.route('/chat', methods=['GET', 'POST'])
 def chat():
     if 'user_id' not in session:
@@ -410,12 +1324,17 @@ def chat():
             
         user_message = data['message']
         user_id = session['user_id']
-        
+
+        decision = admit_chat_turn(user_id, user_message, request.remote_addr)
+        if not decision.allowed:
+            return jsonify(admission_rejected_body(decision)), decision.status, {'Retry-After': decision.retry_after_header}
+
         try:
             response = chatbot.generate_contextual_response(user_id, user_message)
             return jsonify(response)
         except Exception as e:
-            print(f"Error processing message: {e}")
+            logger.exception("Error processing message")
+            ERRORS.inc(where="chat")
             return jsonify({
                 'response': "I'm here for you. Let's try again.",
                 'interactive_options': [
@@ -424,13 +1343,144 @@ def chat():
                     "Get support"
                 ]
             }), 500
+        finally:
+            decision.release()
+
+
+def format_sse(event: str, data: Dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
 
-@app.route('/checkin', methods=['POST'])
+@app.route('/chat/stream', methods=['POST'])
+def chat_stream():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Authentication required'}), 401
+
+    if not request.is_json:
+        return jsonify({'error': 'Content-Type must be application/json'}), 415
+
+    data = request.get_json()
+    if not data or 'message' not in data:
+        return jsonify({'error': 'Invalid request format'}), 400
+
+    user_message = data['message']
+    user_id = session['user_id']
+
+    decision = admit_chat_turn(user_id, user_message, request.remote_addr)
+    if not decision.allowed:
+        return jsonify(admission_rejected_body(decision)), decision.status, {'Retry-After': decision.retry_after_header}
+
+    def generate():
+        try:
+            for event, payload in chatbot.stream_contextual_response(user_id, user_message):
+                yield format_sse(event, payload)
+        except Exception as e:
+            logger.exception("Error streaming message")
+            ERRORS.inc(where="chat_stream")
+            yield format_sse('error', {'response': "I'm here for you. Let's try again."})
+
+    response = Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+    # The turn holds its slot until the stream ends or the client goes away
+    response.call_on_close(decision.release)
+    return response
+
+
+WRITE_SYNC_TIMEOUT = float(os.getenv("WRITE_SYNC_TIMEOUT", "10"))
+
+
+def write_queue_full_response():
+    response = jsonify({'error': 'Server is busy, please try again shortly'})
+    response.status_code = 503
+    response.headers['Retry-After'] = '1'
+    return response
+
+
+PAGE_DEFAULT_LIMIT = 20
+PAGE_MAX_LIMIT = 100
+
+
+def parse_page_args():
+    """Read ``before`` (an id cursor) and ``limit`` from the query string; raises ValueError"""
+    before = request.args.get('before')
+    limit = request.args.get('limit')
+    try:
+        before = int(before) if before is not None else None
+        limit = int(limit) if limit is not None else PAGE_DEFAULT_LIMIT
+    except ValueError:
+        raise ValueError('before and limit must be integers')
+    if limit < 1 or limit > PAGE_MAX_LIMIT:
+        raise ValueError(f'limit must be between 1 and {PAGE_MAX_LIMIT}')
+    return before, limit
+
+
+def fetch_page(table, columns, user_id, before, limit):
+    """Newest-first keyset page of a user's rows; returns (rows, next cursor or None)
+
+    Rows are ordered by (created_at, id) so the cursor is stable when several rows
+    share a timestamp, and each page is a range scan on the (user_id, created_at, id)
+    index instead of an OFFSET that re-reads every earlier page.
+    """
+    query = select(*columns).where(table.c.user_id == user_id)
+    if before is not None:
+        cursor = (
+            select(table.c.created_at)
+            .where(table.c.id == before, table.c.user_id == user_id)
+            .scalar_subquery()
+        )
+        query = query.where(or_(
+            table.c.created_at < cursor,
+            and_(table.c.created_at == cursor, table.c.id < before),
+        ))
+    query = query.order_by(table.c.created_at.desc(), table.c.id.desc()).limit(limit + 1)
+
+    db_session = SessionLocal()
+    try:
+        rows = db_session.execute(query).fetchall()
+    finally:
+        db_session.close()
+    next_before = rows[limit - 1].id if len(rows) > limit else None
+    return rows[:limit], next_before
+
+
+@app.route('/checkin', methods=['GET', 'POST'])
 def checkin():
     if 'user_id' not in session:
         return jsonify({'error': 'Authentication required'}), 401
 
+    if request.method == 'GET':
+        try:
+            before, limit = parse_page_args()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        # Check-ins are written behind, so make sure this user's latest is visible
+        write_queue.flush(timeout=WRITE_SYNC_TIMEOUT)
+        checkins, next_before = fetch_page(
+            mood_checkins_table,
+            (
+                mood_checkins_table.c.id,
+                mood_checkins_table.c.mood,
+                mood_checkins_table.c.note,
+                mood_checkins_table.c.created_at,
+            ),
+            session['user_id'], before, limit,
+        )
+        return jsonify({
+            'checkins': [
+                {
+                    'id': checkin.id,
+                    'mood': checkin.mood,
+                    'note': checkin.note,
+                    'created_at': checkin.created_at.isoformat() if checkin.created_at else None,
+                }
+                for checkin in checkins
+            ],
+            'next_before': next_before,
+        })
+
     if not request.is_json:
         return jsonify({'error': 'Content-Type must be application/json'}), 415
 
@@ -441,20 +1491,43 @@ def checkin():
     if mood is None or not isinstance(mood, int) or mood < 1 or mood > 5:
         return jsonify({'error': 'Mood must be an integer between 1 and 5'}), 400
 
-    db_session = SessionLocal()
-    db_session.execute(
-        mood_checkins_table.insert().values(
-            user_id=session['user_id'],
-            mood=mood,
-            note=note,
-        )
-    )
-    db_session.commit()
-    db_session.close()
+    # Check-ins are written behind; the response doesn't wait for the commit
+    try:
+        write_queue.insert(mood_checkins_table, {
+            'user_id': session['user_id'],
+            'mood': mood,
+            'note': note,
+            # Set here rather than by the server default so the rollup hook
+            # buckets the check-in by the same timestamp that is stored
+            'created_at': datetime.now(timezone.utc),
+        })
+    except WriteQueueFull:
+        return write_queue_full_response()
 
     return jsonify({'status': 'saved'})
 
 
+@app.route('/mood/summary')
+def mood_summary():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Authentication required'}), 401
+
+    period = request.args.get('period', 'daily')
+    if period not in MOOD_SUMMARY_PERIODS:
+        return jsonify({'error': f"period must be one of {', '.join(MOOD_SUMMARY_PERIODS)}"}), 400
+    try:
+        limit = int(request.args.get('limit', 30))
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+    if limit < 1 or limit > 366:
+        return jsonify({'error': 'limit must be between 1 and 366'}), 400
+
+    write_queue.flush(timeout=WRITE_SYNC_TIMEOUT)
+    with engine.connect() as conn:
+        buckets = mood_rollups.summary(conn, session['user_id'], period, limit)
+    return jsonify({'period': period, 'buckets': buckets})
+
+
 @app.route('/journal', methods=['GET', 'POST'])
 def journal():
     if 'user_id' not in session:
@@ -471,31 +1544,34 @@ def journal():
         if not content:
             return jsonify({'error': 'Content is required'}), 400
 
-        db_session = SessionLocal()
-        db_session.execute(
-            journal_entries_table.insert().values(
-                user_id=session['user_id'],
-                title=title,
-                content=content,
-            )
-        )
-        db_session.commit()
-        db_session.close()
+        # Journal entries are batched with other writes but flushed before we reply
+        try:
+            write_queue.insert(journal_entries_table, {
+                'user_id': session['user_id'],
+                'title': title,
+                'content': content,
+            }, sync=True).result(timeout=WRITE_SYNC_TIMEOUT)
+        except WriteQueueFull:
+            return write_queue_full_response()
+        if chatbot.retriever:
+            chatbot.retriever.add(session['user_id'], f"{title}: {content}" if title else content, 'journal')
 
         return jsonify({'status': 'saved'})
 
-    db_session = SessionLocal()
-    entries = db_session.execute(
-        select(
+    try:
+        before, limit = parse_page_args()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    entries, next_before = fetch_page(
+        journal_entries_table,
+        (
             journal_entries_table.c.id,
             journal_entries_table.c.title,
             journal_entries_table.c.content,
             journal_entries_table.c.created_at,
-        ).where(journal_entries_table.c.user_id == session['user_id'])
-        .order_by(journal_entries_table.c.created_at.desc())
-        .limit(20)
-    ).fetchall()
-    db_session.close()
+        ),
+        session['user_id'], before, limit,
+    )
 
     return jsonify({
         'entries': [
@@ -506,14 +1582,196 @@ def journal():
                 'created_at': entry.created_at.isoformat() if entry.created_at else None,
             }
             for entry in entries
-        ]
+        ],
+        'next_before': next_before,
     })
 
 
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "500"))
+# (record type, table, order) for everything a user's export contains
+EXPORT_SOURCES = (
+    ('chat_message', chat_messages_table, ('user_id', 'seq')),
+    ('legacy_chat_history', user_chat_history_table, ('user_id',)),
+    ('mood_checkin', mood_checkins_table, ('user_id', 'created_at', 'id')),
+    ('journal_entry', journal_entries_table, ('user_id', 'created_at', 'id')),
+)
+
+
+@app.route('/export')
+def export():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Authentication required'}), 401
+
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'error': f"format must be one of {', '.join(EXPORT_FORMATS)}"}), 400
+
+    user_id = session['user_id']
+    # Include turns and check-ins still waiting in the write-behind queue
+    persist_executor.wait(user_id, timeout=WRITE_SYNC_TIMEOUT)
+    write_queue.flush(timeout=WRITE_SYNC_TIMEOUT)
+    return Response(
+        stream_with_context(export_chunks(engine, EXPORT_SOURCES, fmt, user_id, EXPORT_BATCH_SIZE)),
+        mimetype=EXPORT_FORMATS[fmt],
+        headers={
+            'Content-Disposition': f'attachment; filename="export-{user_id}.{fmt}"',
+            'Cache-Control': 'no-store',
+            'X-Accel-Buffering': 'no',
+        },
+    )
+
+
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+PROFILING_INTERVAL_MS = float(os.getenv("PROFILING_INTERVAL_MS", "5"))
+profile_log = ProfileLog()
+
+# Each worker has its own registry; with a shared directory /metrics reports all of them
+METRICS_MULTIPROC_DIR = os.getenv("METRICS_MULTIPROC_DIR")
+if METRICS_MULTIPROC_DIR:
+    registry.set_multiprocess_dir(METRICS_MULTIPROC_DIR, float(os.getenv("METRICS_SNAPSHOT_INTERVAL", "5")))
+
+# Operator-only routes need "Authorization: Bearer <ADMIN_TOKEN>"; unset disables them
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+
+def admin_required(view):
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        supplied = request.headers.get('Authorization', '')
+        if not ADMIN_TOKEN or not hmac.compare_digest(supplied.encode(), f'Bearer {ADMIN_TOKEN}'.encode()):
+            return jsonify({'error': 'Forbidden'}), 403
+        return view(*args, **kwargs)
+    return wrapper
+
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    # Opt-in per request: send "X-Profile: 1" while PROFILING_ENABLED is on
+    if PROFILING_ENABLED and request.headers.get('X-Profile') == '1':
+        g.profiler = SamplingProfiler(interval=PROFILING_INTERVAL_MS / 1000.0).start()
+
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        REQUEST_SECONDS.observe(
+            time.perf_counter() - started,
+            endpoint=endpoint,
+            method=request.method,
+            status=response.status_code,
+        )
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        summary = profiler.stop().summary()
+        summary.update(path=request.path, method=request.method)
+        profile_log.add(summary)
+        response.headers['X-Profile-Samples'] = str(summary['total_samples'])
+    registry.maybe_write_snapshot()
+    return response
+
+
+def collect_runtime_metrics():
+    pool = engine.pool
+    pool_samples = []
+    for state, method in (('size', 'size'), ('checked_out', 'checkedout'), ('checked_in', 'checkedin'), ('overflow', 'overflow')):
+        if hasattr(pool, method):
+            pool_samples.append(({'state': state}, getattr(pool, method)()))
+    yield 'db_pool_connections', 'gauge', 'Database connection pool state', pool_samples
+
+    batcher = chatbot.emotion_batcher.stats()
+    yield 'emotion_batch_queue_depth', 'gauge', 'Messages waiting for the emotion classifier', [({}, batcher['queue_depth'])]
+    yield 'emotion_batches_total', 'counter', 'Emotion classifier batches run', [({}, batcher['batches'])]
+    yield 'emotion_batch_items_total', 'counter', 'Messages classified in batches', [({}, batcher['items'])]
+    yield 'emotion_batch_size_total', 'counter', 'Emotion classifier batches by size', [
+        ({'size': str(size)}, count) for size, count in batcher['batch_size_counts'].items()
+    ]
+
+    yield 'chat_inflight', 'gauge', 'Chat turns currently admitted and running', [({}, admission.inflight)]
+
+    llm = chatbot.llm_gateway_stats()
+    if llm is not None:
+        states = ('closed', 'half_open', 'open')
+        yield 'llm_circuit_state', 'gauge', 'LLM circuit breaker state (1 for the current one)', [
+            ({'state': state}, 1 if llm['breaker_state'] == state else 0) for state in states
+        ]
+        yield 'llm_attempts_total', 'counter', 'LLM requests sent, including retries and hedges', [
+            ({'kind': 'attempt'}, llm['attempts']), ({'kind': 'retry'}, llm['retries']), ({'kind': 'hedge'}, llm['hedges'])
+        ]
+        yield 'llm_circuit_rejections_total', 'counter', 'Calls failed fast by the open circuit', [({}, llm['breaker_rejected'])]
+        yield 'llm_timeouts_total', 'counter', 'Calls that hit their deadline', [({}, llm['timeouts'])]
+
+    writes = write_queue.stats()
+    yield 'write_behind_pending', 'gauge', 'Writes queued but not yet committed', [({}, writes['pending'])]
+    yield 'write_behind_batches_total', 'counter', 'Write-behind flushes', [({}, writes['batches'])]
+    yield 'write_behind_rows_total', 'counter', 'Rows written by the write-behind queue', [({}, writes['rows_written'])]
+    yield 'write_behind_failures_total', 'counter', 'Rows the write-behind queue failed to write', [({}, writes['failures'])]
+
+    cache = chatbot.user_conversations.stats()
+    yield 'context_cache_entries', 'gauge', 'Conversation contexts held in memory', [({}, cache['entries'])]
+    yield 'context_cache_bytes', 'gauge', 'Approximate memory held by cached contexts', [({}, cache['bytes'])]
+    yield 'context_cache_hits_total', 'counter', 'Context cache hits', [({}, cache['hits'])]
+    yield 'context_cache_misses_total', 'counter', 'Context cache misses', [({}, cache['misses'])]
+    yield 'context_cache_evictions_total', 'counter', 'Context cache evictions by reason', [
+        ({'reason': reason}, count) for reason, count in cache['evictions'].items()
+    ]
+
+
+registry.register_collector('runtime', collect_runtime_metrics)
+
+
+@app.route('/metrics')
+def metrics():
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/metrics/profiles')
+@admin_required
+def metrics_profiles():
+    if not PROFILING_ENABLED:
+        return jsonify({'error': 'Profiling is disabled'}), 404
+    return jsonify({'profiles': profile_log.recent()})
+
+
 @app.route('/health')
 def health():
     return jsonify({"status": "ok"})
 
 
+@app.route('/ready')
+def ready():
+    # In lazy mode models load on the first request, so the worker is ready as soon as it's up
+    status = {
+        'ready': chatbot.models_ready or MODEL_LOAD_MODE == "lazy",
+        'load_mode': MODEL_LOAD_MODE,
+        'models': chatbot.model_status(),
+        'startup_timings': startup_timings,
+    }
+    return jsonify(status), 200 if status['ready'] else 503
+
+
+@app.route('/stats')
+def stats():
+    return jsonify({
+        'emotion_batcher': chatbot.emotion_batcher.stats(),
+        'emotion_cache': chatbot.emotion_cache.stats(),
+        'retrieval': chatbot.retriever.stats() if chatbot.retriever else None,
+        'compaction': chatbot.compactor.stats(),
+        'admission': admission.stats(),
+        'persist_executor': persist_executor.stats(),
+        'context_store': context_store.stats(),
+        'password_hasher': password_hasher.stats(),
+        'user_lookup': user_lookup.stats(),
+        'llm_gateway': chatbot.llm_gateway_stats(),
+        'context_cache': chatbot.user_conversations.stats(),
+        'write_behind': write_queue.stats(),
+    })
+
+
+startup_timings['app_import'] = round(time.perf_counter() - _import_started, 4)
+
+
 if __name__ == '__main__':
     app.run(debug=True, port=5000)
@@ -0,0 +1,318 @@
+"""ASGI entry point: async /chat and /chat/stream, everything else served by the Flask app.
+
+Run with ``uvicorn asgi:app``. Chat requests await the LLM with ``ainvoke``/``astream``
+instead of pinning a thread for the whole round trip, so concurrency is bounded by
+``LLM_MAX_INFLIGHT`` rather than by the server's thread count. A client that goes
+away cancels its turn, which gives back the LLM slot and closes the upstream stream.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.cookies import SimpleCookie
+from typing import AsyncIterator, Dict, Tuple
+
+from asgiref.wsgi import WsgiToAsgi
+from itsdangerous import BadSignature
+
+from app import (
+    ERRORS, LLM_FIRST_TOKEN_SECONDS, STAGE_SECONDS, admission, admission_rejected_body, admit_chat_turn, llm_failure_reason,
+)
+from app import app as flask_app
+from app import chatbot
+from llm_gateway import CircuitOpen
+
+logger = logging.getLogger(__name__)
+
+LLM_MAX_INFLIGHT = int(os.getenv("LLM_MAX_INFLIGHT", "64"))
+DB_EXECUTOR_WORKERS = int(os.getenv("DB_EXECUTOR_WORKERS", "8"))
+
+# Every admitted turn should be able to get an LLM slot. CHAT_MAX_INFLIGHT's default
+# is sized for the threaded server, so here it follows LLM_MAX_INFLIGHT unless set
+if "CHAT_MAX_INFLIGHT" not in os.environ:
+    admission.max_inflight = LLM_MAX_INFLIGHT
+elif 0 < admission.max_inflight < LLM_MAX_INFLIGHT:
+    logger.warning("CHAT_MAX_INFLIGHT=%d admits fewer turns than LLM_MAX_INFLIGHT=%d allows LLM calls",
+                   admission.max_inflight, LLM_MAX_INFLIGHT)
+
+# Blocking SQLAlchemy calls run here so they never stall the event loop
+db_executor = ThreadPoolExecutor(max_workers=DB_EXECUTOR_WORKERS, thread_name_prefix="db")
+_llm_semaphore = None
+
+ERROR_RESPONSE = {
+    'response': "I'm here for you. Let's try again.",
+    'interactive_options': [
+        "Retry conversation",
+        "Start over",
+        "Get support"
+    ]
+}
+
+
+def llm_semaphore() -> asyncio.Semaphore:
+    # Created lazily so it binds to the server's running event loop
+    global _llm_semaphore
+    if _llm_semaphore is None:
+        _llm_semaphore = asyncio.Semaphore(LLM_MAX_INFLIGHT)
+    return _llm_semaphore
+
+
+async def run_db(func, *args):
+    return await asyncio.get_running_loop().run_in_executor(db_executor, func, *args)
+
+
+async def aprepare_turn(user_id: int, user_message: str):
+    """Async prepare_turn: context load and retrieval on the DB executor, emotion via the micro-batcher"""
+    async def load_context():
+        context = await run_db(chatbot.get_user_context, user_id)
+        return context, await run_db(chatbot.retrieve, user_id, user_message, context)
+
+    (context, memories), current_emotion = await asyncio.gather(
+        load_context(),
+        chatbot.adetect_emotion(user_message),
+    )
+    context['current_emotion'] = current_emotion
+    return context, current_emotion, chatbot.build_prompt(context, current_emotion, user_message, memories)
+
+
+async def agenerate_contextual_response(user_id: int, user_message: str) -> Dict:
+    if chatbot.is_crisis_message(user_message):
+        return chatbot.crisis_response()
+
+    context, current_emotion, prompt = await aprepare_turn(user_id, user_message)
+    try:
+        async with llm_semaphore():
+            with STAGE_SECONDS.time(stage="llm"):
+                response = (await chatbot.llm.ainvoke(prompt)).content
+    except Exception as e:
+        logger.warning("LLM call failed for user %s: %s", user_id, e)
+        response = chatbot.fallback_response(current_emotion, reason=llm_failure_reason(e))
+
+    return await run_db(chatbot.complete_turn, user_id, context, user_message, response, current_emotion)
+
+
+async def astream_contextual_response(user_id: int, user_message: str) -> AsyncIterator[Tuple[str, Dict]]:
+    if chatbot.is_crisis_message(user_message):
+        payload = chatbot.crisis_response()
+        yield 'token', {'content': payload['response']}
+        yield 'done', payload
+        return
+
+    context, current_emotion, prompt = await aprepare_turn(user_id, user_message)
+    yield 'emotion', {'emotion': current_emotion}
+
+    chunks = []
+    reason = "empty_stream"
+    try:
+        async with llm_semaphore():
+            started = time.perf_counter()
+            stream = chatbot.llm.astream(prompt)
+            try:
+                async for chunk in stream:
+                    if chunk.content:
+                        if not chunks:
+                            LLM_FIRST_TOKEN_SECONDS.observe(time.perf_counter() - started)
+                        chunks.append(chunk.content)
+                        yield 'token', {'content': chunk.content}
+            finally:
+                # Also runs when we are closed at the yield above, which leaves the loop without closing ``stream``
+                await stream.aclose()
+            STAGE_SECONDS.observe(time.perf_counter() - started, stage="llm")
+    except CircuitOpen as e:
+        reason = llm_failure_reason(e)
+    except Exception as e:
+        logger.exception("Streaming error for user %s", user_id)
+        ERRORS.inc(where="llm_stream")
+        reason = llm_failure_reason(e)
+    response = "".join(chunks)
+    if not response:
+        response = chatbot.fallback_response(current_emotion, reason=reason)
+        yield 'token', {'content': response}
+
+    yield 'done', await run_db(chatbot.complete_turn, user_id, context, user_message, response, current_emotion)
+
+
+def load_session(headers: Dict[bytes, bytes]) -> Dict:
+    """Decode the Flask session cookie so async routes share the WSGI login"""
+    cookies = SimpleCookie()
+    cookies.load(headers.get(b'cookie', b'').decode('latin-1'))
+    morsel = cookies.get(flask_app.config['SESSION_COOKIE_NAME'])
+    if morsel is None:
+        return {}
+    serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+    try:
+        return serializer.loads(
+            morsel.value,
+            max_age=int(flask_app.permanent_session_lifetime.total_seconds()),
+        )
+    except BadSignature:
+        return {}
+
+
+class ClientDisconnected(Exception):
+    """The client closed the connection before the response was finished"""
+
+
+async def until_disconnect(receive, coro):
+    """Await ``coro``, cancelling it and raising ``ClientDisconnected`` if the client goes away first.
+
+    Call only after the request body has been read: from then on ``receive`` yields nothing but the disconnect.
+    """
+    async def wait_for_disconnect():
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+    work = asyncio.ensure_future(coro)
+    watcher = asyncio.ensure_future(wait_for_disconnect())
+    try:
+        await asyncio.wait({work, watcher}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        watcher.cancel()
+    if not work.done():
+        work.cancel()
+        # Let the turn unwind (LLM slot, upstream stream) before the admission slot is released
+        await asyncio.wait({work})
+        raise ClientDisconnected()
+    return work.result()
+
+
+async def read_body(receive) -> bytes:
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            return body
+
+
+async def send_json(send, status: int, payload: Dict, headers=()):
+    body = json.dumps(payload).encode()
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode()), *headers],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def parse_chat_request(scope, receive, send):
+    """Validate auth, payload and admission like the Flask view; returns (user_id, message, decision) or None"""
+    headers = dict(scope['headers'])
+    user_id = load_session(headers).get('user_id')
+    if user_id is None:
+        await send_json(send, 401, {'error': 'Authentication required'})
+        return None
+
+    content_type = headers.get(b'content-type', b'').decode('latin-1').split(';')[0].strip()
+    if content_type != 'application/json' and not content_type.endswith('+json'):
+        await send_json(send, 415, {'error': 'Content-Type must be application/json'})
+        return None
+
+    try:
+        data = json.loads(await read_body(receive) or b'null')
+    except ValueError:
+        data = None
+    if not isinstance(data, dict) or 'message' not in data:
+        await send_json(send, 400, {'error': 'Invalid request format'})
+        return None
+
+    client = scope.get('client')
+    decision = admit_chat_turn(user_id, data['message'], client[0] if client else None)
+    if not decision.allowed:
+        await send_json(send, decision.status, admission_rejected_body(decision),
+                        [(b'retry-after', decision.retry_after_header.encode())])
+        return None
+    return user_id, data['message'], decision
+
+
+async def chat(scope, receive, send):
+    parsed = await parse_chat_request(scope, receive, send)
+    if parsed is None:
+        return
+    user_id, user_message, decision = parsed
+    try:
+        await send_json(send, 200, await until_disconnect(receive, agenerate_contextual_response(user_id, user_message)))
+    except ClientDisconnected:
+        logger.info("Client disconnected; abandoned chat turn for user %s", user_id)
+    except Exception as e:
+        logger.exception("Error processing message")
+        ERRORS.inc(where="chat")
+        await send_json(send, 500, ERROR_RESPONSE)
+    finally:
+        decision.release()
+
+
+async def chat_stream(scope, receive, send):
+    parsed = await parse_chat_request(scope, receive, send)
+    if parsed is None:
+        return
+    user_id, user_message, decision = parsed
+    try:
+        await until_disconnect(receive, stream_events(send, user_id, user_message))
+    except ClientDisconnected:
+        logger.info("Client disconnected; stopped streaming to user %s", user_id)
+    finally:
+        decision.release()
+
+
+async def stream_events(send, user_id: int, user_message: str):
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [
+            (b'content-type', b'text/event-stream; charset=utf-8'),
+            (b'cache-control', b'no-cache'),
+            (b'x-accel-buffering', b'no'),
+        ],
+    })
+    events = astream_contextual_response(user_id, user_message)
+    try:
+        async for event, payload in events:
+            await send({
+                'type': 'http.response.body',
+                'body': f"event: {event}\ndata: {json.dumps(payload)}\n\n".encode(),
+                'more_body': True,
+            })
+    except Exception as e:
+        logger.exception("Error streaming message")
+        ERRORS.inc(where="chat_stream")
+        error = {'response': ERROR_RESPONSE['response']}
+        await send({
+            'type': 'http.response.body',
+            'body': f"event: error\ndata: {json.dumps(error)}\n\n".encode(),
+            'more_body': True,
+        })
+    finally:
+        # Cancelled mid-stream: close the generator so the LLM stream and its slot are released now
+        await events.aclose()
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+ASYNC_ROUTES = {
+    ('POST', '/chat'): chat,
+    ('POST', '/chat/stream'): chat_stream,
+}
+
+wsgi_app = WsgiToAsgi(flask_app)
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                db_executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    handler = None
+    if scope['type'] == 'http':
+        handler = ASYNC_ROUTES.get((scope['method'], scope['path']))
+    if handler is None:
+        await wsgi_app(scope, receive, send)
+    else:
+        await handler(scope, receive, send)
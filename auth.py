@@ -0,0 +1,151 @@
+"""Password hashing off the request threads, and a short-lived username lookup cache.
+
+KDF work (scrypt/pbkdf2) is deliberately slow, so it runs in a small process
+pool instead of on the threads that also serve chat. The pool is bounded: when
+too many hashes are already waiting, ``AuthBusy`` is raised so the route can
+answer 503 instead of queueing without limit.
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from typing import Callable, Dict, Optional
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from context_cache import ContextCache
+
+DEFAULT_HASH_METHOD = "scrypt:32768:8:1"
+
+
+class AuthBusy(Exception):
+    """Too many password hashes are already queued, or one took longer than the timeout"""
+
+
+def hash_params(stored_hash: str) -> str:
+    """The method and cost parameters a stored hash was made with, e.g. ``scrypt:32768:8:1``"""
+    return stored_hash.split("$", 1)[0]
+
+
+class PasswordHasher:
+    def __init__(self, method: str = DEFAULT_HASH_METHOD, workers: int = 2, max_pending: int = 32,
+                 timeout: float = 10.0):
+        self.method = method
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._pool = None
+        self._pool_pid = None
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._params = None
+
+        self.hashes = 0
+        self.verifications = 0
+        self.rejected = 0
+        self.timeouts = 0
+
+    def _get_pool(self):
+        # Like the other background workers, the pool is per process: one
+        # created before gunicorn forks is not usable in the workers
+        if self._pool is None or self._pool_pid != os.getpid():
+            with self._lock:
+                if self._pool is None or self._pool_pid != os.getpid():
+                    self._pool = ProcessPoolExecutor(
+                        max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+                    )
+                    self._pool_pid = os.getpid()
+        return self._pool
+
+    def _run(self, fn: Callable, *args):
+        if self.workers <= 0:
+            return fn(*args)
+        if not self._slots.acquire(blocking=False):
+            self.rejected += 1
+            raise AuthBusy(f"{self.max_pending} password hashes already pending")
+        try:
+            future: Future = self._get_pool().submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            # The hash keeps its slot until it finishes, so a backlog turns into AuthBusy
+            self.timeouts += 1
+            raise AuthBusy(f"password hash took longer than {self.timeout}s")
+
+    def hash(self, password: str) -> str:
+        self.hashes += 1
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, stored_hash: str, password: str) -> bool:
+        self.verifications += 1
+        return self._run(check_password_hash, stored_hash, password)
+
+    @property
+    def params(self) -> str:
+        """Full parameter string for the configured method, with werkzeug's defaults filled in"""
+        if self._params is None:
+            self._params = hash_params(self._run(generate_password_hash, "", self.method))
+        return self._params
+
+    def needs_rehash(self, stored_hash: str) -> bool:
+        return hash_params(stored_hash) != self.params
+
+    def close(self):
+        if self._pool is not None and self._pool_pid == os.getpid():
+            self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> Dict:
+        return {
+            'method': self.method,
+            'workers': self.workers,
+            'hashes': self.hashes,
+            'verifications': self.verifications,
+            'rejected': self.rejected,
+            'timeouts': self.timeouts,
+        }
+
+
+class UserLookupCache:
+    """username -> user row, with a shorter TTL for usernames that don't exist"""
+
+    _MISSING = object()
+
+    def __init__(self, load: Callable[[str], Optional[Dict]], ttl_seconds: float = 60.0,
+                 negative_ttl_seconds: float = 5.0, max_entries: int = 10000):
+        self.load = load
+        self.found = ContextCache(max_entries=max_entries, ttl_seconds=ttl_seconds, max_bytes=None)
+        self.missing = ContextCache(max_entries=max_entries, ttl_seconds=negative_ttl_seconds, max_bytes=None,
+                                    sizeof=lambda value: 0)
+
+    def get(self, username: str) -> Optional[Dict]:
+        user = self.found.get(username)
+        if user is not None:
+            return user
+        if self.missing.get(username) is not None:
+            return None
+        user = self.load(username)
+        if user is None:
+            self.missing.put(username, self._MISSING)
+        else:
+            self.found.put(username, user)
+        return user
+
+    def put(self, username: str, user: Dict):
+        self.missing.pop(username)
+        self.found.put(username, user)
+
+    def invalidate(self, username: str):
+        self.found.pop(username)
+        self.missing.pop(username)
+
+    def stats(self) -> Dict:
+        found, missing = self.found.stats(), self.missing.stats()
+        return {
+            'found': {key: found[key] for key in ('entries', 'hits', 'misses', 'hit_rate')},
+            'missing': {key: missing[key] for key in ('entries', 'hits')},
+        }
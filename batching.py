@@ -0,0 +1,149 @@
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Callable, List, Optional
+
+
+class MicroBatcher:
+    """Collects items from concurrent callers and runs them through one batched call.
+
+    Callers block in ``submit`` while a single worker thread drains the queue,
+    waiting at most ``window_ms`` for more items (or until ``max_batch_size`` is
+    reached) before handing the whole batch to ``batch_fn``.
+    """
+
+    def __init__(
+        self,
+        batch_fn: Callable[[List], List],
+        max_batch_size: int = 16,
+        window_ms: float = 5.0,
+        max_queue_size: int = 1024,
+        name: str = "batcher",
+    ):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.window = max(0.0, window_ms) / 1000.0
+        self.max_queue_size = max_queue_size
+        self.name = name
+
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._worker = None
+        self._worker_pid = None
+
+        # Metrics
+        self._batches = 0
+        self._items = 0
+        self._max_batch_seen = 0
+        self._max_queue_depth_seen = 0
+        self._last_batch_size = 0
+        self._batch_size_counts = {}
+        self._total_batch_seconds = 0.0
+        self._split_batches = 0
+
+    def _ensure_worker(self):
+        # The worker thread does not survive fork, so start (or restart) it in
+        # whichever process first submits work.
+        if self._worker is not None and self._worker_pid == os.getpid() and self._worker.is_alive():
+            return
+        with self._cond:
+            if self._worker is not None and self._worker_pid == os.getpid() and self._worker.is_alive():
+                return
+            self._worker_pid = os.getpid()
+            self._worker = threading.Thread(target=self._run, name=f"{self.name}-worker", daemon=True)
+            self._worker.start()
+
+    def submit(self, item, timeout: Optional[float] = None):
+        """Queue an item and block until its result is available"""
+        return self.submit_async(item).result(timeout=timeout)
+
+    def submit_async(self, item) -> Future:
+        """Queue an item and return a Future for its result"""
+        self._ensure_worker()
+        future = Future()
+        with self._cond:
+            if len(self._queue) >= self.max_queue_size:
+                raise RuntimeError(f"{self.name} queue is full ({self.max_queue_size} items)")
+            self._queue.append((item, future))
+            depth = len(self._queue)
+            if depth > self._max_queue_depth_seen:
+                self._max_queue_depth_seen = depth
+            self._cond.notify()
+        return future
+
+    def _next_batch(self):
+        with self._cond:
+            while not self._queue:
+                self._cond.wait()
+            deadline = time.monotonic() + self.window
+            while len(self._queue) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            batch = []
+            while self._queue and len(batch) < self.max_batch_size:
+                batch.append(self._queue.popleft())
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            items = [item for item, _ in batch]
+            started = time.perf_counter()
+            try:
+                results = self._call(items)
+            except Exception as e:
+                if len(batch) == 1:
+                    batch[0][1].set_exception(e)
+                else:
+                    # Retry one by one so a single bad item only fails its own caller
+                    with self._cond:
+                        self._split_batches += 1
+                    for item, future in batch:
+                        try:
+                            future.set_result(self._call([item])[0])
+                        except Exception as item_error:
+                            future.set_exception(item_error)
+            else:
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
+            self._record_batch(len(items), time.perf_counter() - started)
+
+    def _call(self, items: List) -> List:
+        results = self.batch_fn(items)
+        if len(results) != len(items):
+            raise RuntimeError(f"{self.name} batch function returned {len(results)} results for {len(items)} items")
+        return results
+
+    def _record_batch(self, size: int, seconds: float):
+        with self._cond:
+            self._batches += 1
+            self._items += size
+            self._last_batch_size = size
+            self._max_batch_seen = max(self._max_batch_seen, size)
+            self._batch_size_counts[size] = self._batch_size_counts.get(size, 0) + 1
+            self._total_batch_seconds += seconds
+
+    def stats(self) -> dict:
+        """Snapshot of batch size and queue depth metrics"""
+        with self._cond:
+            return {
+                'queue_depth': len(self._queue),
+                'max_queue_depth': self._max_queue_depth_seen,
+                'batches': self._batches,
+                'items': self._items,
+                'last_batch_size': self._last_batch_size,
+                'max_batch_size_seen': self._max_batch_seen,
+                'mean_batch_size': (self._items / self._batches) if self._batches else 0.0,
+                'batch_size_counts': dict(sorted(self._batch_size_counts.items())),
+                'mean_batch_seconds': (self._total_batch_seconds / self._batches) if self._batches else 0.0,
+                'split_batches': self._split_batches,
+                'config': {
+                    'max_batch_size': self.max_batch_size,
+                    'window_ms': self.window * 1000.0,
+                    'max_queue_size': self.max_queue_size,
+                },
+            }
@@ -0,0 +1,151 @@
+"""Local stand-in for the Groq chat completions endpoint.
+
+Speaks enough of the OpenAI-compatible ``/openai/v1/chat/completions`` API for
+ChatGroq, with configurable latency, token streaming and error rate. Point the
+app at it with ``GROQ_BASE_URL=http://127.0.0.1:<port>``.
+
+    python -m bench.fake_llm --port 8099 --latency-ms 400 --token-delay-ms 15
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_REPLY = (
+    "That sounds really hard, and it makes sense that you're feeling this way. "
+    "I'm here with you. What feels heaviest right now?"
+)
+
+
+class FakeLLMConfig:
+    def __init__(self, latency_ms=300.0, jitter_ms=50.0, first_token_ms=150.0, token_delay_ms=10.0,
+                 error_rate=0.0, reply=DEFAULT_REPLY):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.first_token_ms = first_token_ms
+        self.token_delay_ms = token_delay_ms
+        self.error_rate = error_rate
+        self.reply = reply
+
+    def delay(self, base_ms):
+        time.sleep(max(0.0, base_ms + random.uniform(-self.jitter_ms, self.jitter_ms)) / 1000.0)
+
+
+def make_handler(config: FakeLLMConfig):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send_json(self, status, payload):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self._send_json(404, {"error": {"message": "not found"}})
+                return
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            model = request.get("model", "fake-model")
+
+            if random.random() < config.error_rate:
+                config.delay(config.first_token_ms)
+                self._send_json(503, {"error": {"message": "fake upstream overloaded", "type": "server_error"}})
+                return
+
+            completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+            if request.get("stream"):
+                self._stream(completion_id, model)
+            else:
+                config.delay(config.latency_ms)
+                self._send_json(200, {
+                    "id": completion_id,
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [{
+                        "index": 0,
+                        "message": {"role": "assistant", "content": config.reply},
+                        "finish_reason": "stop",
+                    }],
+                    "usage": {"prompt_tokens": 200, "completion_tokens": 30, "total_tokens": 230},
+                })
+
+        def _stream(self, completion_id, model):
+            config.delay(config.first_token_ms)
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.close_connection = True
+
+            tokens = config.reply.split(" ")
+            for index, token in enumerate(tokens):
+                chunk = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [{
+                        "index": 0,
+                        "delta": {"content": token if index == 0 else " " + token},
+                        "finish_reason": None,
+                    }],
+                }
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                self.wfile.flush()
+                if config.token_delay_ms:
+                    time.sleep(config.token_delay_ms / 1000.0)
+            final = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+            }
+            self.wfile.write(f"data: {json.dumps(final)}\n\ndata: [DONE]\n\n".encode())
+            self.wfile.flush()
+
+    return Handler
+
+
+def start_server(config: FakeLLMConfig = None, host="127.0.0.1", port=0) -> ThreadingHTTPServer:
+    """Start the fake server in a daemon thread; ``server.server_address`` has the bound port"""
+    server = ThreadingHTTPServer((host, port), make_handler(config or FakeLLMConfig()))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-llm", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--latency-ms", type=float, default=300.0, help="Non-streaming response latency.")
+    parser.add_argument("--jitter-ms", type=float, default=50.0)
+    parser.add_argument("--first-token-ms", type=float, default=150.0, help="Streaming time to first token.")
+    parser.add_argument("--token-delay-ms", type=float, default=10.0, help="Delay between streamed tokens.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 503.")
+    args = parser.parse_args()
+
+    config = FakeLLMConfig(args.latency_ms, args.jitter_ms, args.first_token_ms, args.token_delay_ms, args.error_rate)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(config))
+    print(f"Fake LLM listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+"""Replay simulated users through signup/login/chat/checkin/journal and report latency.
+
+Against an already running server:
+
+    python -m bench.load_test --target http://127.0.0.1:5000 --users 50 --concurrency 16
+
+Or let the driver start the fake LLM and the app (stub emotion model, throwaway
+SQLite database) itself:
+
+    python -m bench.load_test --spawn gunicorn --users 50 --concurrency 16
+    python -m bench.load_test --spawn uvicorn --stream --json bench_output.json
+"""
+import argparse
+import http.cookiejar
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+from bench.fake_llm import FakeLLMConfig, start_server
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHAT_MESSAGES = [
+    "I've been feeling really stressed about work lately.",
+    "I had a good day today, went for a walk.",
+    "I'm so angry at my brother right now.",
+    "I can't sleep and I keep overthinking everything.",
+    "Tell me more",
+    "How can I help?",
+    "hi",
+]
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    """Nearest-rank percentile of the samples"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(1, math.ceil(pct / 100.0 * len(ordered)))
+    return ordered[rank - 1]
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.rate_limited = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, seconds, status):
+        """``status`` is the HTTP status, or None if no response arrived"""
+        with self._lock:
+            if status == 429:
+                # Rejected before doing any work; kept out of the latency samples
+                self.rate_limited[endpoint] += 1
+                return
+            self.latencies[endpoint].append(seconds)
+            if status is None or status >= 400:
+                self.errors[endpoint] += 1
+
+    def report(self, wall_seconds: float) -> Dict:
+        report = {}
+        for endpoint in sorted(set(self.latencies) | set(self.rate_limited)):
+            samples = self.latencies[endpoint]
+            report[endpoint] = {
+                'count': len(samples),
+                'errors': self.errors[endpoint],
+                'rate_limited': self.rate_limited[endpoint],
+                'p50_ms': round(percentile(samples, 50) * 1000, 2),
+                'p95_ms': round(percentile(samples, 95) * 1000, 2),
+                'p99_ms': round(percentile(samples, 99) * 1000, 2),
+                'mean_ms': round(sum(samples) / len(samples) * 1000, 2) if samples else 0.0,
+                'throughput_rps': round(len(samples) / wall_seconds, 2) if wall_seconds else 0.0,
+            }
+        return report
+
+
+class SimulatedUser:
+    def __init__(self, target, recorder, stream=False):
+        self.target = target.rstrip('/')
+        self.recorder = recorder
+        self.stream = stream
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar())
+        )
+        self.username = f"bench-{uuid.uuid4().hex[:12]}"
+
+    def request(self, endpoint, method, path, form=None, payload=None):
+        data, headers = None, {}
+        if form is not None:
+            data = urllib.parse.urlencode(form).encode()
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        elif payload is not None:
+            data = json.dumps(payload).encode()
+            headers['Content-Type'] = 'application/json'
+        req = urllib.request.Request(self.target + path, data=data, headers=headers, method=method)
+        started = time.perf_counter()
+        try:
+            with self.opener.open(req, timeout=120) as response:
+                response.read()
+                status = response.status
+        except urllib.error.HTTPError as e:
+            e.read()
+            status = e.code
+        except (urllib.error.URLError, OSError):
+            status = None
+        self.recorder.record(endpoint, time.perf_counter() - started, status)
+
+    def run(self, turns):
+        password = "bench-password"
+        self.request('signup', 'POST', '/signup', form={
+            'username': self.username,
+            'email': f"{self.username}@example.com",
+            'password': password,
+            'confirm_password': password,
+        })
+        self.request('login', 'POST', '/login', form={'username': self.username, 'password': password})
+        chat_path = '/chat/stream' if self.stream else '/chat'
+        for turn in range(turns):
+            self.request(chat_path, 'POST', chat_path, payload={'message': random.choice(CHAT_MESSAGES)})
+            if turn % 3 == 0:
+                self.request('checkin', 'POST', '/checkin', payload={'mood': random.randint(1, 5), 'note': 'bench'})
+            if turn % 4 == 0:
+                self.request('journal POST', 'POST', '/journal', payload={'title': 'bench', 'content': 'A day like any other.'})
+                self.request('journal GET', 'GET', '/journal')
+
+
+def run_load(target, users, concurrency, turns, stream=False) -> Dict:
+    recorder = Recorder()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for future in [pool.submit(SimulatedUser(target, recorder, stream).run, turns) for _ in range(users)]:
+            future.result()
+    wall = time.perf_counter() - started
+    return {'wall_seconds': round(wall, 3), 'users': users, 'turns': turns, 'endpoints': recorder.report(wall)}
+
+
+def wait_until_ready(target, timeout=60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(target + '/ready', timeout=2) as response:
+                if response.status == 200:
+                    return
+        except (urllib.error.URLError, OSError):
+            pass
+        time.sleep(0.25)
+    raise RuntimeError(f"{target} did not become ready within {timeout}s")
+
+
+def spawn_app(server, port, llm_url, db_path):
+    env = dict(
+        os.environ,
+        DATABASE_URL=f"sqlite:///{db_path}",
+        GROQ_BASE_URL=llm_url,
+        GROQ_API_KEY="bench",
+        EMOTION_BACKEND=os.getenv("EMOTION_BACKEND", "stub"),
+        MODEL_LOAD_MODE="preload",
+        # Measure the chat path itself, not embedding (or the on-disk index gunicorn workers can't share)
+        RETRIEVAL_ENABLED="false",
+        # Every simulated user shares one IP and chats back to back, so the
+        # per-user and per-IP buckets would turn most turns into 429s
+        CHAT_USER_RATE_PER_MINUTE="0",
+        CHAT_IP_RATE_PER_MINUTE="0",
+    )
+    if server == 'uvicorn':
+        cmd = [sys.executable, '-m', 'uvicorn', 'asgi:app', '--port', str(port), '--log-level', 'warning']
+    else:
+        cmd = [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '-b', f'127.0.0.1:{port}', 'app:app']
+    return subprocess.Popen(cmd, cwd=REPO_ROOT, env=env)
+
+
+def print_report(result):
+    print(f"{result['users']} users x {result['turns']} turns in {result['wall_seconds']}s")
+    print(f"{'endpoint':<16}{'count':>7}{'errors':>8}{'429s':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'req/s':>9}")
+    for endpoint, stats in result['endpoints'].items():
+        print(f"{endpoint:<16}{stats['count']:>7}{stats['errors']:>8}{stats['rate_limited']:>7}{stats['p50_ms']:>10}"
+              f"{stats['p95_ms']:>10}{stats['p99_ms']:>10}{stats['throughput_rps']:>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", default="http://127.0.0.1:5000")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--turns", type=int, default=5, help="Chat turns per simulated user.")
+    parser.add_argument("--stream", action="store_true", help="Use /chat/stream instead of /chat.")
+    parser.add_argument("--spawn", choices=["gunicorn", "uvicorn"], help="Start the fake LLM and the app locally.")
+    parser.add_argument("--port", type=int, default=5055, help="Port for --spawn.")
+    parser.add_argument("--llm-latency-ms", type=float, default=300.0)
+    parser.add_argument("--llm-first-token-ms", type=float, default=150.0)
+    parser.add_argument("--llm-token-delay-ms", type=float, default=10.0)
+    parser.add_argument("--json", dest="json_path", help="Also write the report as JSON to this path.")
+    args = parser.parse_args()
+
+    process = None
+    target = args.target
+    if args.spawn:
+        llm = start_server(FakeLLMConfig(
+            latency_ms=args.llm_latency_ms,
+            first_token_ms=args.llm_first_token_ms,
+            token_delay_ms=args.llm_token_delay_ms,
+        ))
+        llm_url = f"http://127.0.0.1:{llm.server_address[1]}"
+        db_path = os.path.join(tempfile.mkdtemp(prefix="bench-"), "bench.db")
+        process = spawn_app(args.spawn, args.port, llm_url, db_path)
+        target = f"http://127.0.0.1:{args.port}"
+    try:
+        wait_until_ready(target)
+        result = run_load(target, args.users, args.concurrency, args.turns, args.stream)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=30)
+
+    print_report(result)
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+import logging
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def estimate_size(obj, _seen=None) -> int:
+    """Approximate resident size in bytes of a nested dict/list/str structure"""
+    if _seen is None:
+        _seen = set()
+    if id(obj) in _seen:
+        return 0
+    _seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(estimate_size(k, _seen) + estimate_size(v, _seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(estimate_size(item, _seen) for item in obj)
+    elif hasattr(obj, '__slots__'):
+        size += sum(
+            estimate_size(getattr(obj, name), _seen)
+            for name in obj.__slots__
+            if hasattr(obj, name)
+        )
+    return size
+
+
+class ContextCache:
+    """Thread-safe LRU cache with an idle TTL and both entry-count and byte ceilings.
+
+    ``on_evict(key, value, reason)`` is called outside the lock for every entry that
+    leaves the cache, so callers can persist it before it is dropped.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1000,
+        ttl_seconds: float = 1800.0,
+        max_bytes: int = 64 * 1024 * 1024,
+        on_evict: Optional[Callable[[Hashable, Any, str], None]] = None,
+        sizeof: Callable[[Any], int] = estimate_size,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.on_evict = on_evict
+        self.sizeof = sizeof
+
+        self._entries = OrderedDict()  # key -> (value, size, last_access)
+        self._bytes = 0
+        self._lock = threading.RLock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = {'capacity': 0, 'memory': 0, 'expired': 0}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and not self._is_expired(entry, time.monotonic())
+
+    def _is_expired(self, entry, now):
+        return self.ttl_seconds is not None and now - entry[2] > self.ttl_seconds
+
+    def get(self, key, default=None):
+        evicted = []
+        with self._lock:
+            now = time.monotonic()
+            entry = self._entries.get(key)
+            if entry is not None and self._is_expired(entry, now):
+                evicted.append(self._pop(key, 'expired'))
+                entry = None
+            if entry is None:
+                self.misses += 1
+                value = default
+            else:
+                self.hits += 1
+                value = entry[0]
+                self._entries[key] = (value, entry[1], now)
+                self._entries.move_to_end(key)
+        self._notify(evicted)
+        return value
+
+    def put(self, key, value):
+        """Insert or refresh an entry, re-measuring its size"""
+        evicted = []
+        with self._lock:
+            now = time.monotonic()
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[1]
+            size = self.sizeof(value)
+            self._entries[key] = (value, size, now)
+            self._bytes += size
+            evicted.extend(self._expire(now))
+            evicted.extend(self._enforce_limits(key))
+        self._notify(evicted)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return default
+            self._bytes -= entry[1]
+            return entry[0]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def expire(self):
+        """Drop every entry idle for longer than the TTL"""
+        with self._lock:
+            evicted = self._expire(time.monotonic())
+        self._notify(evicted)
+
+    def _pop(self, key, reason):
+        value, size, _ = self._entries.pop(key)
+        self._bytes -= size
+        self.evictions[reason] += 1
+        return key, value, reason
+
+    def _expire(self, now):
+        # Entries are kept in access order, so expired ones are at the front
+        evicted = []
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            if not self._is_expired(entry, now):
+                break
+            evicted.append(self._pop(key, 'expired'))
+        return evicted
+
+    def _enforce_limits(self, keep_key):
+        evicted = []
+        while len(self._entries) > 1:
+            if self.max_entries is not None and len(self._entries) > self.max_entries:
+                reason = 'capacity'
+            elif self.max_bytes is not None and self._bytes > self.max_bytes:
+                reason = 'memory'
+            else:
+                break
+            oldest = next(iter(self._entries))
+            if oldest == keep_key:
+                break
+            evicted.append(self._pop(oldest, reason))
+        return evicted
+
+    def _notify(self, evicted):
+        if not self.on_evict:
+            return
+        for key, value, reason in evicted:
+            try:
+                self.on_evict(key, value, reason)
+            except Exception as e:
+                logger.exception("Error evicting cache entry %s", key)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': (self.hits / lookups) if lookups else 0.0,
+                'evictions': dict(self.evictions),
+                'config': {
+                    'max_entries': self.max_entries,
+                    'ttl_seconds': self.ttl_seconds,
+                    'max_bytes': self.max_bytes,
+                },
+            }
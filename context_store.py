@@ -0,0 +1,296 @@
+"""Shared, versioned storage of per-user conversation contexts.
+
+Every worker keeps recently used contexts in its own near cache; the store is
+the copy they all agree on. Each stored context has a version that goes up by
+one on every write, and writes are compare-and-swap: ``compare_and_set`` only
+succeeds if the stored version is still the one the writer read, and raises
+``VersionConflict`` otherwise, so a worker holding a stale context can't
+overwrite a newer one.
+
+Backends:
+
+- ``SQLContextStore``: the ``chat_state`` row is the context; CAS is an UPDATE
+  guarded by the version column. Near caches check the version (a primary-key
+  read of one integer) instead of reloading the context.
+- ``RedisContextStore``: contexts live in a Redis-compatible server, CAS is a
+  Lua script, and each write publishes an invalidation that other workers use
+  to drop their cached copy, so no per-turn check is needed while the listener
+  is subscribed. While it isn't, callers fall back to version checks, and after
+  every (re)subscribe near caches are dropped, since invalidations sent in the
+  gap were missed. Every successful write is also saved to a
+  ``SQLContextStore`` (only ever moving its version forward), which is where
+  contexts are reloaded from if the server loses them.
+"""
+import logging
+import os
+import threading
+import uuid
+from typing import Callable, Dict, Optional
+
+from sqlalchemy import and_, or_, select
+from sqlalchemy.exc import IntegrityError
+
+from conversation_context import FIELDS, ConversationContext, decode, encode
+
+logger = logging.getLogger(__name__)
+
+
+class VersionConflict(Exception):
+    """The stored context changed since it was read"""
+
+
+class SQLContextStore:
+    push_invalidation = False
+
+    def __init__(self, engine, table, rebuild: Optional[Callable] = None, compress_min_bytes: Optional[int] = 512):
+        self.engine = engine
+        self.table = table
+        # rebuild(conn, row) -> ConversationContext for rows written before the
+        # encoded context column existed
+        self.rebuild = rebuild
+        self.compress_min_bytes = compress_min_bytes
+        self.writes = 0
+        self.conflicts = 0
+        self.version_checks = 0
+
+    def _row(self, context: ConversationContext, version: int) -> Dict:
+        row = {name: getattr(context, name) for name in FIELDS if name != 'emotional_history'}
+        row['context'] = encode(context, self.compress_min_bytes)
+        row['version'] = version
+        return row
+
+    def load(self, user_id) -> Optional[ConversationContext]:
+        with self.engine.connect() as conn:
+            row = conn.execute(select(self.table).where(self.table.c.user_id == user_id)).fetchone()
+            if row is None:
+                return None
+            if row.context is not None:
+                context = decode(row.context)
+            elif self.rebuild is not None:
+                context = self.rebuild(conn, row)
+            else:
+                return None
+        context.version = row.version or 0
+        return context
+
+    def version(self, user_id) -> int:
+        self.version_checks += 1
+        with self.engine.connect() as conn:
+            version = conn.execute(
+                select(self.table.c.version).where(self.table.c.user_id == user_id)
+            ).scalar()
+        return version or 0
+
+    def compare_and_set(self, user_id, context: ConversationContext, expected: int) -> int:
+        """Store ``context`` if the stored version is ``expected``; returns the new version"""
+        table = self.table
+        new_version = expected + 1
+        row = self._row(context, new_version)
+        current = table.c.version == expected
+        if not expected:
+            # Rows from before the version column have NULL there
+            current = or_(current, table.c.version.is_(None))
+        with self.engine.begin() as conn:
+            updated = conn.execute(
+                table.update().where(and_(table.c.user_id == user_id, current)).values(**row)
+            ).rowcount
+            if not updated and not expected:
+                try:
+                    with conn.begin_nested():
+                        conn.execute(table.insert().values(user_id=user_id, **row))
+                    updated = 1
+                except IntegrityError:
+                    pass
+        if not updated:
+            self.conflicts += 1
+            raise VersionConflict(f"context for user {user_id} is no longer at version {expected}")
+        self.writes += 1
+        return new_version
+
+    def save_if_newer(self, user_id, context: ConversationContext, version: int):
+        """Write ``context`` as ``version`` unless the stored copy is already at least that new"""
+        table = self.table
+        row = self._row(context, version)
+        with self.engine.begin() as conn:
+            updated = conn.execute(
+                table.update()
+                .where(table.c.user_id == user_id, or_(table.c.version < version, table.c.version.is_(None)))
+                .values(**row)
+            ).rowcount
+            if not updated:
+                try:
+                    with conn.begin_nested():
+                        conn.execute(table.insert().values(user_id=user_id, **row))
+                except IntegrityError:
+                    pass
+        self.writes += 1
+
+    def subscribe(self, callback: Callable, on_resubscribe: Optional[Callable] = None):
+        """No push channel; callers check ``version`` instead"""
+
+    def close(self):
+        pass
+
+    def stats(self) -> Dict:
+        return {
+            'backend': 'sql',
+            'writes': self.writes,
+            'conflicts': self.conflicts,
+            'version_checks': self.version_checks,
+        }
+
+
+# KEYS[1] = context hash; ARGV = expected version, encoded context, new
+# version, ttl seconds, channel, invalidation message
+_CAS_SCRIPT = """
+local current = tonumber(redis.call('HGET', KEYS[1], 'version') or '0')
+if current ~= tonumber(ARGV[1]) then
+  return current
+end
+redis.call('HSET', KEYS[1], 'data', ARGV[2], 'version', ARGV[3])
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+redis.call('PUBLISH', ARGV[5], ARGV[6])
+return -1
+"""
+
+# Seed a context read from SQL unless another worker already did
+_SEED_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+  redis.call('HSET', KEYS[1], 'data', ARGV[1], 'version', ARGV[2])
+  redis.call('EXPIRE', KEYS[1], ARGV[3])
+end
+return redis.call('HMGET', KEYS[1], 'data', 'version')
+"""
+
+
+class RedisContextStore:
+    def __init__(self, url: str, durable: SQLContextStore, ttl_seconds: int = 86400, prefix: str = "context:",
+                 channel: str = "context-invalidations"):
+        import redis
+
+        self.client = redis.Redis.from_url(url, socket_timeout=1.0, socket_connect_timeout=1.0)
+        # The listener idles on its own connection, which must not time out
+        # between messages; health checks still catch a dead connection
+        self._listener_client = redis.Redis.from_url(
+            url, socket_timeout=None, socket_connect_timeout=1.0, health_check_interval=30
+        )
+        self.durable = durable
+        self.ttl_seconds = ttl_seconds
+        self.prefix = prefix
+        self.channel = channel
+        self._instance = uuid.uuid4().hex
+        self._cas = self.client.register_script(_CAS_SCRIPT)
+        self._seed = self.client.register_script(_SEED_SCRIPT)
+        self._callback = None
+        self._on_resubscribe = None
+        self._subscribed = False
+        self._listener = None
+        self._listener_pid = None
+        self._lock = threading.Lock()
+        self.writes = 0
+        self.conflicts = 0
+        self.invalidations = 0
+
+    @property
+    def push_invalidation(self) -> bool:
+        """Whether invalidations are being received; callers check ``version`` while they aren't"""
+        return self._subscribed
+
+    @property
+    def origin(self) -> str:
+        """Tag on published invalidations so a worker can skip its own; differs per forked worker"""
+        return f"{self._instance}-{os.getpid()}"
+
+    def _key(self, user_id) -> str:
+        return f"{self.prefix}{user_id}"
+
+    def load(self, user_id) -> Optional[ConversationContext]:
+        self._ensure_listener()
+        data, version = self.client.hmget(self._key(user_id), 'data', 'version')
+        if data is None:
+            context = self.durable.load(user_id)
+            if context is None:
+                return None
+            data, version = self._seed(
+                keys=[self._key(user_id)],
+                args=[encode(context, self.durable.compress_min_bytes), context.version, self.ttl_seconds],
+            )
+        context = decode(data)
+        context.version = int(version)
+        return context
+
+    def version(self, user_id) -> int:
+        version = self.client.hget(self._key(user_id), 'version')
+        return int(version) if version is not None else 0
+
+    def compare_and_set(self, user_id, context: ConversationContext, expected: int) -> int:
+        self._ensure_listener()
+        new_version = expected + 1
+        current = self._cas(
+            keys=[self._key(user_id)],
+            args=[expected, encode(context, self.durable.compress_min_bytes), new_version, self.ttl_seconds,
+                  self.channel, f"{user_id}:{new_version}:{self.origin}"],
+        )
+        if int(current) != -1:
+            self.conflicts += 1
+            raise VersionConflict(f"context for user {user_id} is at version {current}, not {expected}")
+        self.writes += 1
+        self.durable.save_if_newer(user_id, context, new_version)
+        return new_version
+
+    def subscribe(self, callback: Callable, on_resubscribe: Optional[Callable] = None):
+        """Call ``callback(user_id, version)`` for every context another worker writes.
+
+        ``on_resubscribe()`` runs each time the listener (re)subscribes; anything
+        cached before then may have missed its invalidation.
+        """
+        self._callback = callback
+        self._on_resubscribe = on_resubscribe
+        self._ensure_listener()
+
+    def _ensure_listener(self):
+        # One listener thread per process, started again after a fork
+        if self._callback is None or (self._listener is not None and self._listener_pid == os.getpid()):
+            return
+        with self._lock:
+            if self._listener is not None and self._listener_pid == os.getpid():
+                return
+            self._listener = threading.Thread(target=self._listen, name="context-invalidations", daemon=True)
+            self._listener_pid = os.getpid()
+            self._listener.start()
+
+    def _listen(self):
+        while True:
+            pubsub = self._listener_client.pubsub(ignore_subscribe_messages=True)
+            try:
+                pubsub.subscribe(self.channel)
+                self._subscribed = True
+                if self._on_resubscribe is not None:
+                    self._on_resubscribe()
+                while True:
+                    message = pubsub.get_message(timeout=1.0)
+                    if message is None:
+                        continue
+                    user_id, version, origin = message['data'].decode().rsplit(':', 2)
+                    if origin != self.origin:
+                        self.invalidations += 1
+                        self._callback(int(user_id) if user_id.isdigit() else user_id, int(version))
+            except Exception as e:
+                self._subscribed = False
+                logger.warning("Context invalidation listener failed, reconnecting: %s", e)
+                threading.Event().wait(1.0)
+            finally:
+                pubsub.close()
+
+    def close(self):
+        pass
+
+    def stats(self) -> Dict:
+        return {
+            'backend': 'redis',
+            'writes': self.writes,
+            'conflicts': self.conflicts,
+            'invalidations': self.invalidations,
+            'subscribed': self._subscribed,
+            'durable': self.durable.stats(),
+        }
@@ -0,0 +1,155 @@
+"""Per-user conversation context and its compact binary encoding.
+
+``ConversationContext`` replaces the plain dict each user's context used to be.
+With ``__slots__`` there is no per-instance ``__dict__``, which matters when
+the context cache holds tens of thousands of them. Item access
+(``context['last_seq']``) still works, so code written against the dict keeps
+working.
+
+``encode`` produces a small header followed by the fields as a positional
+msgpack array, which omits the repeated key names JSON would carry. Payloads
+above a size threshold are zstd-compressed when ``zstandard`` is installed.
+Without msgpack the same header wraps compact JSON instead. ``decode`` reads
+any of these, and also legacy JSON objects (str or bytes) stored before the
+header existed.
+"""
+import json
+import threading
+from typing import Dict, Optional, Union
+
+MAGIC = b"CX"
+FORMAT_VERSION = 1
+
+CODEC_JSON = 0
+CODEC_MSGPACK = 1
+FLAG_ZSTD = 0x80
+
+FIELDS = (
+    'emotional_history',
+    'current_emotion',
+    'conversation_depth',
+    'last_topic',
+    'last_seq',
+    'summary',
+    'summarized_seq',
+)
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# zstandard (de)compressors must not be shared between threads
+_zstd = threading.local()
+
+
+class ConversationContext:
+    # ``version`` is the stored row version this context was read at or last
+    # written as; it is bookkeeping for the context store and isn't encoded
+    __slots__ = FIELDS + ('version',)
+
+    def __init__(self, emotional_history=None, current_emotion=None, conversation_depth=0, last_topic=None,
+                 last_seq=0, summary=None, summarized_seq=0, version=0):
+        self.emotional_history = list(emotional_history) if emotional_history is not None else []
+        self.current_emotion = current_emotion
+        self.conversation_depth = conversation_depth
+        self.last_topic = last_topic
+        self.last_seq = last_seq
+        self.summary = summary
+        self.summarized_seq = summarized_seq
+        self.version = version
+
+    def __getitem__(self, key):
+        if key not in FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        if key not in FIELDS:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in FIELDS else default
+
+    def __eq__(self, other):
+        if not isinstance(other, ConversationContext):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in FIELDS)
+
+    def __repr__(self):
+        return f"ConversationContext(last_seq={self.last_seq}, history={len(self.emotional_history)})"
+
+    def copy(self) -> "ConversationContext":
+        """Snapshot whose history list is independent of this one"""
+        return ConversationContext(*(getattr(self, name) for name in FIELDS), version=self.version)
+
+    def to_dict(self) -> Dict:
+        return {name: getattr(self, name) for name in FIELDS}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "ConversationContext":
+        """Build from the old dict layout; unknown keys are ignored and missing ones defaulted"""
+        history = data.get('emotional_history') or []
+        return cls(
+            emotional_history=history,
+            current_emotion=data.get('current_emotion'),
+            conversation_depth=data.get('conversation_depth', len(history)),
+            last_topic=data.get('last_topic'),
+            last_seq=data.get('last_seq', len(history)),
+            summary=data.get('summary'),
+            summarized_seq=data.get('summarized_seq') or 0,
+        )
+
+
+def _compressor():
+    if not hasattr(_zstd, 'compressor'):
+        _zstd.compressor = zstandard.ZstdCompressor(level=3)
+        _zstd.decompressor = zstandard.ZstdDecompressor()
+    return _zstd.compressor, _zstd.decompressor
+
+
+def encode(context: ConversationContext, compress_min_bytes: Optional[int] = 512) -> bytes:
+    """Versioned binary form of ``context``; ``compress_min_bytes=None`` turns compression off"""
+    values = [getattr(context, name) for name in FIELDS]
+    if msgpack is not None:
+        codec, payload = CODEC_MSGPACK, msgpack.packb(values, use_bin_type=True)
+    else:
+        codec, payload = CODEC_JSON, json.dumps(values, separators=(',', ':')).encode('utf-8')
+    if zstandard is not None and compress_min_bytes is not None and len(payload) >= compress_min_bytes:
+        codec |= FLAG_ZSTD
+        payload = _compressor()[0].compress(payload)
+    return MAGIC + bytes((FORMAT_VERSION, codec)) + payload
+
+
+def decode(data: Union[bytes, bytearray, memoryview, str]) -> ConversationContext:
+    """Read anything ``encode`` wrote, or a legacy JSON object"""
+    if isinstance(data, str):
+        return ConversationContext.from_dict(json.loads(data))
+    data = bytes(data)
+    if not data.startswith(MAGIC):
+        return ConversationContext.from_dict(json.loads(data.decode('utf-8')))
+
+    version, codec = data[2], data[3]
+    if version != FORMAT_VERSION:
+        raise ValueError(f"Unsupported context format version {version}")
+    payload = data[4:]
+    if codec & FLAG_ZSTD:
+        if zstandard is None:
+            raise ValueError("Context is zstd-compressed but zstandard is not installed")
+        payload = _compressor()[1].decompress(payload)
+        codec &= ~FLAG_ZSTD
+    if codec == CODEC_MSGPACK:
+        if msgpack is None:
+            raise ValueError("Context is msgpack-encoded but msgpack is not installed")
+        values = msgpack.unpackb(payload, raw=False)
+    elif codec == CODEC_JSON:
+        values = json.loads(payload.decode('utf-8'))
+    else:
+        raise ValueError(f"Unknown context codec {codec}")
+    return ConversationContext(*values)
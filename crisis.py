@@ -0,0 +1,92 @@
+import os
+import re
+import unicodedata
+from typing import Dict, Iterable, List
+
+DEFAULT_PHRASES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "crisis_phrases.txt")
+
+# Apostrophe-like characters are dropped so "can't", "can’t" and "cant" all match
+_APOSTROPHES = re.compile(r"['’‘ʼ`´]")
+_NON_WORD = re.compile(r"[\W_]+")
+
+
+def normalize_text(text: str) -> str:
+    """Casefold, strip accents and punctuation, and collapse whitespace"""
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    text = unicodedata.normalize("NFKC", text).casefold()
+    text = _APOSTROPHES.sub("", text)
+    return _NON_WORD.sub(" ", text).strip()
+
+
+def load_phrases(path: str) -> List[str]:
+    """Read one phrase per line, skipping blank lines and # comments"""
+    with open(path, encoding="utf-8") as f:
+        return [
+            line.strip()
+            for line in f
+            if line.strip() and not line.lstrip().startswith("#")
+        ]
+
+
+def _trie_pattern(node: Dict) -> str:
+    # '' marks the end of a phrase at this node
+    is_end = "" in node
+    branches = [
+        re.escape(ch) + _trie_pattern(child)
+        for ch, child in sorted(node.items())
+        if ch != ""
+    ]
+    if not branches:
+        return ""
+    if len(branches) == 1 and not is_end:
+        return branches[0]
+    pattern = "(?:" + "|".join(branches) + ")"
+    return pattern + "?" if is_end else pattern
+
+
+class CrisisDetector:
+    """Matches a large phrase list against a message in a single regex pass.
+
+    Phrases are normalized the same way as incoming text and folded into a
+    prefix trie, which is compiled into one alternation so shared prefixes are
+    only tested once no matter how many phrases are loaded.
+    """
+
+    def __init__(self, phrases: Iterable[str]):
+        self.phrases = {}
+        trie = {}
+        for phrase in phrases:
+            normalized = normalize_text(phrase)
+            if not normalized:
+                continue
+            self.phrases.setdefault(normalized, phrase)
+            node = trie
+            for ch in normalized:
+                node = node.setdefault(ch, {})
+            node[""] = True
+        if trie:
+            self._pattern = re.compile(r"(?<!\w)" + _trie_pattern(trie) + r"(?!\w)")
+        else:
+            self._pattern = None
+
+    @classmethod
+    def from_file(cls, path: str = DEFAULT_PHRASES_PATH) -> "CrisisDetector":
+        return cls(load_phrases(path))
+
+    def __len__(self):
+        return len(self.phrases)
+
+    def find(self, text: str) -> List[str]:
+        """Return the phrases (as written in the phrase list) found in the text"""
+        if self._pattern is None:
+            return []
+        found = []
+        for match in self._pattern.finditer(normalize_text(text)):
+            phrase = self.phrases[match.group(0)]
+            if phrase not in found:
+                found.append(phrase)
+        return found
+
+    def matches(self, text: str) -> bool:
+        return self._pattern is not None and self._pattern.search(normalize_text(text)) is not None
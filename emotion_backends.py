@@ -0,0 +1,199 @@
+import os
+import time
+from typing import Dict, Iterable, List
+
+EMOTION_MODEL_NAME = "j-hartmann/emotion-english-distilroberta-base"
+DEFAULT_SAMPLES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "emotion_parity_samples.txt")
+
+ONNX_MODEL_FILE = "model.onnx"
+QUANTIZED_ONNX_MODEL_FILE = "model.quant.onnx"
+
+# Longest input the model accepts; longer messages are truncated
+MAX_TOKENS = 512
+
+
+class EmotionBackend:
+    """Turns a batch of messages into per-label scores.
+
+    ``classify`` returns one list of ``{'label': ..., 'score': ...}`` dicts per
+    message, the same shape as the transformers pipeline with all scores.
+    """
+
+    name = "base"
+
+    def classify(self, messages: List[str]) -> List[List[Dict]]:
+        raise NotImplementedError
+
+
+class TransformersBackend(EmotionBackend):
+    """Full-precision PyTorch pipeline"""
+
+    name = "transformers"
+
+    def __init__(self, model_name: str = EMOTION_MODEL_NAME):
+        from transformers import pipeline
+
+        self.pipeline = pipeline(
+            "text-classification",
+            model=model_name,
+            return_all_scores=True
+        )
+
+    def classify(self, messages):
+        return self.pipeline(messages, batch_size=len(messages), truncation=True, max_length=MAX_TOKENS)
+
+
+class OnnxBackend(EmotionBackend):
+    """ONNX Runtime session over an exported (optionally int8-quantized) model"""
+
+    name = "onnx"
+
+    def __init__(self, model_dir: str, intra_op_threads: int = 0):
+        import numpy as np
+        import onnxruntime as ort
+        from transformers import AutoConfig, AutoTokenizer
+
+        model_path = os.path.join(model_dir, QUANTIZED_ONNX_MODEL_FILE)
+        if not os.path.exists(model_path):
+            model_path = os.path.join(model_dir, ONNX_MODEL_FILE)
+
+        options = ort.SessionOptions()
+        if intra_op_threads:
+            options.intra_op_num_threads = intra_op_threads
+        self.np = np
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        config = AutoConfig.from_pretrained(model_dir)
+        self.labels = [config.id2label[i] for i in range(len(config.id2label))]
+
+    def classify(self, messages):
+        np = self.np
+        encoded = self.tokenizer(messages, padding=True, truncation=True, max_length=MAX_TOKENS, return_tensors="np")
+        feeds = {name: value.astype(np.int64) for name, value in encoded.items() if name in self.input_names}
+        logits = self.session.run(None, feeds)[0]
+        logits = logits - logits.max(axis=1, keepdims=True)
+        probs = np.exp(logits)
+        probs /= probs.sum(axis=1, keepdims=True)
+        return [
+            [{'label': label, 'score': float(score)} for label, score in zip(self.labels, row)]
+            for row in probs
+        ]
+
+
+class StubBackend(EmotionBackend):
+    """Keyword-based stand-in for benchmarks and tests; no model download needed"""
+
+    name = "stub"
+    labels = ['anger', 'disgust', 'fear', 'joy', 'neutral', 'sadness', 'surprise']
+    keywords = {
+        'anger': ('angry', 'furious', 'annoy', 'frustrat', 'hate'),
+        'fear': ('scared', 'afraid', 'terrified', 'worry', 'anxious', 'nervous'),
+        'joy': ('happy', 'good', 'great', 'love', 'glad', 'proud', 'excited'),
+        'sadness': ('sad', 'lonely', 'alone', 'cry', 'miss', 'hopeless', 'empty'),
+    }
+
+    def __init__(self, delay_ms: float = 0.0):
+        self.delay = delay_ms / 1000.0
+
+    def classify(self, messages):
+        if self.delay:
+            # Simulate the cost of one batched forward pass
+            time.sleep(self.delay)
+        results = []
+        for message in messages:
+            text = message.lower()
+            top = next(
+                (label for label, words in self.keywords.items() if any(word in text for word in words)),
+                'neutral'
+            )
+            results.append([
+                {'label': label, 'score': 0.9 if label == top else 0.1 / (len(self.labels) - 1)}
+                for label in self.labels
+            ])
+        return results
+
+
+def create_backend(name: str = None) -> EmotionBackend:
+    """Build the backend named by ``name`` or the EMOTION_BACKEND environment variable"""
+    name = (name or os.getenv("EMOTION_BACKEND", "transformers")).lower()
+    if name == "transformers":
+        return TransformersBackend()
+    if name == "stub":
+        return StubBackend(float(os.getenv("EMOTION_STUB_DELAY_MS", "0")))
+    if name == "onnx":
+        return OnnxBackend(
+            os.getenv("EMOTION_ONNX_DIR", "models/emotion-onnx"),
+            intra_op_threads=int(os.getenv("EMOTION_ONNX_THREADS", "0")),
+        )
+    raise ValueError(f"Unknown emotion backend: {name}")
+
+
+def export_onnx(output_dir: str, model_name: str = EMOTION_MODEL_NAME, quantize: bool = True, opset: int = 17) -> str:
+    """Export the classifier to ONNX, optionally with int8 dynamic quantization; returns the model path"""
+    import torch
+    from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+    os.makedirs(output_dir, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModelForSequenceClassification.from_pretrained(model_name)
+    model.eval()
+
+    sample = tokenizer(["I feel fine today"], return_tensors="pt")
+    onnx_path = os.path.join(output_dir, ONNX_MODEL_FILE)
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            (sample["input_ids"], sample["attention_mask"]),
+            onnx_path,
+            input_names=["input_ids", "attention_mask"],
+            output_names=["logits"],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "sequence"},
+                "attention_mask": {0: "batch", 1: "sequence"},
+                "logits": {0: "batch"},
+            },
+            opset_version=opset,
+            # The TorchScript exporter honours dynamic_axes without needing onnxscript
+            dynamo=False,
+        )
+    tokenizer.save_pretrained(output_dir)
+    model.config.save_pretrained(output_dir)
+
+    if not quantize:
+        return onnx_path
+
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    quantized_path = os.path.join(output_dir, QUANTIZED_ONNX_MODEL_FILE)
+    quantize_dynamic(onnx_path, quantized_path, weight_type=QuantType.QInt8)
+    return quantized_path
+
+
+def load_samples(path: str = DEFAULT_SAMPLES_PATH) -> List[str]:
+    with open(path, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith("#")]
+
+
+def _top_label(scores: Iterable[Dict]) -> str:
+    return max(scores, key=lambda item: item['score'])['label']
+
+
+def parity_check(reference: EmotionBackend, candidate: EmotionBackend, samples: List[str], batch_size: int = 16) -> Dict:
+    """Compare the top label and scores of two backends over the same samples"""
+    mismatches = []
+    max_score_delta = 0.0
+    for start in range(0, len(samples), batch_size):
+        batch = samples[start:start + batch_size]
+        for text, expected, actual in zip(batch, reference.classify(batch), candidate.classify(batch)):
+            expected_scores = {item['label']: item['score'] for item in expected}
+            for item in actual:
+                max_score_delta = max(max_score_delta, abs(item['score'] - expected_scores.get(item['label'], 0.0)))
+            if _top_label(expected) != _top_label(actual):
+                mismatches.append({'text': text, 'expected': _top_label(expected), 'actual': _top_label(actual)})
+    return {
+        'samples': len(samples),
+        'label_agreement': (1 - len(mismatches) / len(samples)) if samples else 1.0,
+        'max_score_delta': max_score_delta,
+        'mismatches': mismatches,
+    }
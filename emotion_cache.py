@@ -0,0 +1,112 @@
+"""Exact-match cache of emotion labels for repeated short messages.
+
+Quick-option clicks ("Tell me more") and greetings arrive thousands of times with
+identical text, so their label is looked up by normalized text before the
+classifier runs: first in a per-process LRU, then optionally in a shared
+Redis-compatible store so every worker benefits from one classification.
+"""
+import hashlib
+import logging
+import unicodedata
+from typing import Dict, Optional
+
+from context_cache import ContextCache
+
+logger = logging.getLogger(__name__)
+
+
+def cache_key(text: str) -> str:
+    """Case, width and whitespace differences don't change the key"""
+    return " ".join(unicodedata.normalize("NFKC", text).casefold().split())
+
+
+class RedisLabelStore:
+    """Shared tier on any Redis-protocol server; errors count as misses"""
+
+    def __init__(self, url: str, ttl_seconds: int, prefix: str = "emotion:"):
+        import redis
+
+        self.client = redis.Redis.from_url(url, socket_timeout=0.05, socket_connect_timeout=0.05)
+        self.ttl_seconds = ttl_seconds
+        self.prefix = prefix
+        self.errors = 0
+
+    def _key(self, key: str) -> str:
+        return self.prefix + hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        try:
+            value = self.client.get(self._key(key))
+        except Exception as e:
+            self.errors += 1
+            logger.debug("Shared emotion cache read failed: %s", e)
+            return None
+        return value.decode("utf-8") if value is not None else None
+
+    def set(self, key: str, label: str):
+        try:
+            self.client.set(self._key(key), label, ex=self.ttl_seconds)
+        except Exception as e:
+            self.errors += 1
+            logger.debug("Shared emotion cache write failed: %s", e)
+
+
+class EmotionCache:
+    def __init__(self, max_entries: int = 10000, ttl_seconds: float = 600.0, max_chars: int = 200,
+                 shared: Optional[RedisLabelStore] = None, on_lookup=None):
+        self.local = ContextCache(max_entries=max_entries, ttl_seconds=ttl_seconds, max_bytes=None,
+                                  sizeof=lambda label: 0)
+        self.shared = shared
+        self.max_chars = max_chars
+        # on_lookup(tier, hit) feeds hit-rate metrics
+        self.on_lookup = on_lookup or (lambda tier, hit: None)
+        self.shared_hits = 0
+        self.shared_misses = 0
+
+    def key_for(self, text: str) -> Optional[str]:
+        """Cache key for ``text``, or None if it is too long to be worth caching"""
+        if len(text) > self.max_chars:
+            return None
+        return cache_key(text)
+
+    def get_local(self, key: str) -> Optional[str]:
+        label = self.local.get(key)
+        self.on_lookup('local', label is not None)
+        return label
+
+    def get_shared(self, key: str) -> Optional[str]:
+        if self.shared is None:
+            return None
+        label = self.shared.get(key)
+        if label is None:
+            self.shared_misses += 1
+        else:
+            self.shared_hits += 1
+            self.local.put(key, label)
+        self.on_lookup('shared', label is not None)
+        return label
+
+    def get(self, key: str) -> Optional[str]:
+        label = self.get_local(key)
+        if label is None:
+            label = self.get_shared(key)
+        return label
+
+    def put(self, key: str, label: str):
+        self.local.put(key, label)
+        if self.shared is not None:
+            self.shared.set(key, label)
+
+    def stats(self) -> Dict:
+        local = self.local.stats()
+        shared_lookups = self.shared_hits + self.shared_misses
+        return {
+            'local': {key: local[key] for key in ('entries', 'hits', 'misses', 'hit_rate', 'evictions')},
+            'shared': None if self.shared is None else {
+                'hits': self.shared_hits,
+                'misses': self.shared_misses,
+                'hit_rate': (self.shared_hits / shared_lookups) if shared_lookups else 0.0,
+                'errors': self.shared.errors,
+            },
+            'max_chars': self.max_chars,
+        }
@@ -0,0 +1,40 @@
+import os
+import shutil
+import tempfile
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:5000")
+workers = int(os.getenv("GUNICORN_WORKERS", "2"))
+threads = int(os.getenv("GUNICORN_THREADS", "4"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+
+# Only one process can open the on-disk retrieval index (see retrieval.ChromaIndex)
+# and the memory index is per process, so several workers need a shared chroma server
+if workers > 1 and os.getenv("RETRIEVAL_ENABLED", "true").lower() == "true" and not os.getenv("RETRIEVAL_CHROMA_HOST"):
+    raise SystemExit(
+        f"{workers} workers can't share a local retrieval index: set RETRIEVAL_CHROMA_HOST "
+        "or RETRIEVAL_ENABLED=false, or run GUNICORN_WORKERS=1"
+    )
+
+# Import the app (and, with MODEL_LOAD_MODE=preload, the models) once in the
+# master so workers fork with the weights already in shared memory
+preload_app = os.getenv("GUNICORN_PRELOAD", "true").lower() == "true"
+
+# Workers share metric snapshots here so any of them can answer /metrics for all
+os.environ.setdefault("METRICS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), f"chatbot-metrics-{os.getpid()}"))
+
+
+def on_starting(server):
+    # Counters from a previous run must not carry over
+    directory = os.environ["METRICS_MULTIPROC_DIR"]
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory, exist_ok=True)
+
+
+def worker_exit(server, worker):
+    # Flush queued chat, check-in and journal writes before the worker goes away
+    import app
+
+    app.persist_executor.close()
+    app.write_queue.close()
+    app.password_hasher.close()
+    app.registry.write_snapshot()
@@ -0,0 +1,83 @@
+import atexit
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Hashable, Optional
+
+
+class KeyedExecutor:
+    """Runs tasks on a thread pool, one at a time and in submission order per key.
+
+    Tasks for different keys run in parallel; tasks for the same key (e.g. one
+    user's turns) never overlap or reorder, so later writes can't be overtaken
+    by earlier ones.
+    """
+
+    def __init__(self, max_workers: int = 4, name: str = "keyed"):
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._queues: Dict[Hashable, deque] = {}
+        self._cond = threading.Condition()
+        self.completed = 0
+        self.failures = 0
+
+    def submit(self, key: Hashable, fn: Callable, *args, **kwargs) -> Future:
+        future = Future()
+        with self._cond:
+            queue = self._queues.get(key)
+            if queue is None:
+                self._queues[key] = deque([(fn, args, kwargs, future)])
+                self._executor.submit(self._drain, key)
+            else:
+                queue.append((fn, args, kwargs, future))
+        return future
+
+    def _drain(self, key):
+        while True:
+            with self._cond:
+                queue = self._queues[key]
+                if not queue:
+                    del self._queues[key]
+                    self._cond.notify_all()
+                    return
+                fn, args, kwargs, future = queue[0]
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(fn(*args, **kwargs))
+                    self.completed += 1
+                except BaseException as e:
+                    self.failures += 1
+                    future.set_exception(e)
+            # Only dequeue once done, so ``pending`` stays true while a task runs
+            with self._cond:
+                queue.popleft()
+
+    def pending(self, key: Hashable) -> bool:
+        with self._cond:
+            return key in self._queues
+
+    def wait(self, key: Optional[Hashable] = None, timeout: Optional[float] = None) -> bool:
+        """Block until ``key``'s tasks (or every task) have run; returns False on timeout"""
+        with self._cond:
+            return self._cond.wait_for(
+                lambda: (key not in self._queues) if key is not None else not self._queues,
+                timeout=timeout,
+            )
+
+    def close(self, timeout: float = 10.0):
+        self.wait(timeout=timeout)
+        self._executor.shutdown(wait=False)
+
+    def register_atexit(self):
+        atexit.register(self.close)
+        return self
+
+    def stats(self) -> Dict:
+        with self._cond:
+            return {
+                'active_keys': len(self._queues),
+                'queued': sum(len(queue) for queue in self._queues.values()),
+                'completed': self.completed,
+                'failures': self.failures,
+                'max_workers': self.max_workers,
+            }
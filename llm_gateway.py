@@ -0,0 +1,466 @@
+"""Resilience layer around the chat model client.
+
+``LLMGateway`` wraps a LangChain chat model (ChatGroq) and keeps the same
+``invoke``/``ainvoke``/``stream``/``astream`` surface, adding:
+
+- a per-call deadline covering every attempt and backoff sleep;
+- bounded retries with full jitter, for timeouts, connection errors, 429s and 5xx;
+- optional hedging: a second request once the first is slower than the recent p95;
+- a circuit breaker that fails fast with ``CircuitOpen`` while the upstream is degraded.
+
+Connection reuse comes from the shared httpx clients built by ``http_clients``.
+"""
+import asyncio
+import logging
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+_END = object()
+
+
+class CircuitOpen(Exception):
+    """The upstream is marked unhealthy; the call was not attempted"""
+
+
+class DeadlineExceeded(TimeoutError):
+    """The call did not finish within its deadline"""
+
+
+# Transport failures from httpx and the Groq/OpenAI SDKs, matched by name so neither has to be imported
+_TRANSIENT_ERROR_NAMES = frozenset({'TransportError', 'APIConnectionError', 'APITimeoutError'})
+
+
+def _status_code(error: BaseException) -> Optional[int]:
+    status = getattr(error, 'status_code', None)
+    if status is None:
+        response = getattr(error, 'response', None)
+        status = getattr(response, 'status_code', None)
+    return status
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Timeouts, connection failures, rate limits and server errors are worth retrying"""
+    if isinstance(error, (CircuitOpen, DeadlineExceeded)):
+        return False
+    status = _status_code(error)
+    if status is not None:
+        return status in (408, 409, 429) or status >= 500
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    # Anything else (TypeError, ValueError from a bad payload, ...) fails the same way every time
+    return any(cls.__name__ in _TRANSIENT_ERROR_NAMES for cls in type(error).__mro__)
+
+
+def _close_iterator(iterator):
+    close = getattr(iterator, 'close', None)
+    if close is None:
+        return
+    try:
+        close()
+    except Exception:
+        logger.debug("Closing an abandoned LLM stream failed", exc_info=True)
+
+
+def http_clients(timeout: float, connect_timeout: float, max_connections: int):
+    """Sync and async httpx clients with one keep-alive pool each, shared by every call in the process"""
+    import httpx
+
+    limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+    client_timeout = httpx.Timeout(timeout, connect=connect_timeout)
+    return (
+        httpx.Client(limits=limits, timeout=client_timeout),
+        httpx.AsyncClient(limits=limits, timeout=client_timeout),
+    )
+
+
+class CircuitBreaker:
+    """Opens after ``failure_threshold`` consecutive failures and lets one probe through after ``reset_seconds``"""
+
+    def __init__(self, failure_threshold: int = 5, reset_seconds: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+        self.opened = 0
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state(time.monotonic())
+
+    def _state(self, now) -> str:
+        if self._opened_at is None:
+            return 'closed'
+        if now - self._opened_at >= self.reset_seconds:
+            return 'half_open'
+        return 'open'
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self._state(time.monotonic())
+            if state == 'closed':
+                return True
+            if state == 'half_open' and not self._probing:
+                self._probing = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self.failure_threshold:
+                if self._opened_at is None or self._probing:
+                    self.opened += 1
+                self._opened_at = time.monotonic()
+                self._probing = False
+
+    def release_probe(self):
+        """The probe ended without telling us anything (it was cancelled); let the next call probe"""
+        with self._lock:
+            self._probing = False
+
+
+class LLMGateway:
+    def __init__(
+        self,
+        llm,
+        timeout: float = 20.0,
+        max_retries: int = 2,
+        backoff_base: float = 0.2,
+        backoff_max: float = 2.0,
+        hedge: bool = False,
+        hedge_min_delay: float = 0.5,
+        hedge_min_samples: int = 20,
+        breaker: Optional[CircuitBreaker] = None,
+        max_workers: int = 64,
+    ):
+        self.llm = llm
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge = hedge
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_min_samples = hedge_min_samples
+        self.breaker = breaker or CircuitBreaker()
+        # Sync calls run here so the caller can stop waiting at the deadline
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm")
+        self._latencies = deque(maxlen=200)
+        self._lock = threading.Lock()
+
+        self.calls = 0
+        self.attempts = 0
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.timeouts = 0
+        self.failures = 0
+
+    def _backoff(self, attempt: int) -> float:
+        # Full jitter keeps retries from many workers from arriving in lockstep
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _record_latency(self, seconds: float):
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def hedge_delay(self) -> Optional[float]:
+        """p95 of recent call latencies (at least ``hedge_min_delay``), or None until there are enough samples"""
+        with self._lock:
+            samples = sorted(self._latencies)
+        if not self.hedge or len(samples) < self.hedge_min_samples:
+            return None
+        # With hedge_min_samples=0 there may be no samples yet; hedge after the minimum delay
+        p95 = samples[int(0.95 * (len(samples) - 1))] if samples else 0.0
+        return max(self.hedge_min_delay, p95)
+
+    def _start(self):
+        if not self.breaker.allow():
+            raise CircuitOpen("LLM circuit breaker is open")
+        with self._lock:
+            self.calls += 1
+        return time.monotonic() + self.timeout
+
+    def _finish_error(self, error: BaseException):
+        with self._lock:
+            if isinstance(error, DeadlineExceeded):
+                self.timeouts += 1
+            self.failures += 1
+        if isinstance(error, DeadlineExceeded) or is_retryable(error):
+            self.breaker.record_failure()
+        elif _status_code(error) is not None:
+            # The upstream answered (e.g. a 400 for this prompt), so it is healthy
+            self.breaker.record_success()
+        else:
+            # A local error says nothing about the upstream
+            self.breaker.release_probe()
+
+    def _abandon(self, error: BaseException, healthy: bool = False):
+        """Settle the breaker for a call cut short by cancellation or the consumer closing the stream"""
+        if isinstance(error, Exception):
+            return
+        if healthy:
+            # Chunks arrived, so the upstream was answering
+            self.breaker.record_success()
+        else:
+            self.breaker.release_probe()
+
+    def _should_retry(self, error, attempt, deadline) -> Optional[float]:
+        """Seconds to sleep before the next attempt, or None to give up"""
+        if attempt >= self.max_retries or not is_retryable(error):
+            return None
+        delay = self._backoff(attempt)
+        if time.monotonic() + delay >= deadline:
+            return None
+        with self._lock:
+            self.retries += 1
+        logger.info("LLM attempt %d failed (%s), retrying in %.2fs", attempt + 1, error, delay)
+        return delay
+
+    # -- non-streaming ---------------------------------------------------
+
+    def _attempt(self, prompt, deadline, **kwargs):
+        with self._lock:
+            self.attempts += 1
+        started = time.monotonic()
+        primary = self._executor.submit(self.llm.invoke, prompt, **kwargs)
+        pending = {primary}
+        try:
+            hedge_after = self.hedge_delay()
+            if hedge_after is not None:
+                done, pending = wait(pending, timeout=min(hedge_after, max(0.0, deadline - time.monotonic())))
+                if not done and time.monotonic() < deadline:
+                    with self._lock:
+                        self.hedges += 1
+                    pending.add(self._executor.submit(self.llm.invoke, prompt, **kwargs))
+            while pending:
+                done, pending = wait(pending, timeout=max(0.0, deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+                if not done:
+                    raise DeadlineExceeded(f"LLM call exceeded {self.timeout}s")
+                future = done.pop()
+                if future.exception() is None or not pending:
+                    if future is not primary:
+                        with self._lock:
+                            self.hedge_wins += 1
+                    result = future.result()
+                    self._record_latency(time.monotonic() - started)
+                    return result
+        finally:
+            # A request still queued behind busy executor threads never needs to start
+            for future in pending:
+                future.cancel()
+
+    def invoke(self, prompt, **kwargs):
+        deadline = self._start()
+        attempt = 0
+        try:
+            while True:
+                try:
+                    result = self._attempt(prompt, deadline, **kwargs)
+                except Exception as e:
+                    delay = self._should_retry(e, attempt, deadline)
+                    if delay is None:
+                        self._finish_error(e)
+                        raise
+                    time.sleep(delay)
+                    attempt += 1
+                    continue
+                self.breaker.record_success()
+                return result
+        except BaseException as e:
+            self._abandon(e)
+            raise
+
+    async def _aattempt(self, prompt, deadline, **kwargs):
+        with self._lock:
+            self.attempts += 1
+        started = time.monotonic()
+        primary = asyncio.ensure_future(self.llm.ainvoke(prompt, **kwargs))
+        pending = {primary}
+        try:
+            hedge_after = self.hedge_delay()
+            if hedge_after is not None:
+                done, pending = await asyncio.wait(pending, timeout=min(hedge_after, max(0.0, deadline - time.monotonic())))
+                if not done and time.monotonic() < deadline:
+                    with self._lock:
+                        self.hedges += 1
+                    pending.add(asyncio.ensure_future(self.llm.ainvoke(prompt, **kwargs)))
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, timeout=max(0.0, deadline - time.monotonic()), return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    raise DeadlineExceeded(f"LLM call exceeded {self.timeout}s")
+                task = done.pop()
+                if task.exception() is None or not pending:
+                    if task is not primary:
+                        with self._lock:
+                            self.hedge_wins += 1
+                    result = task.result()
+                    self._record_latency(time.monotonic() - started)
+                    return result
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def ainvoke(self, prompt, **kwargs):
+        deadline = self._start()
+        attempt = 0
+        try:
+            while True:
+                try:
+                    result = await self._aattempt(prompt, deadline, **kwargs)
+                except Exception as e:
+                    delay = self._should_retry(e, attempt, deadline)
+                    if delay is None:
+                        self._finish_error(e)
+                        raise
+                    await asyncio.sleep(delay)
+                    attempt += 1
+                    continue
+                self.breaker.record_success()
+                return result
+        except BaseException as e:
+            self._abandon(e)
+            raise
+
+    # -- streaming -------------------------------------------------------
+    # Retries only happen before the first chunk; once tokens have reached the
+    # client a failed stream can't be replayed. Streams are not hedged.
+
+    def _next_chunk(self, reading, deadline):
+        """Result of ``reading`` (a pending ``next`` on the executor), cut off at the deadline"""
+        done, _ = wait([reading], timeout=max(0.0, deadline - time.monotonic()))
+        if not done:
+            raise DeadlineExceeded(f"LLM stream exceeded {self.timeout}s")
+        return reading.result()
+
+    @staticmethod
+    def _close_stream(iterator, reading):
+        """Release the upstream connection of a stream we stopped reading"""
+        if reading is not None and not reading.done():
+            # A generator can't be closed while ``next`` is running in it; close once that returns
+            reading.add_done_callback(lambda _: _close_iterator(iterator))
+        else:
+            _close_iterator(iterator)
+
+    @staticmethod
+    async def _aclose_stream(iterator):
+        aclose = getattr(iterator, 'aclose', None)
+        if aclose is None:
+            return
+        try:
+            await aclose()
+        except Exception:
+            logger.debug("Closing an abandoned LLM stream failed", exc_info=True)
+
+    def stream(self, prompt, **kwargs):
+        deadline = self._start()
+        attempt = 0
+        emitted = False
+        try:
+            while True:
+                started = time.monotonic()
+                try:
+                    with self._lock:
+                        self.attempts += 1
+                    iterator = iter(self.llm.stream(prompt, **kwargs))
+                    reading = None
+                    try:
+                        while True:
+                            reading = self._executor.submit(next, iterator, _END)
+                            chunk = self._next_chunk(reading, deadline)
+                            if chunk is _END:
+                                break
+                            if not emitted:
+                                self._record_latency(time.monotonic() - started)
+                                emitted = True
+                            yield chunk
+                    finally:
+                        self._close_stream(iterator, reading)
+                except Exception as e:
+                    delay = None if emitted else self._should_retry(e, attempt, deadline)
+                    if delay is None:
+                        self._finish_error(e)
+                        raise
+                    time.sleep(delay)
+                    attempt += 1
+                    continue
+                self.breaker.record_success()
+                return
+        except BaseException as e:
+            self._abandon(e, healthy=emitted)
+            raise
+
+    async def astream(self, prompt, **kwargs):
+        deadline = self._start()
+        attempt = 0
+        emitted = False
+        try:
+            while True:
+                started = time.monotonic()
+                try:
+                    with self._lock:
+                        self.attempts += 1
+                    iterator = self.llm.astream(prompt, **kwargs).__aiter__()
+                    try:
+                        while True:
+                            remaining = deadline - time.monotonic()
+                            if remaining <= 0:
+                                raise DeadlineExceeded(f"LLM stream exceeded {self.timeout}s")
+                            try:
+                                chunk = await asyncio.wait_for(iterator.__anext__(), remaining)
+                            except StopAsyncIteration:
+                                break
+                            except asyncio.TimeoutError:
+                                raise DeadlineExceeded(f"LLM stream exceeded {self.timeout}s")
+                            if not emitted:
+                                self._record_latency(time.monotonic() - started)
+                                emitted = True
+                            yield chunk
+                    finally:
+                        await self._aclose_stream(iterator)
+                except Exception as e:
+                    delay = None if emitted else self._should_retry(e, attempt, deadline)
+                    if delay is None:
+                        self._finish_error(e)
+                        raise
+                    await asyncio.sleep(delay)
+                    attempt += 1
+                    continue
+                self.breaker.record_success()
+                return
+        except BaseException as e:
+            self._abandon(e, healthy=emitted)
+            raise
+
+    def stats(self) -> Dict:
+        return {
+            'breaker_state': self.breaker.state,
+            'breaker_opened': self.breaker.opened,
+            'breaker_rejected': self.breaker.rejected,
+            'calls': self.calls,
+            'attempts': self.attempts,
+            'retries': self.retries,
+            'hedges': self.hedges,
+            'hedge_wins': self.hedge_wins,
+            'timeouts': self.timeouts,
+            'failures': self.failures,
+            'hedge_delay_seconds': self.hedge_delay(),
+        }
@@ -0,0 +1,339 @@
+"""Minimal in-process metrics with Prometheus text exposition.
+
+Counters and histograms are updated on the hot path under a single lock per
+metric; collectors are callbacks evaluated at scrape time for values that
+already live elsewhere (pool stats, cache counters, queue depths).
+
+Every worker process has its own registry. With ``set_multiprocess_dir`` each
+one also writes a snapshot of its samples to that directory (at most every few
+seconds, and on every scrape), and ``render`` merges them: counters and
+histograms are summed across processes, including ones that have exited, and
+gauges are reported per live process with a ``pid`` label.
+"""
+import functools
+import inspect
+import json
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter as _TallyCounter
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labelnames: Sequence[str], values: Sequence[str], extra: Dict[str, str] = None) -> str:
+    pairs = list(zip(labelnames, values))
+    if extra:
+        pairs.extend(extra.items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        return self._values.get(key, 0.0)
+
+    def collect(self) -> "Family":
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.name, 'counter', self.documentation, [
+            (self.name, dict(zip(self.labelnames, key)), value) for key, value in items
+        ]
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # key -> [bucket counts..., sum, count]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            if index < len(self.buckets):
+                state[index] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def timed(self, **labels):
+        """Decorator form of ``time`` for plain and async functions"""
+        def decorator(func):
+            if inspect.iscoroutinefunction(func):
+                @functools.wraps(func)
+                async def async_wrapper(*args, **kwargs):
+                    with self.time(**labels):
+                        return await func(*args, **kwargs)
+                return async_wrapper
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.time(**labels):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def count(self, **labels) -> int:
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        state = self._values.get(key)
+        return state[-1] if state else 0
+
+    def collect(self) -> "Family":
+        with self._lock:
+            items = sorted((key, list(state)) for key, state in self._values.items())
+        samples = []
+        for key, state in items:
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, state):
+                cumulative += bucket_count
+                samples.append((f"{self.name}_bucket", dict(labels, le=_format_value(bound)), cumulative))
+            samples.append((f"{self.name}_bucket", dict(labels, le='+Inf'), state[-1]))
+            samples.append((f"{self.name}_sum", labels, state[-2]))
+            samples.append((f"{self.name}_count", labels, state[-1]))
+        return self.name, 'histogram', self.documentation, samples
+
+
+# A collector returns (name, type, help, [(labels dict, value), ...]) tuples
+Collector = Callable[[], Iterable[Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]]]
+# (name, type, help, [(sample name, labels dict, value), ...])
+Family = Tuple[str, str, str, List[Tuple[str, Dict[str, str], float]]]
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _render_families(families: Iterable[Family]) -> str:
+    lines = []
+    for name, metric_type, documentation, samples in families:
+        lines.append(f"# HELP {name} {documentation}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        for sample_name, labels, value in samples:
+            names = tuple(labels)
+            lines.append(f"{sample_name}{_format_labels(names, tuple(labels[n] for n in names))} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+class Registry:
+    """Metrics are get-or-create by name, so re-importing a module reuses them"""
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._collectors: Dict[str, Collector] = {}
+        self._lock = threading.Lock()
+        self.directory: Optional[str] = None
+        self.snapshot_interval = 5.0
+        self._last_snapshot = 0.0
+
+    def _get_or_create(self, name, factory):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = factory()
+            return metric
+
+    def counter(self, name, documentation, labelnames=()) -> Counter:
+        return self._get_or_create(name, lambda: Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(name, lambda: Histogram(name, documentation, labelnames, buckets))
+
+    def register_collector(self, name: str, collector: Collector):
+        """Add (or replace) a scrape-time collector under ``name``"""
+        with self._lock:
+            self._collectors[name] = collector
+
+    def collect(self) -> List[Family]:
+        """This process's samples"""
+        families = [metric.collect() for metric in list(self._metrics.values())]
+        for collector in list(self._collectors.values()):
+            try:
+                collected = list(collector())
+            except Exception:
+                continue
+            for name, metric_type, documentation, samples in collected:
+                families.append((name, metric_type, documentation,
+                                 [(name, dict(labels), value) for labels, value in samples]))
+        return families
+
+    def set_multiprocess_dir(self, directory: str, snapshot_interval: float = 5.0):
+        """Share samples with the other worker processes through ``directory``"""
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.snapshot_interval = snapshot_interval
+
+    def write_snapshot(self, families: Optional[List[Family]] = None):
+        if self.directory is None:
+            return
+        self._last_snapshot = time.monotonic()
+        path = os.path.join(self.directory, f"{os.getpid()}.json")
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(families if families is not None else self.collect(), f)
+        os.replace(tmp_path, path)
+
+    def maybe_write_snapshot(self):
+        """Write a snapshot if the last one is older than ``snapshot_interval``; cheap to call per request"""
+        if self.directory is not None and time.monotonic() - self._last_snapshot >= self.snapshot_interval:
+            self.write_snapshot()
+
+    def _merged(self, own: List[Family]) -> List[Family]:
+        merged: Dict[str, list] = {}
+        values: Dict[str, Dict[tuple, list]] = {}
+        own_pid = os.getpid()
+        for filename in sorted(os.listdir(self.directory)):
+            if not filename.endswith(".json"):
+                continue
+            pid = int(filename[:-len(".json")])
+            if pid == own_pid:
+                families = own
+            else:
+                try:
+                    with open(os.path.join(self.directory, filename)) as f:
+                        families = json.load(f)
+                except (OSError, ValueError):
+                    continue
+            alive = pid == own_pid or _pid_alive(pid)
+            for name, metric_type, documentation, samples in families:
+                merged.setdefault(name, [name, metric_type, documentation])
+                family_values = values.setdefault(name, {})
+                for sample_name, labels, value in samples:
+                    if metric_type == 'gauge':
+                        # Gauges describe a live process; they aren't summed
+                        if not alive:
+                            continue
+                        labels = dict(labels, pid=str(pid))
+                    key = (sample_name, tuple(labels.items()))
+                    if key in family_values:
+                        family_values[key][2] += value
+                    else:
+                        family_values[key] = [sample_name, labels, value]
+        return [(name, metric_type, documentation, [tuple(sample) for sample in values[name].values()])
+                for name, metric_type, documentation in merged.values()]
+
+    def render(self) -> str:
+        families = self.collect()
+        if self.directory is not None:
+            self.write_snapshot(families)
+            families = self._merged(families)
+        return _render_families(families)
+
+
+class SamplingProfiler:
+    """Samples one thread's Python stack at a fixed interval from a helper thread.
+
+    Cheap enough to switch on for a single request: the target thread is never
+    interrupted, the sampler just reads ``sys._current_frames()``.
+    """
+
+    def __init__(self, thread_id: Optional[int] = None, interval: float = 0.005, max_depth: int = 40):
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self.interval = interval
+        self.max_depth = max_depth
+        self.samples = _TallyCounter()
+        self._stop = threading.Event()
+        self._thread = None
+        self.started_at = None
+        self.duration = 0.0
+
+    def start(self):
+        self.started_at = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.duration = time.perf_counter() - self.started_at
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None and len(stack) < self.max_depth:
+                code = frame.f_code
+                stack.append(f"{code.co_filename.rsplit('/', 1)[-1]}:{code.co_name}:{frame.f_lineno}")
+                frame = frame.f_back
+            self.samples[";".join(reversed(stack))] += 1
+
+    def summary(self, top: int = 20) -> Dict:
+        """Collapsed stacks (root first) with sample counts, most frequent first"""
+        return {
+            'duration_seconds': round(self.duration, 4),
+            'interval_seconds': self.interval,
+            'total_samples': sum(self.samples.values()),
+            'stacks': [{'stack': stack, 'samples': count} for stack, count in self.samples.most_common(top)],
+        }
+
+
+class ProfileLog:
+    """Keeps the most recent request profiles for inspection"""
+
+    def __init__(self, maxlen: int = 50):
+        self._profiles = deque(maxlen=maxlen)
+
+    def add(self, profile: Dict):
+        self._profiles.append(profile)
+
+    def recent(self) -> List[Dict]:
+        return list(self._profiles)
+
+
+registry = Registry()
@@ -0,0 +1,79 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Seconds spent in each named startup phase of this process
+startup_timings: Dict[str, float] = {}
+
+
+@contextmanager
+def timed_phase(name: str):
+    """Record how long a startup phase took in ``startup_timings``"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        startup_timings[name] = round(time.perf_counter() - started, 4)
+
+
+class LazyResource:
+    """Loads an expensive object once, on first use or when ``load`` is called.
+
+    Loading is guarded by a lock so concurrent first requests share one load,
+    and the load time is recorded as a startup phase.
+    """
+
+    def __init__(self, name: str, factory: Callable[[], object]):
+        self.name = name
+        self.factory = factory
+        self._value = None
+        self._loaded = False
+        self._error: Optional[BaseException] = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    @property
+    def error(self) -> Optional[BaseException]:
+        return self._error
+
+    def get(self):
+        if self._loaded:
+            return self._value
+        with self._lock:
+            if not self._loaded:
+                try:
+                    with timed_phase(self.name):
+                        self._value = self.factory()
+                except Exception as e:
+                    self._error = e
+                    raise
+                self._error = None
+                self._loaded = True
+        return self._value
+
+    load = get
+
+    def load_in_background(self) -> threading.Thread:
+        def run():
+            try:
+                self.get()
+            except Exception as e:
+                logger.exception("Error loading %s", self.name)
+
+        thread = threading.Thread(target=run, name=f"load-{self.name}", daemon=True)
+        thread.start()
+        return thread
+
+    def status(self) -> dict:
+        return {
+            'loaded': self._loaded,
+            'load_seconds': startup_timings.get(self.name),
+            'error': str(self._error) if self._error else None,
+        }
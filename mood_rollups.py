@@ -0,0 +1,167 @@
+"""Daily and weekly per-user mood aggregates, maintained as check-ins are written.
+
+Each bucket row keeps count, sum, min and max of the mood score plus the time of
+the latest check-in with a note, so summaries read a handful of bucket rows
+instead of aggregating raw check-ins. Buckets are UTC days and ISO weeks
+(starting Monday).
+
+``backfill`` replaces every bucket. On PostgreSQL it locks the check-in table
+against inserts while it runs, so check-ins written meanwhile wait and are then
+merged into the rebuilt buckets; on other databases check-in writes must be
+stopped for the duration, or they can be lost from or counted twice in the
+rollups.
+"""
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import case, delete, select, text
+from sqlalchemy.exc import IntegrityError
+
+PERIODS = ('daily', 'weekly')
+
+
+def bucket_start(created_at: datetime, period: str) -> date:
+    if created_at.tzinfo is not None:
+        created_at = created_at.astimezone(timezone.utc)
+    day = created_at.date()
+    if period == 'weekly':
+        return day - timedelta(days=day.weekday())
+    return day
+
+
+class _Bucket:
+    __slots__ = ('count', 'total', 'low', 'high', 'last_note_at')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.low = None
+        self.high = None
+        self.last_note_at = None
+
+    def add(self, mood: int, note: Optional[str], created_at: datetime):
+        self.count += 1
+        self.total += mood
+        self.low = mood if self.low is None else min(self.low, mood)
+        self.high = mood if self.high is None else max(self.high, mood)
+        if note and (self.last_note_at is None or created_at > self.last_note_at):
+            self.last_note_at = created_at
+
+    def merge(self, other: '_Bucket'):
+        self.count += other.count
+        self.total += other.total
+        self.low = other.low if self.low is None else min(self.low, other.low)
+        self.high = other.high if self.high is None else max(self.high, other.high)
+        if other.last_note_at is not None and (
+            self.last_note_at is None or other.last_note_at > self.last_note_at
+        ):
+            self.last_note_at = other.last_note_at
+
+
+def aggregate(rows: Iterable, period: str) -> Dict[Tuple[int, date], _Bucket]:
+    """Fold check-in rows (mappings with user_id, mood, note, created_at) into buckets"""
+    buckets: Dict[Tuple[int, date], _Bucket] = {}
+    for row in rows:
+        key = (row['user_id'], bucket_start(row['created_at'], period))
+        bucket = buckets.get(key)
+        if bucket is None:
+            bucket = buckets[key] = _Bucket()
+        bucket.add(row['mood'], row['note'], row['created_at'])
+    return buckets
+
+
+class MoodRollups:
+    def __init__(self, daily_table, weekly_table):
+        self.tables = {'daily': daily_table, 'weekly': weekly_table}
+
+    def apply(self, conn, rows: List[Dict]):
+        """Add newly inserted check-ins to their buckets; usable as a write-behind insert hook"""
+        for period, table in self.tables.items():
+            for (user_id, start), bucket in aggregate(rows, period).items():
+                self._merge(conn, table, user_id, start, bucket)
+
+    def _merge(self, conn, table, user_id, start, bucket: _Bucket):
+        c = table.c
+        values = {
+            'checkin_count': c.checkin_count + bucket.count,
+            'mood_sum': c.mood_sum + bucket.total,
+            'mood_min': case((c.mood_min > bucket.low, bucket.low), else_=c.mood_min),
+            'mood_max': case((c.mood_max < bucket.high, bucket.high), else_=c.mood_max),
+        }
+        if bucket.last_note_at is not None:
+            values['last_note_at'] = case(
+                (c.last_note_at.is_(None), bucket.last_note_at),
+                (c.last_note_at < bucket.last_note_at, bucket.last_note_at),
+                else_=c.last_note_at,
+            )
+        update = table.update().where(c.user_id == user_id, c.bucket_start == start).values(values)
+        if conn.execute(update).rowcount:
+            return
+        try:
+            # In a savepoint, so losing the race for a new bucket doesn't roll
+            # back the caller's transaction (and the check-ins in it)
+            with conn.begin_nested():
+                conn.execute(table.insert().values(self._row(user_id, start, bucket)))
+        except IntegrityError:
+            # Another worker created the bucket first
+            conn.execute(update)
+
+    @staticmethod
+    def _row(user_id, start, bucket: _Bucket) -> Dict:
+        return {
+            'user_id': user_id,
+            'bucket_start': start,
+            'checkin_count': bucket.count,
+            'mood_sum': bucket.total,
+            'mood_min': bucket.low,
+            'mood_max': bucket.high,
+            'last_note_at': bucket.last_note_at,
+        }
+
+    def backfill(self, conn, checkins_table, batch_size: int = 1000) -> int:
+        """Rebuild every bucket from raw check-ins; returns the number of check-ins read.
+
+        See the module docstring for concurrent check-in writes.
+        """
+        if conn.dialect.name == 'postgresql':
+            name = conn.dialect.identifier_preparer.format_table(checkins_table)
+            conn.execute(text(f"LOCK TABLE {name} IN SHARE MODE"))
+        c = checkins_table.c
+        result = conn.execution_options(stream_results=True, yield_per=batch_size).execute(
+            select(c.user_id, c.mood, c.note, c.created_at).where(c.created_at.isnot(None))
+        )
+        buckets = {period: {} for period in self.tables}
+        seen = 0
+        for partition in result.mappings().partitions():
+            seen += len(partition)
+            for period in self.tables:
+                for key, bucket in aggregate(partition, period).items():
+                    buckets[period].setdefault(key, _Bucket()).merge(bucket)
+
+        for period, table in self.tables.items():
+            conn.execute(delete(table))
+            rows = [self._row(user_id, start, bucket) for (user_id, start), bucket in buckets[period].items()]
+            if rows:
+                conn.execute(table.insert(), rows)
+        return seen
+
+    def summary(self, conn, user_id: int, period: str = 'daily', limit: int = 30) -> List[Dict]:
+        """Most recent ``limit`` buckets for a user, newest first"""
+        table = self.tables[period]
+        rows = conn.execute(
+            select(table)
+            .where(table.c.user_id == user_id)
+            .order_by(table.c.bucket_start.desc())
+            .limit(limit)
+        ).fetchall()
+        return [
+            {
+                'bucket_start': row.bucket_start.isoformat(),
+                'count': row.checkin_count,
+                'mean': round(row.mood_sum / row.checkin_count, 3) if row.checkin_count else None,
+                'min': row.mood_min,
+                'max': row.mood_max,
+                'last_note_at': row.last_note_at.isoformat() if row.last_note_at else None,
+            }
+            for row in rows
+        ]
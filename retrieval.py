@@ -0,0 +1,330 @@
+"""Per-user semantic retrieval over journal entries and past chat messages.
+
+Text is embedded once when it is written (through a micro-batcher, with a
+content-hash cache so identical text is never re-embedded) and added to a
+persisted vector index with one collection per user. At prompt time the user's
+message is embedded and the nearest snippets are trimmed to a character budget.
+"""
+import hashlib
+import logging
+import math
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Sequence
+
+from batching import MicroBatcher
+from context_cache import ContextCache
+from model_loader import LazyResource
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(" ".join(text.split()).encode("utf-8")).hexdigest()
+
+
+class SentenceTransformerEmbedder:
+    name = "sentence_transformers"
+
+    def __init__(self, model_name: str = EMBEDDING_MODEL_NAME):
+        from sentence_transformers import SentenceTransformer
+
+        self.model = SentenceTransformer(model_name, device="cpu")
+
+    def encode(self, texts: List[str]) -> List[List[float]]:
+        vectors = self.model.encode(texts, batch_size=len(texts), normalize_embeddings=True)
+        return [vector.tolist() for vector in vectors]
+
+
+class HashingEmbedder:
+    """Bag-of-words feature hashing; a dependency-free stand-in for benchmarks and tests"""
+
+    name = "hashing"
+
+    def __init__(self, dim: int = 256):
+        self.dim = dim
+
+    def encode(self, texts):
+        vectors = []
+        for text in texts:
+            vector = [0.0] * self.dim
+            for word in re.findall(r"\w+", text.lower()):
+                vector[int(hashlib.md5(word.encode()).hexdigest(), 16) % self.dim] += 1.0
+            norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+            vectors.append([v / norm for v in vector])
+        return vectors
+
+
+def create_embedder(name: str):
+    if name == "sentence_transformers":
+        return SentenceTransformerEmbedder(os.getenv("EMBEDDING_MODEL", EMBEDDING_MODEL_NAME))
+    if name == "hashing":
+        return HashingEmbedder()
+    raise ValueError(f"Unknown embedder: {name}")
+
+
+class MemoryIndex:
+    """Brute-force cosine index kept in process memory"""
+
+    def __init__(self):
+        self._users: Dict[int, Dict[str, tuple]] = {}
+        self._lock = threading.Lock()
+
+    def existing_ids(self, user_id: int, ids: Sequence[str]) -> set:
+        with self._lock:
+            entries = self._users.get(user_id, {})
+            return {i for i in ids if i in entries}
+
+    def add(self, user_id: int, ids, vectors, documents, metadatas):
+        with self._lock:
+            entries = self._users.setdefault(user_id, {})
+            for item in zip(ids, vectors, documents, metadatas):
+                entries[item[0]] = item[1:]
+
+    def query(self, user_id: int, vector, k: int) -> List[Dict]:
+        with self._lock:
+            entries = list(self._users.get(user_id, {}).values())
+        scored = [
+            {'text': document, 'kind': metadata.get('kind'), 'distance': 1.0 - sum(a * b for a, b in zip(vector, stored))}
+            for stored, document, metadata in entries
+        ]
+        return sorted(scored, key=lambda hit: hit['distance'])[:k]
+
+    def count(self) -> int:
+        with self._lock:
+            return sum(len(entries) for entries in self._users.values())
+
+
+def lock_index_path(path: str):
+    """Hold an exclusive lock on an on-disk index for the life of the process; raises if another process has it"""
+    import fcntl
+
+    os.makedirs(path, exist_ok=True)
+    lock_file = open(os.path.join(path, "index.lock"), "w")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        raise RuntimeError(
+            f"The retrieval index at {path} is already open in another process; with several workers "
+            "set RETRIEVAL_CHROMA_HOST to share a chroma server"
+        )
+    return lock_file
+
+
+class ChromaIndex:
+    """One chromadb collection per user, persisted under ``path`` (or on a chroma server)"""
+
+    def __init__(self, path: str, host: Optional[str] = None, port: int = 8000):
+        import chromadb
+
+        self._path_lock = None
+        if host:
+            self.client = chromadb.HttpClient(host=host, port=port)
+        else:
+            # Processes sharing an on-disk index don't see each other's writes
+            # and can corrupt it, so only one process may open it; in the
+            # others retrieval reports itself unavailable
+            self._path_lock = lock_index_path(path)
+            self.client = chromadb.PersistentClient(path=path)
+        self._collections = {}
+        self._lock = threading.Lock()
+
+    def _collection(self, user_id: int):
+        collection = self._collections.get(user_id)
+        if collection is None:
+            with self._lock:
+                collection = self._collections.get(user_id)
+                if collection is None:
+                    collection = self._collections[user_id] = self.client.get_or_create_collection(
+                        f"user_{user_id}", metadata={"hnsw:space": "cosine"}
+                    )
+        return collection
+
+    def existing_ids(self, user_id, ids):
+        return set(self._collection(user_id).get(ids=list(ids), include=[])['ids'])
+
+    def add(self, user_id, ids, vectors, documents, metadatas):
+        self._collection(user_id).upsert(ids=list(ids), embeddings=vectors, documents=documents, metadatas=metadatas)
+
+    def query(self, user_id, vector, k):
+        collection = self._collection(user_id)
+        result = collection.query(query_embeddings=[vector], n_results=k, include=["documents", "metadatas", "distances"])
+        return [
+            {'text': document, 'kind': (metadata or {}).get('kind'), 'distance': distance}
+            for document, metadata, distance in zip(result['documents'][0], result['metadatas'][0], result['distances'][0])
+        ]
+
+    def count(self) -> int:
+        return sum(collection.count() for collection in list(self._collections.values()))
+
+
+def create_index(name: str):
+    if name == "chroma":
+        return ChromaIndex(
+            os.getenv("RETRIEVAL_PATH", "data/retrieval"),
+            host=os.getenv("RETRIEVAL_CHROMA_HOST") or None,
+            port=int(os.getenv("RETRIEVAL_CHROMA_PORT", "8000")),
+        )
+    if name == "memory":
+        return MemoryIndex()
+    raise ValueError(f"Unknown retrieval index: {name}")
+
+
+def select_snippets(hits: List[Dict], max_chars: int, exclude: Sequence[str] = (),
+                    max_distance: Optional[float] = None) -> List[str]:
+    """Nearest-first snippets that fit in ``max_chars``, skipping text already in the prompt"""
+    skip = {" ".join(text.split()) for text in exclude}
+    snippets, used = [], 0
+    for hit in hits:
+        text = " ".join(hit['text'].split())
+        if not text or text in skip or (max_distance is not None and hit['distance'] > max_distance):
+            continue
+        remaining = max_chars - used
+        if remaining < 40:
+            break
+        if len(text) > remaining:
+            text = text[:remaining - 3].rsplit(" ", 1)[0] + "..."
+        snippets.append(text)
+        used += len(text)
+    return snippets
+
+
+class Retriever:
+    """Embeds and indexes user text off the request path and answers top-k queries"""
+
+    def __init__(self, embedder_factory, index_factory, top_k: int = 3, max_chars: int = 600,
+                 max_distance: Optional[float] = None, query_timeout: float = 0.05,
+                 cache_entries: int = 10000, batch_size: int = 32, window_ms: float = 2.0):
+        self._embedder = LazyResource("embedding_model", embedder_factory)
+        self._index = LazyResource("retrieval_index", index_factory)
+        self.top_k = top_k
+        self.max_chars = max_chars
+        self.max_distance = max_distance
+        self.query_timeout = query_timeout
+        # Keyed by content hash, so repeated text (and the query embedding of a
+        # message that is indexed right after) is embedded once
+        self.cache = ContextCache(max_entries=cache_entries, ttl_seconds=None, max_bytes=None, sizeof=lambda v: 0)
+        self.batcher = MicroBatcher(
+            lambda texts: self._embedder.get().encode(texts),
+            max_batch_size=batch_size, window_ms=window_ms, name="embedding",
+        )
+        # One indexing thread keeps writes ordered and off the request thread
+        self._indexer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="retrieval-index")
+        self._warming = False
+        self.indexed = 0
+        self.failures = 0
+
+    @property
+    def ready(self) -> bool:
+        return self._embedder.loaded
+
+    @property
+    def unavailable(self) -> bool:
+        # A failed load (e.g. the optional dependencies aren't installed) is not
+        # retried on every write; restart the process to try again
+        return self._embedder.error is not None or self._index.error is not None
+
+    # Only the model is loaded up front: it is safe to share across a fork, while
+    # the index holds connections and files and is opened in each worker on first use
+    def load(self):
+        self._embedder.load()
+
+    def load_in_background(self):
+        self._embedder.load_in_background()
+
+    def status(self) -> Dict:
+        return {'embedding_model': self._embedder.status(), 'retrieval_index': self._index.status()}
+
+    def embed(self, texts: List[str], timeout: Optional[float] = None) -> List[List[float]]:
+        keys = [content_hash(text) for text in texts]
+        vectors = [self.cache.get(key) for key in keys]
+        futures = {
+            i: self.batcher.submit_async(text)
+            for i, (text, vector) in enumerate(zip(texts, vectors)) if vector is None
+        }
+        for i, future in futures.items():
+            vectors[i] = future.result(timeout=timeout)
+            self.cache.put(keys[i], vectors[i])
+        return vectors
+
+    def add(self, user_id: int, text: str, kind: str):
+        """Queue text for indexing; returns immediately"""
+        if not text or not text.strip():
+            return None
+        return self._indexer.submit(self._add, user_id, text, kind)
+
+    def wait(self):
+        """Block until everything queued with ``add`` has been indexed"""
+        self._indexer.submit(lambda: None).result()
+
+    def _add(self, user_id, text, kind):
+        if self.unavailable:
+            return
+        try:
+            self.index_many([(user_id, text, kind)])
+        except Exception:
+            self.failures += 1
+            logger.exception("Error indexing %s for user %s", kind, user_id)
+
+    def index_many(self, items: Sequence) -> int:
+        """Embed and index ``(user_id, text, kind)`` items not already indexed; returns how many were added"""
+        index = self._index.get()
+        by_user: Dict[int, Dict[str, tuple]] = {}
+        for user_id, text, kind in items:
+            if text and text.strip():
+                by_user.setdefault(user_id, {})[content_hash(text)] = (text, kind)
+        pending = []
+        for user_id, docs in by_user.items():
+            existing = index.existing_ids(user_id, list(docs))
+            pending.extend((user_id, key, text, kind) for key, (text, kind) in docs.items() if key not in existing)
+        if not pending:
+            return 0
+        vectors = self.embed([text for _, _, text, _ in pending])
+        for user_id in {user_id for user_id, _, _, _ in pending}:
+            rows = [(key, vector, text, kind) for (uid, key, text, kind), vector in zip(pending, vectors) if uid == user_id]
+            index.add(
+                user_id,
+                [row[0] for row in rows],
+                [row[1] for row in rows],
+                [row[2] for row in rows],
+                [{'kind': row[3]} for row in rows],
+            )
+        self.indexed += len(pending)
+        return len(pending)
+
+    def search(self, user_id: int, query: str, exclude: Sequence[str] = ()) -> List[str]:
+        """Relevant snippets for the prompt, or [] if retrieval isn't loaded yet, failed to load or is too slow"""
+        if self.unavailable:
+            # Don't retry a failed load on every turn
+            return []
+        if not self.ready:
+            if not self._warming and not self.unavailable:
+                # Lazy mode: load in the background and start answering once ready
+                self._warming = True
+                self._embedder.load_in_background()
+            return []
+        if not query.strip():
+            return []
+        try:
+            vector, = self.embed([query], timeout=self.query_timeout)
+            hits = self._index.get().query(user_id, vector, self.top_k + len(exclude))
+        except Exception as e:
+            logger.warning("Retrieval skipped for user %s: %s", user_id, e)
+            self.failures += 1
+            return []
+        return select_snippets(hits, self.max_chars, exclude=exclude, max_distance=self.max_distance)[:self.top_k]
+
+    def stats(self) -> Dict:
+        return {
+            'ready': self.ready,
+            'indexed': self.indexed,
+            'failures': self.failures,
+            'documents': self._index.get().count() if self._index.loaded else 0,
+            'embedding_cache': self.cache.stats(),
+            'embedding_batcher': self.batcher.stats(),
+        }
@@ -0,0 +1,125 @@
+"""Rolling conversation summaries, compacted off the request path.
+
+Once enough turns have built up past a user's summary, the older ones are folded
+into a bounded summary by a background thread, so prompts carry the summary plus
+a few recent turns no matter how long the conversation gets.
+"""
+import logging
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# (user message, bot response) pairs, oldest first
+Turns = List[Tuple[str, Optional[str]]]
+
+SUMMARY_PROMPT = """You maintain a private running summary of a supportive conversation so it can continue later.
+Update the summary with the new exchanges. Keep what matters emotionally: people, events,
+recurring worries, coping strategies that helped, and how the user's mood has changed.
+Write it in the third person, plain prose, at most {max_chars} characters. Reply with the summary only.
+
+Current summary:
+{summary}
+
+New exchanges:
+{turns}
+
+Updated summary:"""
+
+
+def _first_sentence(text: str, limit: int = 160) -> str:
+    sentence = re.split(r"(?<=[.!?])\s", " ".join(text.split()), maxsplit=1)[0]
+    return sentence if len(sentence) <= limit else sentence[:limit - 3].rsplit(" ", 1)[0] + "..."
+
+
+def _fit(text: str, max_chars: int) -> str:
+    # Drop whole sentences from the front so the newest context survives
+    while len(text) > max_chars and ". " in text:
+        text = text.split(". ", 1)[1]
+    return text[-max_chars:]
+
+
+def extractive_summary(previous: Optional[str], turns: Turns, max_chars: int) -> str:
+    """Local stand-in: the opening sentence of each user message, newest kept when over budget"""
+    points = [_first_sentence(message) for message, _ in turns if message and message.strip()]
+    parts = ([previous] if previous else []) + [f"They said: {point}" for point in points]
+    return _fit(" ".join(parts), max_chars)
+
+
+def llm_summary(llm, previous: Optional[str], turns: Turns, max_chars: int) -> str:
+    transcript = "\n".join(
+        f"User: {message}" + (f"\nSupporter: {response}" if response else "")
+        for message, response in turns
+    )
+    prompt = SUMMARY_PROMPT.format(max_chars=max_chars, summary=previous or "(none yet)", turns=transcript)
+    return _fit(llm.invoke(prompt).content.strip(), max_chars)
+
+
+class Compactor:
+    """Schedules at most one background compaction per user at a time.
+
+    ``load_turns(user_id, after_seq, upto_seq)`` returns the turns to fold in and
+    ``apply(user_id, summary, upto_seq)`` stores the result.
+    """
+
+    def __init__(
+        self,
+        summarize: Callable[[Optional[str], Turns], str],
+        load_turns: Callable[[int, int, int], Turns],
+        apply: Callable[[int, str, int], None],
+        keep_turns: int = 3,
+        every_turns: int = 6,
+    ):
+        self.summarize = summarize
+        self.load_turns = load_turns
+        self.apply = apply
+        self.keep_turns = keep_turns
+        self.every_turns = every_turns
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="compaction")
+        self._in_flight = set()
+        self._lock = threading.Lock()
+
+        self.compactions = 0
+        self.turns_compacted = 0
+        self.failures = 0
+
+    def due(self, context: Dict) -> bool:
+        unsummarized = context.get('last_seq', 0) - (context.get('summarized_seq') or 0)
+        return unsummarized >= self.keep_turns + self.every_turns
+
+    def maybe_schedule(self, user_id: int, context: Dict):
+        """Queue compaction if enough turns are past the summary; returns the future or None"""
+        if not self.due(context):
+            return None
+        with self._lock:
+            if user_id in self._in_flight:
+                return None
+            self._in_flight.add(user_id)
+        after_seq = context.get('summarized_seq') or 0
+        upto_seq = context['last_seq'] - self.keep_turns
+        return self._executor.submit(self._compact, user_id, context.get('summary'), after_seq, upto_seq)
+
+    def _compact(self, user_id, previous, after_seq, upto_seq):
+        try:
+            turns = self.load_turns(user_id, after_seq, upto_seq)
+            if turns:
+                self.apply(user_id, self.summarize(previous, turns), upto_seq)
+                self.compactions += 1
+                self.turns_compacted += len(turns)
+        except Exception:
+            self.failures += 1
+            logger.exception("Error compacting conversation for user %s", user_id)
+        finally:
+            with self._lock:
+                self._in_flight.discard(user_id)
+
+    def stats(self) -> Dict:
+        return {
+            'compactions': self.compactions,
+            'turns_compacted': self.turns_compacted,
+            'failures': self.failures,
+            'in_flight': len(self._in_flight),
+            'config': {'keep_turns': self.keep_turns, 'every_turns': self.every_turns},
+        }
@@ -0,0 +1,164 @@
+"""Offline emotion tagging of journal entries.
+
+Untagged rows are read in keyset chunks (``id > last_id ORDER BY id LIMIT n``)
+rather than through one long-lived cursor, so no transaction stays open for the
+hours a large backfill takes and the job never holds locks live writes wait on.
+Each chunk is split into batches that run on a pool of processes, each of which
+loads its own copy of the model once, and the labels go back in one bulk UPDATE
+per chunk. After every chunk the last id is written to a checkpoint file, so an
+interrupted run resumes where it stopped.
+"""
+import json
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import bindparam, select
+
+from emotion_backends import create_backend
+
+logger = logging.getLogger(__name__)
+
+_backend = None
+
+
+def _init_worker(backend_name: str, threads: int, nice: int):
+    """Load one model copy per worker process"""
+    global _backend
+    if nice:
+        os.nice(nice)
+    if threads:
+        try:
+            import torch
+
+            torch.set_num_threads(threads)
+        except ImportError:
+            pass
+    _backend = create_backend(backend_name)
+
+
+def _classify(texts: List[str]) -> List[List[Dict]]:
+    return _backend.classify(texts)
+
+
+class Checkpoint:
+    """Last tagged id and running count, in a JSON file replaced atomically"""
+
+    def __init__(self, path: Optional[str]):
+        self.path = path
+        self.last_id = 0
+        self.tagged = 0
+        if path and os.path.exists(path):
+            with open(path) as f:
+                state = json.load(f)
+            self.last_id = state.get('last_id', 0)
+            self.tagged = state.get('tagged', 0)
+
+    def save(self, last_id: int, tagged: int):
+        self.last_id, self.tagged = last_id, tagged
+        if not self.path:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({'last_id': last_id, 'tagged': tagged}, f)
+        os.replace(tmp_path, self.path)
+
+
+class JournalTagger:
+    def __init__(
+        self,
+        engine,
+        table,
+        label_fn: Callable[[List[Dict]], str],
+        backend: str = "transformers",
+        workers: int = 2,
+        threads_per_worker: int = 1,
+        nice: int = 10,
+        chunk_size: int = 1000,
+        batch_size: int = 64,
+        max_chars: int = 1500,
+    ):
+        self.engine = engine
+        self.table = table
+        self.label_fn = label_fn
+        self.backend = backend
+        self.workers = workers
+        self.threads_per_worker = threads_per_worker
+        self.nice = nice
+        self.chunk_size = chunk_size
+        self.batch_size = batch_size
+        # The classifier only sees the first ~512 tokens anyway
+        self.max_chars = max_chars
+
+    def _fetch_chunk(self, after_id: int):
+        table = self.table
+        with self.engine.connect() as conn:
+            return conn.execute(
+                select(table.c.id, table.c.content)
+                .where(table.c.emotion.is_(None), table.c.id > after_id)
+                .order_by(table.c.id)
+                .limit(self.chunk_size)
+            ).fetchall()
+
+    def _submit(self, pool, rows):
+        texts = [(row.content or "")[:self.max_chars] for row in rows]
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        if pool is None:
+            return [_classify(batch) for batch in batches]
+        return [pool.submit(_classify, batch) for batch in batches]
+
+    def _write(self, rows, results):
+        table = self.table
+        params = []
+        for row, scores in zip(rows, results):
+            top = max(scores, key=lambda s: s['score'])
+            params.append({'_id': row.id, 'emotion': self.label_fn(scores), 'emotion_score': float(top['score'])})
+        with self.engine.begin() as conn:
+            conn.execute(
+                table.update()
+                .where(table.c.id == bindparam('_id'))
+                .values(emotion=bindparam('emotion'), emotion_score=bindparam('emotion_score')),
+                params,
+            )
+
+    def run(self, checkpoint: Checkpoint, limit: Optional[int] = None) -> int:
+        """Tag untagged entries after the checkpoint; returns how many were tagged in this run"""
+        pool = None
+        if self.workers > 0:
+            pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(self.backend, self.threads_per_worker, self.nice),
+            )
+        else:
+            _init_worker(self.backend, 0, 0)
+
+        tagged = 0
+        started = time.monotonic()
+        try:
+            rows = self._fetch_chunk(checkpoint.last_id)
+            while rows and (limit is None or tagged < limit):
+                if limit is not None:
+                    rows = rows[:limit - tagged]
+                pending = self._submit(pool, rows)
+                # Read the next chunk while this one is classified
+                next_rows = self._fetch_chunk(rows[-1].id)
+                results = [scores for batch in pending
+                           for scores in (batch if pool is None else batch.result())]
+                self._write(rows, results)
+                tagged += len(rows)
+                checkpoint.save(rows[-1].id, checkpoint.tagged + len(rows))
+                logger.info("Tagged %d journal entries (up to id %d, %.1f/s)",
+                            tagged, rows[-1].id, tagged / max(time.monotonic() - started, 1e-9))
+                rows = next_rows
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+        return tagged
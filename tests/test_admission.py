@@ -0,0 +1,45 @@
+from admission import AdmissionController, LocalBucketStore
+
+
+def test_bucket_allows_burst_then_reports_wait():
+    store = LocalBucketStore()
+    assert [store.take("k", rate=1.0, burst=3)[0] for _ in range(3)] == [True, True, True]
+    allowed, wait = store.take("k", rate=1.0, burst=3)
+    assert not allowed and 0 < wait <= 1.0
+    assert store.take("other", rate=1.0, burst=3)[0]
+
+
+def test_bucket_store_is_bounded():
+    store = LocalBucketStore(max_keys=2)
+    for key in "abc":
+        store.take(key, rate=1.0, burst=1)
+    assert len(store) == 2
+    # "a" was evicted, so it starts with a full bucket again
+    assert store.take("a", rate=1.0, burst=1)[0]
+
+
+def test_controller_limits_per_user_and_per_ip():
+    admission = AdmissionController(user_rate=0.01, user_burst=2, ip_rate=0.01, ip_burst=3, max_inflight=0)
+    assert admission.admit(1, "10.0.0.1").allowed
+    assert admission.admit(1, "10.0.0.1").allowed
+    decision = admission.admit(1, "10.0.0.1")
+    assert (decision.allowed, decision.status, decision.reason) == (False, 429, "user_rate")
+    assert int(decision.retry_after_header) >= 1
+
+    assert admission.admit(2, "10.0.0.1").allowed
+    assert admission.admit(2, "10.0.0.1").reason == "ip_rate"
+    assert admission.admit(2, "10.0.0.2").allowed
+
+
+def test_controller_sheds_beyond_inflight_cap():
+    admission = AdmissionController(user_rate=0, ip_rate=0, max_inflight=1)
+    first = admission.admit(1, None)
+    assert first.allowed
+    second = admission.admit(2, None)
+    assert (second.allowed, second.status, second.reason) == (False, 503, "overloaded")
+
+    first.release()
+    first.release()
+    assert admission.inflight == 0
+    assert admission.admit(2, None).allowed
+    assert admission.stats()["rejected"]["overloaded"] == 1
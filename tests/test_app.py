@@ -79,3 +79,343 @@ def test_mood_checkin_and_journal_flow(client):
     assert "entries" in data
     assert len(data["entries"]) == 1
     assert data["entries"][0]["title"] == "Day log"
+
+
+def test_chat_stream_requires_login(client):
+    response = client.post("/chat/stream", json={"message": "hello"})
+    assert response.status_code == 401
+
+
+def test_chat_stream_sends_sse_events(client, monkeypatch):
+    import app as app_module
+
+    def fake_stream(user_id, message):
+        yield "token", {"content": "Hi "}
+        yield "token", {"content": "there"}
+        yield "done", {"response": "Hi there", "emotion": "joy", "interactive_options": []}
+
+    monkeypatch.setattr(app_module.chatbot, "stream_contextual_response", fake_stream)
+    signup(client, username="streamer", email="stream@example.com")
+    login(client, username="streamer")
+
+    response = client.post("/chat/stream", json={"message": "hello"})
+    assert response.status_code == 200
+    assert response.mimetype == "text/event-stream"
+    body = response.get_data(as_text=True)
+    assert body.count("event: token") == 2
+    assert 'event: done\ndata: {"response": "Hi there"' in body
+
+
+def test_legacy_chat_history_migration(client):
+    import json
+
+    import app as app_module
+
+    db_session = app_module.SessionLocal()
+    db_session.execute(
+        app_module.user_chat_history_table.insert().values(
+            user_id=7,
+            chat_history=json.dumps({
+                "emotional_history": ["first", "second"],
+                "current_emotion": "joy",
+                "conversation_depth": 2,
+                "last_topic": None,
+            }),
+        )
+    )
+    db_session.commit()
+    db_session.close()
+
+    assert app_module.migrate_legacy_chat_history() == 1
+    assert app_module.migrate_legacy_chat_history() == 0
+
+    context = app_module.chatbot.get_user_context(7)
+    assert context["emotional_history"] == ["first", "second"]
+    assert context["conversation_depth"] == 2
+    assert context["last_seq"] == 2
+
+    app_module.chatbot.complete_turn(7, context, "third", "reply", "neutral")
+    app_module.persist_executor.wait(7, timeout=5)
+    assert context["last_seq"] == 3
+    assert app_module.context_store.load(7).emotional_history == ["first", "second", "third"]
+
+
+def test_ready_reports_lazy_model_status(client):
+    response = client.get("/ready")
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data["load_mode"] == "lazy"
+    assert data["models"]["emotion_model"]["loaded"] is False
+    assert "db_init" in data["startup_timings"]
+
+
+def test_metrics_endpoint_exposes_request_and_pool_metrics(client):
+    client.get("/health")
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    text = response.get_data(as_text=True)
+    assert 'http_request_seconds_count{endpoint="/health",method="GET",status="200"}' in text
+    assert "db_pool_connections" in text
+    assert "context_cache_hits_total" in text
+
+
+def test_columns_added_by_another_worker_are_not_an_error(client, monkeypatch):
+    import app as app_module
+
+    # This worker inspected the table before another one added the column
+    real_missing_columns = app_module._missing_columns
+    stale = iter([[(app_module.chat_state_table, app_module.chat_state_table.c.summary)]])
+    monkeypatch.setattr(app_module, "_missing_columns", lambda conn: next(stale, None) or real_missing_columns(conn))
+    app_module.add_missing_columns()
+
+
+def test_profiles_need_the_admin_token(client, monkeypatch):
+    import app as app_module
+
+    monkeypatch.setattr(app_module, "PROFILING_ENABLED", True)
+    assert client.get("/metrics/profiles").status_code == 403
+
+    monkeypatch.setattr(app_module, "ADMIN_TOKEN", "s3cret")
+    assert client.get("/metrics/profiles", headers={"Authorization": "Bearer wrong"}).status_code == 403
+    response = client.get("/metrics/profiles", headers={"Authorization": "Bearer s3cret"})
+    assert response.status_code == 200
+    assert response.get_json() == {"profiles": []}
+
+
+def test_journal_and_checkin_keyset_pagination(client):
+    signup(client, username="pager", email="pager@example.com")
+    login(client, username="pager")
+
+    for i in range(5):
+        client.post("/journal", json={"title": f"Entry {i}", "content": "text"})
+        client.post("/checkin", json={"mood": (i % 5) + 1})
+
+    first = client.get("/journal?limit=2").get_json()
+    assert [e["title"] for e in first["entries"]] == ["Entry 4", "Entry 3"]
+    second = client.get(f"/journal?limit=2&before={first['next_before']}").get_json()
+    assert [e["title"] for e in second["entries"]] == ["Entry 2", "Entry 1"]
+    last = client.get(f"/journal?limit=2&before={second['next_before']}").get_json()
+    assert [e["title"] for e in last["entries"]] == ["Entry 0"]
+    assert last["next_before"] is None
+
+    checkins = client.get("/checkin?limit=3").get_json()
+    assert [c["mood"] for c in checkins["checkins"]] == [5, 4, 3]
+    rest = client.get(f"/checkin?before={checkins['next_before']}").get_json()
+    assert [c["mood"] for c in rest["checkins"]] == [2, 1]
+
+    assert client.get("/journal?limit=500").status_code == 400
+    assert client.get("/checkin?before=abc").status_code == 400
+
+
+def test_mood_summary_rollups_match_backfill(client):
+    import app as app_module
+
+    signup(client, username="moody", email="moody@example.com")
+    login(client, username="moody")
+
+    for mood, note in [(2, ""), (4, "better"), (3, "")]:
+        client.post("/checkin", json={"mood": mood, "note": note})
+
+    daily = client.get("/mood/summary").get_json()
+    assert daily["period"] == "daily"
+    assert len(daily["buckets"]) == 1
+    bucket = daily["buckets"][0]
+    assert (bucket["count"], bucket["mean"], bucket["min"], bucket["max"]) == (3, 3.0, 2, 4)
+    assert bucket["last_note_at"] is not None
+
+    weekly = client.get("/mood/summary?period=weekly").get_json()
+    assert weekly["buckets"][0]["count"] == 3
+    assert client.get("/mood/summary?period=monthly").status_code == 400
+
+    result = app_module.app.test_cli_runner().invoke(args=["backfill-mood-rollups"])
+    assert "from 3 check-ins" in result.output
+    assert client.get("/mood/summary").get_json() == daily
+
+
+def test_long_conversations_are_compacted_into_a_summary(client, monkeypatch):
+    import app as app_module
+
+    monkeypatch.setattr(app_module, "SUMMARY_BACKEND", "extractive")
+    chatbot = app_module.chatbot
+    context = chatbot.get_user_context(42)
+    for i in range(12):
+        chatbot.complete_turn(42, context, f"Turn {i} happened.", "reply", "neutral")
+        app_module.persist_executor.wait(42, timeout=5)
+        chatbot.compactor._executor.submit(lambda: None).result(timeout=5)
+
+    # Compaction kicks in at 9 unsummarized turns and keeps the newest 3 out of the summary
+    assert context["summarized_seq"] == 6
+    assert "Turn 0 happened." in context["summary"] and "Turn 6" not in context["summary"]
+    assert context["emotional_history"] == [f"Turn {i} happened." for i in range(6, 12)]
+    prompt_history = chatbot.recent_messages(context)
+    assert prompt_history == context["emotional_history"]
+
+    # A fresh load only reads messages the summary doesn't cover
+    app_module.write_queue.flush()
+    chatbot.user_conversations.clear()
+    reloaded = chatbot.get_user_context(42)
+    assert reloaded["summary"] == context["summary"]
+    assert reloaded["emotional_history"] == context["emotional_history"]
+
+
+def test_init_db_adds_columns_to_existing_tables(tmp_path, monkeypatch):
+    import importlib
+    import sqlite3
+
+    db_path = tmp_path / "old.db"
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("CREATE TABLE chat_state (user_id INTEGER PRIMARY KEY, current_emotion VARCHAR(20), "
+                     "conversation_depth INTEGER NOT NULL, last_topic VARCHAR(200), last_seq INTEGER NOT NULL, "
+                     "last_updated DATETIME)")
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{db_path}")
+    import app as app_module
+
+    importlib.reload(app_module)
+    with sqlite3.connect(db_path) as conn:
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(chat_state)")}
+    assert {"summary", "summarized_seq"} <= columns
+
+
+def test_repeated_messages_skip_the_emotion_classifier(client, monkeypatch):
+    import app as app_module
+
+    chatbot = app_module.chatbot
+    calls = []
+
+    def classify(messages):
+        calls.extend(messages)
+        return [[{"label": "joy", "score": 0.9}, {"label": "sadness", "score": 0.1}] for _ in messages]
+
+    monkeypatch.setattr(chatbot.emotion_batcher, "batch_fn", classify)
+    assert chatbot.detect_emotion("Tell me more") == "joy"
+    assert chatbot.detect_emotion("tell me  more") == "joy"
+    assert calls == ["Tell me more"]
+    assert app_module.EMOTION_CACHE_LOOKUPS.value(tier="local", result="hit") >= 1
+    assert app_module.chat_prompt_template() is app_module.chat_prompt_template()
+
+
+def test_login_upgrades_hashes_made_with_old_parameters(client, monkeypatch):
+    import app as app_module
+
+    monkeypatch.setattr(app_module.password_hasher, "method", "pbkdf2:sha256:1000")
+    signup(client, username="rehash", email="rehash@example.com")
+    # A failed login caches the username; signup above must not be hidden by it
+    login(client, username="ghost")
+    signup(client, username="ghost", email="ghost@example.com")
+
+    upgraded = app_module.PasswordHasher(method="pbkdf2:sha256:2000", workers=0)
+    monkeypatch.setattr(app_module, "password_hasher", upgraded)
+    response = login(client, username="rehash")
+    assert b"Logged in successfully" in response.data
+
+    stored = app_module.load_login_user("rehash")["password"]
+    assert stored.startswith("pbkdf2:sha256:2000$")
+    assert app_module.user_lookup.get("rehash")["password"] == stored
+    assert b"Logged in successfully" in login(client, username="ghost").data
+
+
+def test_chat_is_rate_limited_per_user_but_crisis_messages_get_through(client, monkeypatch):
+    import app as app_module
+
+    monkeypatch.setattr(app_module, "admission", app_module.AdmissionController(
+        user_rate=0.01, user_burst=1, ip_rate=0, max_inflight=0
+    ))
+    monkeypatch.setattr(app_module.chatbot, "generate_contextual_response",
+                        lambda user_id, message: {"response": "ok"})
+    signup(client, username="limited", email="limited@example.com")
+    login(client, username="limited")
+
+    assert client.post("/chat", json={"message": "hello"}).status_code == 200
+    limited = client.post("/chat", json={"message": "hello again"})
+    assert limited.status_code == 429
+    assert int(limited.headers["Retry-After"]) >= 1
+    assert client.post("/chat/stream", json={"message": "hello"}).status_code == 429
+
+    # Through the real response path: the crisis is counted once, not again by admission
+    monkeypatch.delattr(app_module.chatbot, "generate_contextual_response")
+    detections = app_module.CRISIS_DETECTIONS.value()
+    assert client.post("/chat", json={"message": "I want to end my life"}).status_code == 200
+    assert app_module.CRISIS_DETECTIONS.value() == detections + 1
+    assert app_module.admission.inflight == 0
+
+
+def test_export_streams_a_users_data(client, tmp_path):
+    import json
+
+    import app as app_module
+
+    signup(client, username="exporter", email="export@example.com")
+    login(client, username="exporter")
+    client.post("/checkin", json={"mood": 3, "note": "ok"})
+    client.post("/journal", json={"title": "Day", "content": "Wrote things."})
+
+    assert client.get("/export?format=xml").status_code == 400
+    response = client.get("/export")
+    assert response.status_code == 200
+    assert response.mimetype == "application/x-ndjson"
+    records = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [r["type"] for r in records] == ["mood_checkin", "journal_entry"]
+    assert records[1]["content"] == "Wrote things."
+
+    csv_text = client.get("/export?format=csv").get_data(as_text=True)
+    assert csv_text.splitlines()[0].startswith("type,")
+
+    output = tmp_path / "all.ndjson"
+    result = app_module.app.test_cli_runner().invoke(args=["export-data", "--output", str(output)])
+    assert result.exit_code == 0
+    assert len(output.read_text().splitlines()) == 2
+
+
+def test_context_load_gives_up_waiting_on_a_stuck_write(client, monkeypatch):
+    import threading
+    import time
+
+    import app as app_module
+
+    monkeypatch.setattr(app_module, "WRITE_SYNC_TIMEOUT", 0.05)
+    release = threading.Event()
+    app_module.persist_executor.submit(7, release.wait)
+    try:
+        started = time.monotonic()
+        context = app_module.chatbot.get_user_context(7)
+        assert time.monotonic() - started < 1
+        assert context.last_seq == 0
+    finally:
+        release.set()
+
+
+def test_workers_sharing_a_user_never_overwrite_each_other(client, monkeypatch):
+    import app as app_module
+
+    # A second chatbot has its own near cache, like another gunicorn worker
+    worker_a, worker_b = app_module.chatbot, app_module.AdvancedMentalHealthChatbot()
+    monkeypatch.setattr(worker_b, "compactor", worker_a.compactor)
+
+    def turn(worker, message):
+        context = worker.get_user_context(5)
+        worker.complete_turn(5, context, message, "reply", "neutral")
+        app_module.persist_executor.wait(5, timeout=5)
+
+    turn(worker_a, "one")
+    worker_b.get_user_context(5)
+    turn(worker_a, "two")
+    # B's cached copy is behind; the version check reloads it
+    turn(worker_b, "three")
+    assert worker_b.get_user_context(5).emotional_history == ["one", "two", "three"]
+
+    # Without the check B writes from a stale copy: the CAS fails and the turn is re-applied
+    monkeypatch.setattr(app_module, "CONTEXT_VERSION_CHECK", False)
+    turn(worker_a, "four")
+    turn(worker_b, "five")
+    stored = app_module.context_store.load(5)
+    assert stored.emotional_history == ["one", "two", "three", "four", "five"]
+    assert (stored.conversation_depth, stored.last_seq, stored.version) == (5, 5, 5)
+
+    app_module.write_queue.flush()
+    with app_module.engine.connect() as conn:
+        seqs = conn.execute(
+            app_module.select(app_module.chat_messages_table.c.seq, app_module.chat_messages_table.c.message)
+            .where(app_module.chat_messages_table.c.user_id == 5)
+            .order_by(app_module.chat_messages_table.c.seq)
+        ).fetchall()
+    assert [tuple(row) for row in seqs] == [(1, "one"), (2, "two"), (3, "three"), (4, "four"), (5, "five")]
@@ -0,0 +1,138 @@
+import asyncio
+import importlib
+import importlib.util
+import json
+from types import SimpleNamespace
+
+import pytest
+
+
+@pytest.fixture()
+def asgi_module(tmp_path, monkeypatch):
+    if importlib.util.find_spec("flask") is None or importlib.util.find_spec("asgiref") is None:
+        pytest.skip("Flask/asgiref dependencies not available in test environment.")
+
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path / 'test.db'}")
+    monkeypatch.setenv("SECRET_KEY", "test-secret")
+    monkeypatch.setenv("GROQ_API_KEY", "test-key")
+    monkeypatch.delenv("CHAT_MAX_INFLIGHT", raising=False)
+
+    import app as app_module
+
+    importlib.reload(app_module)
+    import asgi
+
+    importlib.reload(asgi)
+    return asgi
+
+
+def call(asgi, method, path, body=b"", headers=(), disconnect_after=None):
+    messages = []
+    request_sent = []
+
+    async def receive():
+        if request_sent:
+            if disconnect_after is not None:
+                await asyncio.sleep(disconnect_after)
+                return {"type": "http.disconnect"}
+            await asyncio.sleep(3600)
+        request_sent.append(True)
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "root_path": "",
+        "headers": list(headers),
+        "server": ("testserver", 80),
+        "client": ("127.0.0.1", 12345),
+    }
+    asyncio.run(asgi.app(scope, receive, send))
+    status = next(m["status"] for m in messages if m["type"] == "http.response.start")
+    payload = b"".join(m.get("body", b"") for m in messages if m["type"] == "http.response.body")
+    return status, payload
+
+
+def session_cookie(asgi, user_id):
+    serializer = asgi.flask_app.session_interface.get_signing_serializer(asgi.flask_app)
+    return (b"cookie", f"session={serializer.dumps({'user_id': user_id})}".encode())
+
+
+def test_async_chat_requires_login(asgi_module):
+    status, payload = call(asgi_module, "POST", "/chat", b'{"message": "hi"}',
+                           [(b"content-type", b"application/json")])
+    assert status == 401
+    assert json.loads(payload) == {"error": "Authentication required"}
+
+
+def test_async_chat_uses_ainvoke(asgi_module, monkeypatch):
+    chatbot = asgi_module.chatbot
+
+    class FakeLLM:
+        async def ainvoke(self, prompt):
+            return SimpleNamespace(content="I'm listening.")
+
+    async def fake_detect(message):
+        return "joy"
+
+    monkeypatch.setattr(chatbot._llm, "get", lambda: FakeLLM())
+    monkeypatch.setattr(chatbot, "adetect_emotion", fake_detect)
+
+    status, payload = call(
+        asgi_module, "POST", "/chat", b'{"message": "I had a nice day"}',
+        [(b"content-type", b"application/json"), session_cookie(asgi_module, 1)],
+    )
+    assert status == 200
+    data = json.loads(payload)
+    assert data["response"] == "I'm listening."
+    assert data["emotion"] == "joy"
+    assert chatbot.get_user_context(1)["conversation_depth"] == 1
+
+
+def test_other_routes_fall_through_to_flask(asgi_module):
+    status, payload = call(asgi_module, "GET", "/health")
+    assert status == 200
+    assert json.loads(payload) == {"status": "ok"}
+
+
+def test_admission_cap_follows_llm_slots(asgi_module):
+    assert asgi_module.admission.max_inflight == asgi_module.LLM_MAX_INFLIGHT
+
+
+def test_client_disconnect_closes_the_llm_stream(asgi_module, monkeypatch):
+    chatbot = asgi_module.chatbot
+    closed = []
+
+    class StalledLLM:
+        async def astream(self, prompt):
+            try:
+                yield SimpleNamespace(content="Hello")
+                await asyncio.sleep(3600)
+            finally:
+                closed.append(True)
+
+    async def fake_detect(message):
+        return "joy"
+
+    monkeypatch.setattr(chatbot._llm, "get", lambda: StalledLLM())
+    monkeypatch.setattr(chatbot, "adetect_emotion", fake_detect)
+
+    status, payload = call(
+        asgi_module, "POST", "/chat/stream", b'{"message": "hi"}',
+        [(b"content-type", b"application/json"), session_cookie(asgi_module, 1)],
+        disconnect_after=0.2,
+    )
+    assert status == 200
+    assert b"Hello" in payload
+    assert closed == [True]
+    assert asgi_module.admission.inflight == 0
+    assert not asgi_module.llm_semaphore().locked()
@@ -0,0 +1,54 @@
+import pytest
+
+from auth import AuthBusy, PasswordHasher, UserLookupCache, hash_params
+
+
+def test_hasher_runs_in_process_pool_and_flags_old_parameters():
+    hasher = PasswordHasher(method="pbkdf2:sha256:1000", workers=1)
+    try:
+        stored = hasher.hash("secret")
+        assert hash_params(stored) == "pbkdf2:sha256:1000"
+        assert hasher.verify(stored, "secret")
+        assert not hasher.verify(stored, "wrong")
+        assert not hasher.needs_rehash(stored)
+
+        upgraded = PasswordHasher(method="pbkdf2:sha256:2000", workers=0)
+        assert upgraded.needs_rehash(stored)
+        assert upgraded.verify(stored, "secret")
+    finally:
+        hasher.close()
+
+
+def test_slow_hashes_time_out_and_then_reject_further_work():
+    hasher = PasswordHasher(method="pbkdf2:sha256:500000", workers=1, max_pending=1, timeout=0.05)
+    try:
+        with pytest.raises(AuthBusy, match="longer than"):
+            hasher.hash("secret")
+        # The slow hash still holds the only slot
+        with pytest.raises(AuthBusy, match="already pending"):
+            hasher.hash("secret")
+        stats = hasher.stats()
+        assert (stats["timeouts"], stats["rejected"]) == (1, 1)
+    finally:
+        hasher.close()
+
+
+def test_user_lookup_caches_hits_and_misses_until_invalidated():
+    users = {}
+    loads = []
+
+    def load(username):
+        loads.append(username)
+        return users.get(username)
+
+    lookup = UserLookupCache(load)
+    assert lookup.get("ana") is None
+    assert lookup.get("ana") is None
+    assert loads == ["ana"]
+
+    users["ana"] = {"id": 1, "username": "ana", "password": "hash"}
+    lookup.invalidate("ana")
+    assert lookup.get("ana")["id"] == 1
+    assert lookup.get("ana")["id"] == 1
+    assert loads == ["ana", "ana"]
+    assert lookup.stats()["found"]["hits"] == 1
@@ -0,0 +1,56 @@
+import threading
+
+import pytest
+
+from batching import MicroBatcher
+
+
+def test_concurrent_submissions_are_batched():
+    seen_batches = []
+
+    def batch_fn(items):
+        seen_batches.append(list(items))
+        return [item.upper() for item in items]
+
+    batcher = MicroBatcher(batch_fn, max_batch_size=8, window_ms=50)
+    results = {}
+
+    def worker(text):
+        results[text] = batcher.submit(text, timeout=5)
+
+    threads = [threading.Thread(target=worker, args=(f"msg{i}",)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == {f"msg{i}": f"MSG{i}" for i in range(8)}
+    assert len(seen_batches) < 8
+    stats = batcher.stats()
+    assert stats['items'] == 8
+    assert stats['max_batch_size_seen'] > 1
+    assert stats['queue_depth'] == 0
+
+
+def test_batch_errors_propagate_to_callers():
+    def batch_fn(items):
+        raise ValueError("model failed")
+
+    batcher = MicroBatcher(batch_fn, max_batch_size=4, window_ms=1)
+    with pytest.raises(ValueError):
+        batcher.submit("hello", timeout=5)
+
+
+def test_one_bad_item_only_fails_its_own_caller():
+    def batch_fn(items):
+        if "bad" in items:
+            raise ValueError("model failed")
+        return [item.upper() for item in items]
+
+    batcher = MicroBatcher(batch_fn, max_batch_size=4, window_ms=50)
+    futures = [batcher.submit_async(item) for item in ("a", "bad", "c")]
+    assert futures[0].result(timeout=5) == "A"
+    assert futures[2].result(timeout=5) == "C"
+    with pytest.raises(ValueError):
+        futures[1].result(timeout=5)
+    assert batcher.stats()["split_batches"] == 1
@@ -0,0 +1,43 @@
+import json
+import urllib.request
+
+from bench.fake_llm import FakeLLMConfig, start_server
+from bench.load_test import Recorder, percentile
+
+
+def test_percentile_and_report():
+    samples = [i / 1000 for i in range(1, 101)]
+    assert percentile(samples, 50) == 0.05
+    assert percentile(samples, 99) == 0.099
+    assert percentile([], 95) == 0.0
+
+    recorder = Recorder()
+    for sample in samples:
+        recorder.record("/chat", sample, 200 if sample < 0.1 else 500)
+    recorder.record("/chat", 0.001, 429)
+    report = recorder.report(wall_seconds=2.0)["/chat"]
+    assert report["count"] == 100
+    assert report["errors"] == 1
+    assert report["rate_limited"] == 1
+    assert report["p95_ms"] == 95.0
+    assert report["throughput_rps"] == 50.0
+
+
+def test_fake_llm_serves_chat_completions():
+    server = start_server(FakeLLMConfig(latency_ms=0, jitter_ms=0, first_token_ms=0, token_delay_ms=0, reply="hello there"))
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}/openai/v1/chat/completions"
+        body = json.dumps({"model": "m", "messages": [{"role": "user", "content": "hi"}]}).encode()
+        request = urllib.request.Request(url, data=body, headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(request, timeout=5) as response:
+            data = json.loads(response.read())
+        assert data["choices"][0]["message"]["content"] == "hello there"
+
+        stream_body = json.dumps({"model": "m", "messages": [], "stream": True}).encode()
+        request = urllib.request.Request(url, data=stream_body, headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(request, timeout=5) as response:
+            events = response.read().decode()
+        assert events.count("data: ") == 4
+        assert events.rstrip().endswith("data: [DONE]")
+    finally:
+        server.shutdown()
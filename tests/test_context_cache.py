@@ -0,0 +1,36 @@
+from context_cache import ContextCache
+
+
+def test_lru_eviction_by_entry_count():
+    evicted = []
+    cache = ContextCache(max_entries=2, ttl_seconds=None, max_bytes=None,
+                         on_evict=lambda key, value, reason: evicted.append((key, reason)))
+    cache.put(1, {"a": 1})
+    cache.put(2, {"b": 2})
+    assert cache.get(1) == {"a": 1}
+    cache.put(3, {"c": 3})
+
+    assert evicted == [(2, "capacity")]
+    assert cache.get(2) is None
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["evictions"]["capacity"] == 1
+
+
+def test_memory_ceiling_and_idle_ttl(monkeypatch):
+    import context_cache
+
+    now = [1000.0]
+    monkeypatch.setattr(context_cache.time, "monotonic", lambda: now[0])
+    cache = ContextCache(max_entries=100, ttl_seconds=60, max_bytes=10, sizeof=lambda value: len(value))
+    cache.put("a", "x" * 6)
+    cache.put("b", "y" * 6)
+    assert "a" not in cache
+    assert cache.stats()["evictions"]["memory"] == 1
+    assert cache.stats()["bytes"] == 6
+
+    now[0] += 61
+    assert cache.get("b") is None
+    assert cache.stats()["evictions"]["expired"] == 1
+    assert len(cache) == 0
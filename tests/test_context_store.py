@@ -0,0 +1,57 @@
+import pytest
+from sqlalchemy import Column, Integer, LargeBinary, MetaData, String, Table, Text, create_engine, select
+
+from context_store import SQLContextStore, VersionConflict
+from conversation_context import ConversationContext
+
+metadata = MetaData()
+state = Table(
+    "chat_state", metadata,
+    Column("user_id", Integer, primary_key=True),
+    Column("current_emotion", String(20)),
+    Column("conversation_depth", Integer, nullable=False, default=0),
+    Column("last_topic", String(200)),
+    Column("last_seq", Integer, nullable=False, default=0),
+    Column("summary", Text),
+    Column("summarized_seq", Integer, default=0),
+    Column("context", LargeBinary),
+    Column("version", Integer),
+)
+
+
+@pytest.fixture()
+def store():
+    engine = create_engine("sqlite://")
+    metadata.create_all(engine)
+    return SQLContextStore(engine, state, rebuild=lambda conn, row: ConversationContext(last_seq=row.last_seq))
+
+
+def test_compare_and_set_only_writes_over_the_expected_version(store):
+    assert store.load(1) is None
+    assert store.compare_and_set(1, ConversationContext(["hi"], last_seq=1), 0) == 1
+    assert store.compare_and_set(1, ConversationContext(["hi", "again"], last_seq=2), 1) == 2
+
+    with pytest.raises(VersionConflict):
+        store.compare_and_set(1, ConversationContext(["stale"], last_seq=2), 1)
+    with pytest.raises(VersionConflict):
+        store.compare_and_set(1, ConversationContext(["new user?"], last_seq=1), 0)
+
+    loaded = store.load(1)
+    assert (loaded.emotional_history, loaded.version) == (["hi", "again"], 2)
+    assert store.version(1) == 2
+    assert store.stats()["conflicts"] == 2
+
+
+def test_rows_from_before_versioning_are_rebuilt_and_writable(store):
+    with store.engine.begin() as conn:
+        conn.execute(state.insert().values(user_id=7, conversation_depth=3, last_seq=3))
+    legacy = store.load(7)
+    assert (legacy.last_seq, legacy.version) == (3, 0)
+    assert store.compare_and_set(7, legacy, 0) == 1
+
+
+def test_save_if_newer_never_moves_the_version_back(store):
+    store.save_if_newer(1, ConversationContext(last_seq=5), 5)
+    store.save_if_newer(1, ConversationContext(last_seq=4), 4)
+    with store.engine.connect() as conn:
+        assert conn.execute(select(state.c.last_seq, state.c.version)).one() == (5, 5)
@@ -0,0 +1,61 @@
+import json
+
+import pytest
+
+import conversation_context
+from conversation_context import ConversationContext, decode, encode
+
+
+def make_context(messages=3):
+    return ConversationContext(
+        emotional_history=[f"message number {i} about my week" for i in range(messages)],
+        current_emotion="joy",
+        conversation_depth=messages,
+        last_topic=None,
+        last_seq=messages,
+        summary="Talked about work.",
+        summarized_seq=0,
+    )
+
+
+def test_context_behaves_like_the_old_dict():
+    context = ConversationContext()
+    context["conversation_depth"] += 1
+    context["emotional_history"].append("hi")
+    assert context.get("conversation_depth") == 1
+    assert context.get("missing", "default") == "default"
+    assert not hasattr(context, "__dict__")
+    with pytest.raises(KeyError):
+        context["missing"] = 1
+
+
+@pytest.mark.parametrize("messages", [1, 40])
+def test_encode_round_trips(messages):
+    context = make_context(messages)
+    data = encode(context)
+    assert data[:3] == b"CX\x01"
+    assert decode(data) == context
+    assert len(data) < len(json.dumps(context.to_dict()))
+
+
+def test_large_contexts_are_compressed():
+    pytest.importorskip("zstandard")
+    data = encode(make_context(40))
+    assert data[3] & conversation_context.FLAG_ZSTD
+    assert not encode(make_context(40), compress_min_bytes=None)[3] & conversation_context.FLAG_ZSTD
+
+
+def test_json_codec_when_msgpack_is_missing(monkeypatch):
+    monkeypatch.setattr(conversation_context, "msgpack", None)
+    data = encode(make_context(), compress_min_bytes=None)
+    assert data[3] == conversation_context.CODEC_JSON
+    assert decode(data) == make_context()
+
+
+def test_decode_reads_legacy_json_rows():
+    legacy = json.dumps({"emotional_history": ["a", "b"], "current_emotion": "joy",
+                         "conversation_depth": 2, "last_topic": None})
+    for data in (legacy, legacy.encode()):
+        context = decode(data)
+        assert context.emotional_history == ["a", "b"]
+        assert (context.last_seq, context.summarized_seq) == (2, 0)
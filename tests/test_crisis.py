@@ -0,0 +1,22 @@
+from crisis import CrisisDetector, normalize_text
+
+
+def test_normalization_handles_punctuation_and_curly_apostrophes():
+    assert normalize_text("I  CAN’T   go on!!") == "i cant go on"
+    assert normalize_text("self-harm") == "self harm"
+    assert normalize_text("Suicídio") == "suicidio"
+
+
+def test_detector_reports_matched_phrases():
+    detector = CrisisDetector(["can't go on", "self harm", "kill myself", "suicide"])
+    assert detector.find("I just can’t   go on, thinking about self-harm.") == ["can't go on", "self harm"]
+    assert detector.matches("KILL MYSELF")
+    assert not detector.matches("this suicidesque plot twist")
+    assert not detector.matches("I'm feeling fine today")
+
+
+def test_default_phrase_list_loads():
+    detector = CrisisDetector.from_file()
+    assert len(detector) > 20
+    assert detector.matches("Je veux mourir")
+    assert detector.matches("I cant go on")
@@ -0,0 +1,40 @@
+import pytest
+
+from emotion_backends import EmotionBackend, create_backend, load_samples, parity_check
+
+
+class FixedBackend(EmotionBackend):
+    def __init__(self, labels):
+        self.labels = labels
+
+    def classify(self, messages):
+        return [
+            [{"label": label, "score": 0.9}, {"label": "neutral", "score": 0.1}]
+            for label in self.labels[:len(messages)]
+        ]
+
+
+def test_parity_check_reports_mismatches():
+    samples = ["a", "b", "c", "d"]
+    reference = FixedBackend(["joy", "anger", "sadness", "fear"])
+    candidate = FixedBackend(["joy", "anger", "sadness", "joy"])
+
+    report = parity_check(reference, candidate, samples, batch_size=4)
+
+    assert report["samples"] == 4
+    assert report["label_agreement"] == 0.75
+    assert report["mismatches"] == [{"text": "d", "expected": "fear", "actual": "joy"}]
+
+
+def test_bundled_samples_and_unknown_backend():
+    assert len(load_samples()) >= 30
+    with pytest.raises(ValueError):
+        create_backend("does-not-exist")
+
+
+def test_stub_backend_matches_pipeline_shape():
+    backend = create_backend("stub")
+    [angry, plain] = backend.classify(["I'm so angry right now", "The weather is cloudy"])
+    assert max(angry, key=lambda item: item["score"])["label"] == "anger"
+    assert max(plain, key=lambda item: item["score"])["label"] == "neutral"
+    assert abs(sum(item["score"] for item in angry) - 1.0) < 1e-9
@@ -0,0 +1,41 @@
+from emotion_cache import EmotionCache, cache_key
+
+
+class FakeStore:
+    def __init__(self):
+        self.values = {}
+        self.errors = 0
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def set(self, key, label):
+        self.values[key] = label
+
+
+def test_cache_key_ignores_case_width_and_whitespace():
+    assert cache_key("  Tell   me MORE ") == cache_key("tell me more") == cache_key("ｔｅｌｌ me more")
+
+
+def test_local_then_shared_tier_with_hit_metrics():
+    lookups = []
+    store = FakeStore()
+    worker_a = EmotionCache(shared=store, on_lookup=lambda tier, hit: lookups.append((tier, hit)))
+    worker_b = EmotionCache(shared=store)
+
+    key = worker_a.key_for("How can I help?")
+    assert worker_a.get(key) is None
+    worker_a.put(key, "neutral")
+    assert worker_a.get(key) == "neutral"
+    assert lookups == [("local", False), ("shared", False), ("local", True)]
+
+    # Another worker finds the label in the shared tier and keeps a local copy
+    assert worker_b.get(key) == "neutral"
+    assert worker_b.get_local(key) == "neutral"
+    assert worker_b.stats()["shared"]["hits"] == 1
+
+
+def test_long_messages_are_not_cached():
+    cache = EmotionCache(max_chars=10)
+    assert cache.key_for("short") == "short"
+    assert cache.key_for("a much longer message") is None
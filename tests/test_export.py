@@ -0,0 +1,52 @@
+import csv
+import io
+import json
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, create_engine
+
+from export import csv_columns, export_chunks
+
+metadata = MetaData()
+notes = Table(
+    "notes", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("user_id", Integer),
+    Column("body", String(50)),
+    Column("created_at", DateTime),
+)
+moods = Table(
+    "moods", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("user_id", Integer),
+    Column("mood", Integer),
+)
+SOURCES = (("note", notes, ("user_id", "id")), ("mood", moods, ("user_id", "id")))
+
+
+def make_engine():
+    engine = create_engine("sqlite://")
+    metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(notes.insert(), [
+            {"user_id": i % 2, "body": f"note {i}", "created_at": datetime(2024, 1, 1, 12, i)} for i in range(7)
+        ])
+        conn.execute(moods.insert(), [{"user_id": 1, "mood": 4}])
+    return engine
+
+
+def test_ndjson_export_streams_one_user_in_partitions():
+    chunks = list(export_chunks(make_engine(), SOURCES, "ndjson", user_id=1, batch_size=2))
+    # 3 notes in partitions of 2, then the mood row
+    assert len(chunks) == 3
+    records = [json.loads(line) for line in "".join(chunks).splitlines()]
+    assert [r["type"] for r in records] == ["note", "note", "note", "mood"]
+    assert records[0] == {"type": "note", "id": 2, "user_id": 1, "body": "note 1", "created_at": "2024-01-01T12:01:00"}
+    assert {r["user_id"] for r in records} == {1}
+
+
+def test_csv_export_shares_one_header_across_sources():
+    rows = list(csv.DictReader(io.StringIO("".join(export_chunks(make_engine(), SOURCES, "csv")))))
+    assert csv_columns(SOURCES) == ["type", "id", "user_id", "body", "created_at", "mood"]
+    assert len(rows) == 8
+    assert rows[-1] == {"type": "mood", "id": "1", "user_id": "1", "body": "", "created_at": "", "mood": "4"}
@@ -0,0 +1,40 @@
+import threading
+import time
+
+from keyed_executor import KeyedExecutor
+
+
+def test_tasks_run_in_order_per_key_and_in_parallel_across_keys():
+    executor = KeyedExecutor(max_workers=4)
+    order = []
+    started = threading.Barrier(2, timeout=5)
+
+    def slow(key, value):
+        if value == 0:
+            # Both keys' first tasks must be running at the same time to pass the barrier
+            started.wait()
+        time.sleep(0.01)
+        order.append((key, value))
+
+    for value in range(5):
+        executor.submit("a", slow, "a", value)
+        executor.submit("b", slow, "b", value)
+    assert executor.wait(timeout=5)
+
+    assert [v for k, v in order if k == "a"] == list(range(5))
+    assert [v for k, v in order if k == "b"] == list(range(5))
+    assert executor.stats()["completed"] == 10
+
+
+def test_wait_for_one_key_and_errors_are_reported_on_the_future():
+    executor = KeyedExecutor(max_workers=2)
+    release = threading.Event()
+    executor.submit("slow", release.wait, 5)
+    failed = executor.submit("fast", lambda: 1 / 0)
+
+    assert executor.wait("fast", timeout=5)
+    assert isinstance(failed.exception(), ZeroDivisionError)
+    assert executor.pending("slow")
+    assert not executor.wait("slow", timeout=0.01)
+    release.set()
+    assert executor.wait("slow", timeout=5)
@@ -0,0 +1,222 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from bench.fake_llm import FakeLLMConfig, start_server
+from llm_gateway import CircuitBreaker, CircuitOpen, DeadlineExceeded, LLMGateway, http_clients
+
+
+class Reply:
+    def __init__(self, content):
+        self.content = content
+
+
+class StatusError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+
+
+class ScriptedLLM:
+    """Fails, sleeps or answers according to a script, one entry per call"""
+
+    def __init__(self, script):
+        self.script = list(script)
+        self.calls = 0
+
+    def _next(self):
+        self.calls += 1
+        step = self.script.pop(0) if self.script else 0.0
+        if isinstance(step, Exception):
+            raise step
+        return step, Reply(f"reply {self.calls}")
+
+    def invoke(self, prompt):
+        delay, reply = self._next()
+        time.sleep(delay)
+        return reply
+
+    async def ainvoke(self, prompt):
+        delay, reply = self._next()
+        await asyncio.sleep(delay)
+        return reply
+
+
+def test_retries_retryable_errors_and_not_client_errors():
+    llm = ScriptedLLM([StatusError(503), StatusError(429)])
+    gateway = LLMGateway(llm, max_retries=2, backoff_base=0.001)
+    assert gateway.invoke("hi").content == "reply 3"
+    assert gateway.retries == 2
+
+    llm = ScriptedLLM([StatusError(400)])
+    gateway = LLMGateway(llm, max_retries=2, backoff_base=0.001)
+    with pytest.raises(StatusError):
+        gateway.invoke("hi")
+    assert llm.calls == 1
+    assert gateway.breaker.state == "closed"
+
+    llm = ScriptedLLM([TypeError("bad payload")])
+    gateway = LLMGateway(llm, max_retries=2, backoff_base=0.001)
+    with pytest.raises(TypeError):
+        gateway.invoke("hi")
+    assert llm.calls == 1
+
+    llm = ScriptedLLM([ConnectionResetError()])
+    gateway = LLMGateway(llm, max_retries=2, backoff_base=0.001)
+    assert gateway.invoke("hi").content == "reply 2"
+
+
+def test_deadline_bounds_the_wait():
+    gateway = LLMGateway(ScriptedLLM([1.0]), timeout=0.05)
+    started = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        gateway.invoke("hi")
+    assert time.monotonic() - started < 0.5
+    assert gateway.timeouts == 1
+
+
+def test_hedged_request_wins_when_the_first_is_slow():
+    gateway = LLMGateway(ScriptedLLM([0.5]), hedge=True, hedge_min_delay=0.02, hedge_min_samples=0)
+    assert gateway.invoke("hi").content == "reply 2"
+    assert (gateway.hedges, gateway.hedge_wins) == (1, 1)
+
+    gateway = LLMGateway(ScriptedLLM([0.5]), hedge=True, hedge_min_delay=0.02, hedge_min_samples=0)
+    assert asyncio.run(gateway.ainvoke("hi")).content == "reply 2"
+
+
+def test_circuit_opens_then_probes_after_reset():
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=0.05)
+    gateway = LLMGateway(ScriptedLLM([StatusError(500)] * 2), max_retries=0, breaker=breaker)
+    for _ in range(2):
+        with pytest.raises(StatusError):
+            gateway.invoke("hi")
+    with pytest.raises(CircuitOpen):
+        gateway.invoke("hi")
+    assert breaker.state == "open"
+
+    time.sleep(0.06)
+    assert gateway.invoke("hi").content == "reply 3"
+    assert breaker.state == "closed"
+
+
+class ChunkedLLM:
+    """Streams ``chunks``, sleeping ``first_delay`` before the first one"""
+
+    def __init__(self, chunks, first_delay=0.0):
+        self.chunks = chunks
+        self.first_delay = first_delay
+        self.closed = threading.Event()
+
+    def stream(self, prompt):
+        try:
+            time.sleep(self.first_delay)
+            for chunk in self.chunks:
+                yield Reply(chunk)
+        finally:
+            self.closed.set()
+
+    async def astream(self, prompt):
+        try:
+            await asyncio.sleep(self.first_delay)
+            for chunk in self.chunks:
+                yield Reply(chunk)
+        finally:
+            self.closed.set()
+
+    async def ainvoke(self, prompt):
+        await asyncio.sleep(self.first_delay)
+        return Reply("".join(self.chunks))
+
+
+def _tripped_breaker():
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=0.01)
+    breaker.record_failure()
+    time.sleep(0.02)
+    assert breaker.state == "half_open"
+    return breaker
+
+
+def test_abandoned_probe_does_not_leave_the_breaker_half_open():
+    breaker = _tripped_breaker()
+    gateway = LLMGateway(ChunkedLLM(["a", "b"]), breaker=breaker)
+    stream = gateway.stream("hi")
+    next(stream)
+    stream.close()
+    assert breaker.state == "closed"
+
+    breaker = _tripped_breaker()
+    gateway = LLMGateway(ChunkedLLM(["a"], first_delay=1.0), breaker=breaker)
+
+    async def cancel_probe():
+        task = asyncio.ensure_future(gateway.ainvoke("hi"))
+        await asyncio.sleep(0.02)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancel_probe())
+    assert breaker.state == "half_open"
+    assert breaker.allow()
+
+
+def test_stream_deadline_covers_the_first_chunk():
+    gateway = LLMGateway(ChunkedLLM(["a"], first_delay=1.0), timeout=0.05, max_retries=0)
+    started = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        list(gateway.stream("hi"))
+    assert time.monotonic() - started < 0.5
+
+
+def test_abandoned_streams_are_closed():
+    llm = ChunkedLLM(["a", "b"])
+    stream = LLMGateway(llm).stream("hi")
+    next(stream)
+    stream.close()
+    assert llm.closed.is_set()
+
+    # The upstream generator is still sleeping when the deadline hits; it is closed once it returns
+    llm = ChunkedLLM(["a"], first_delay=0.1)
+    with pytest.raises(DeadlineExceeded):
+        list(LLMGateway(llm, timeout=0.02, max_retries=0).stream("hi"))
+    assert llm.closed.wait(1.0)
+
+    llm = ChunkedLLM(["a"], first_delay=1.0)
+
+    async def consume():
+        async for _ in LLMGateway(llm, timeout=0.02, max_retries=0).astream("hi"):
+            pass
+
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(consume())
+    assert llm.closed.is_set()
+
+
+def test_against_fake_groq_endpoint():
+    langchain_groq = pytest.importorskip("langchain_groq")
+    config = FakeLLMConfig(latency_ms=0, jitter_ms=0, first_token_ms=0, token_delay_ms=0,
+                           error_rate=1.0, reply="hello there")
+    server = start_server(config)
+    try:
+        http_client, http_async_client = http_clients(timeout=2, connect_timeout=1, max_connections=4)
+        llm = langchain_groq.ChatGroq(
+            groq_api_key="test", groq_api_base=f"http://127.0.0.1:{server.server_address[1]}",
+            model_name="fake", max_retries=0, http_client=http_client, http_async_client=http_async_client,
+        )
+        gateway = LLMGateway(llm, max_retries=1, backoff_base=0.001,
+                             breaker=CircuitBreaker(failure_threshold=1, reset_seconds=60))
+        with pytest.raises(Exception) as error:
+            gateway.invoke("hi")
+        assert getattr(error.value, "status_code", None) == 503
+        assert gateway.attempts == 2
+        with pytest.raises(CircuitOpen):
+            gateway.invoke("hi")
+
+        # Upstream recovers
+        config.error_rate = 0.0
+        gateway.breaker.record_success()
+        assert gateway.invoke("hi").content == "hello there"
+        assert "".join(chunk.content for chunk in gateway.stream("hi")) == "hello there"
+    finally:
+        server.shutdown()
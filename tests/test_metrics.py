@@ -0,0 +1,73 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from metrics import Registry, SamplingProfiler
+
+
+def test_counters_and_histograms_render_prometheus_text():
+    registry = Registry()
+    requests = registry.counter("requests_total", "Requests", ["endpoint"])
+    latency = registry.histogram("stage_seconds", "Stage latency", ["stage"], buckets=(0.1, 1.0))
+    requests.inc(endpoint="/chat")
+    requests.inc(2, endpoint="/chat")
+    latency.observe(0.05, stage="llm")
+    latency.observe(0.5, stage="llm")
+    latency.observe(5.0, stage="llm")
+    registry.register_collector("pool", lambda: [("pool_size", "gauge", "Pool size", [({}, 5)])])
+
+    assert registry.counter("requests_total", "Requests", ["endpoint"]) is requests
+    text = registry.render()
+    assert 'requests_total{endpoint="/chat"} 3.0' in text
+    assert 'stage_seconds_bucket{stage="llm",le="0.1"} 1' in text
+    assert 'stage_seconds_bucket{stage="llm",le="1.0"} 2' in text
+    assert 'stage_seconds_bucket{stage="llm",le="+Inf"} 3' in text
+    assert 'stage_seconds_count{stage="llm"} 3' in text
+    assert "# TYPE pool_size gauge\npool_size 5" in text
+
+
+def _worker_registry(directory, requests_served, pool_size):
+    registry = Registry()
+    registry.set_multiprocess_dir(str(directory))
+    registry.counter("requests_total", "Requests").inc(requests_served)
+    registry.histogram("latency_seconds", "Latency", buckets=(1.0,)).observe(0.5)
+    registry.register_collector("pool", lambda: [("pool_size", "gauge", "Pool size", [({}, pool_size)])])
+    return registry
+
+
+def test_multiprocess_dir_sums_counters_across_workers(tmp_path):
+    exited = subprocess.Popen([sys.executable, "-c", "pass"])
+    exited.wait()
+    # Snapshots left by a live and by an exited worker
+    for pid, served in ((os.getppid(), 2), (exited.pid, 4)):
+        _worker_registry(tmp_path, served, 7).write_snapshot()
+        os.replace(tmp_path / f"{os.getpid()}.json", tmp_path / f"{pid}.json")
+
+    text = _worker_registry(tmp_path, 1, 3).render()
+    assert "requests_total 7.0" in text
+    assert 'latency_seconds_bucket{le="+Inf"} 3' in text
+    # Gauges are per live process
+    assert f'pool_size{{pid="{os.getpid()}"}} 3' in text
+    assert f'pool_size{{pid="{os.getppid()}"}} 7' in text
+    assert f'pid="{exited.pid}"' not in text
+
+
+def test_sampling_profiler_collects_target_thread_stacks():
+    done = threading.Event()
+
+    def busy_wait():
+        while not done.is_set():
+            time.sleep(0.001)
+
+    worker = threading.Thread(target=busy_wait)
+    worker.start()
+    profiler = SamplingProfiler(thread_id=worker.ident, interval=0.002).start()
+    time.sleep(0.05)
+    summary = profiler.stop().summary()
+    done.set()
+    worker.join()
+
+    assert summary["total_samples"] > 0
+    assert "busy_wait" in summary["stacks"][0]["stack"]
@@ -0,0 +1,70 @@
+from datetime import date, datetime, timezone
+
+from sqlalchemy import Column, Date, DateTime, Integer, MetaData, String, Table, create_engine, select
+
+from mood_rollups import MoodRollups
+
+metadata = MetaData()
+
+
+def _rollup_table(name):
+    return Table(
+        name, metadata,
+        Column("user_id", Integer, primary_key=True),
+        Column("bucket_start", Date, primary_key=True),
+        Column("checkin_count", Integer, nullable=False),
+        Column("mood_sum", Integer, nullable=False),
+        Column("mood_min", Integer, nullable=False),
+        Column("mood_max", Integer, nullable=False),
+        Column("last_note_at", DateTime(timezone=True)),
+    )
+
+
+daily = _rollup_table("daily")
+weekly = _rollup_table("weekly")
+checkins = Table(
+    "checkins", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("user_id", Integer, nullable=False),
+    Column("mood", Integer, nullable=False),
+    Column("note", String(200)),
+    Column("created_at", DateTime(timezone=True)),
+)
+
+
+class RacingConnection:
+    """Lets another writer create each bucket right after our UPDATE found nothing"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.raced = set()
+
+    def __getattr__(self, name):
+        return getattr(self.conn, name)
+
+    def execute(self, statement, *args):
+        result = self.conn.execute(statement, *args)
+        table = getattr(statement, "table", None)
+        if statement.is_update and table.name not in self.raced and not result.rowcount:
+            self.raced.add(table.name)
+            self.conn.execute(table.insert().values(
+                user_id=1, bucket_start=date(2024, 5, 6), checkin_count=1, mood_sum=5, mood_min=5, mood_max=5,
+            ))
+        return result
+
+
+def test_losing_the_race_for_a_new_bucket_merges_into_it():
+    engine = create_engine("sqlite://")
+    metadata.create_all(engine)
+    rollups = MoodRollups(daily, weekly)
+    row = {"user_id": 1, "mood": 2, "note": None, "created_at": datetime(2024, 5, 6, 9, tzinfo=timezone.utc)}
+
+    with engine.begin() as conn:
+        conn.execute(checkins.insert().values(**row))
+        rollups.apply(RacingConnection(conn), [row])
+
+    with engine.connect() as conn:
+        assert conn.execute(select(checkins.c.id)).fetchall() == [(1,)]
+        for table in (daily, weekly):
+            bucket = conn.execute(select(table)).one()
+            assert (bucket.checkin_count, bucket.mood_sum, bucket.mood_min, bucket.mood_max) == (2, 7, 2, 5)
@@ -0,0 +1,81 @@
+import pytest
+
+from retrieval import HashingEmbedder, MemoryIndex, Retriever, lock_index_path, select_snippets
+
+
+class CountingEmbedder(HashingEmbedder):
+    def __init__(self):
+        super().__init__()
+        self.embedded = []
+
+    def encode(self, texts):
+        self.embedded.extend(texts)
+        return super().encode(texts)
+
+
+def test_index_and_search_per_user_with_content_hash_cache():
+    embedder = CountingEmbedder()
+    retriever = Retriever(lambda: embedder, MemoryIndex, top_k=2, query_timeout=5)
+    retriever.load()
+
+    added = retriever.index_many([
+        (1, "My sister and I argued about the holidays again", "journal"),
+        (1, "Work deadlines keep me up at night", "journal"),
+        (1, "Work deadlines keep me up at night", "chat"),
+        (2, "My sister visited and it was lovely", "journal"),
+    ])
+    assert added == 3
+    assert retriever.index_many([(1, "Work deadlines keep me up at night", "chat")]) == 0
+
+    snippets = retriever.search(1, "I argued with my sister", exclude=["I argued with my sister"])
+    assert snippets[0] == "My sister and I argued about the holidays again"
+    assert all("lovely" not in snippet for snippet in snippets)
+
+    embedded_before = len(embedder.embedded)
+    retriever.search(1, "I argued with my sister")
+    assert len(embedder.embedded) == embedded_before
+    assert retriever.stats()["embedding_cache"]["hits"] >= 1
+
+
+def test_select_snippets_respects_budget_and_exclusions():
+    hits = [
+        {"text": "already in the prompt", "distance": 0.1},
+        {"text": "a " * 60, "distance": 0.2},
+        {"text": "too far away", "distance": 0.9},
+    ]
+    snippets = select_snippets(hits, max_chars=80, exclude=["already in  the prompt"], max_distance=0.5)
+    assert len(snippets) == 1
+    assert len(snippets[0]) <= 80 and snippets[0].endswith("...")
+
+
+def test_search_loads_the_model_in_the_background_instead_of_blocking():
+    retriever = Retriever(HashingEmbedder, MemoryIndex, query_timeout=5)
+    assert retriever.search(1, "remember") == []
+    retriever.add(1, "something to remember", "chat")
+    retriever.wait()
+    assert retriever.ready
+    assert retriever.search(1, "remember") == ["something to remember"]
+
+
+def test_on_disk_index_can_only_be_opened_by_one_process(tmp_path):
+    lock = lock_index_path(str(tmp_path / "index"))
+    # flock locks belong to the open file, so a second open conflicts like another worker would
+    with pytest.raises(RuntimeError, match="RETRIEVAL_CHROMA_HOST"):
+        lock_index_path(str(tmp_path / "index"))
+    lock.close()
+    lock_index_path(str(tmp_path / "index")).close()
+
+
+def test_search_does_not_retry_a_failed_index_on_every_turn():
+    opened = []
+
+    def broken_index():
+        opened.append(1)
+        raise RuntimeError("index is locked")
+
+    retriever = Retriever(HashingEmbedder, broken_index, query_timeout=5)
+    retriever.load()
+    for _ in range(3):
+        assert retriever.search(1, "anything") == []
+    assert opened == [1]
+    assert retriever.unavailable
@@ -0,0 +1,26 @@
+from summarizer import Compactor, extractive_summary
+
+
+def test_extractive_summary_stays_within_budget_and_keeps_newest():
+    turns = [(f"Message number {i}. With more detail after.", "ok") for i in range(50)]
+    summary = extractive_summary("Earlier they talked about work.", turns, max_chars=200)
+    assert len(summary) <= 200
+    assert "Message number 49." in summary
+    assert "With more detail" not in summary
+
+
+def test_compactor_runs_once_per_user_when_enough_turns_build_up():
+    applied = []
+    compactor = Compactor(
+        summarize=lambda previous, turns: f"{len(turns)} turns",
+        load_turns=lambda user_id, after, upto: [(f"m{seq}", None) for seq in range(after + 1, upto + 1)],
+        apply=lambda user_id, summary, upto: applied.append((user_id, summary, upto)),
+        keep_turns=3,
+        every_turns=6,
+    )
+    assert compactor.maybe_schedule(1, {'last_seq': 8, 'summarized_seq': 0}) is None
+
+    future = compactor.maybe_schedule(1, {'last_seq': 9, 'summarized_seq': 0})
+    future.result(timeout=5)
+    assert applied == [(1, "6 turns", 6)]
+    assert compactor.stats()["turns_compacted"] == 6
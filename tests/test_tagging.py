@@ -0,0 +1,56 @@
+import json
+
+from sqlalchemy import Column, Float, Integer, MetaData, String, Table, Text, create_engine, select
+
+from tagging import Checkpoint, JournalTagger
+
+metadata = MetaData()
+entries = Table(
+    "journal_entries", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("content", Text),
+    Column("emotion", String(20)),
+    Column("emotion_score", Float),
+)
+
+
+def top_label(scores):
+    return max(scores, key=lambda s: s["score"])["label"]
+
+
+def make_engine(tmp_path, texts):
+    engine = create_engine(f"sqlite:///{tmp_path / 'tag.db'}")
+    metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(entries.insert(), [{"content": text} for text in texts])
+    return engine
+
+
+def labels(engine):
+    with engine.connect() as conn:
+        return [row.emotion for row in conn.execute(select(entries).order_by(entries.c.id))]
+
+
+def test_tagger_labels_entries_and_resumes_from_checkpoint(tmp_path):
+    texts = ["so happy today", "feeling sad", "nothing much", "I am scared"] * 3
+    engine = make_engine(tmp_path, texts)
+    path = tmp_path / "checkpoint.json"
+    tagger = JournalTagger(engine, entries, top_label, backend="stub", workers=0, chunk_size=4, batch_size=3)
+
+    assert tagger.run(Checkpoint(str(path)), limit=5) == 5
+    assert json.loads(path.read_text()) == {"last_id": 5, "tagged": 5}
+    assert labels(engine)[:6] == ["joy", "sadness", "neutral", "fear", "joy", None]
+
+    assert tagger.run(Checkpoint(str(path))) == 7
+    assert labels(engine) == ["joy", "sadness", "neutral", "fear"] * 3
+    assert Checkpoint(str(path)).tagged == 12
+    assert tagger.run(Checkpoint(str(path))) == 0
+
+
+def test_tagger_process_pool(tmp_path):
+    engine = make_engine(tmp_path, ["so happy", "so sad", "angry and furious"])
+    tagger = JournalTagger(engine, entries, top_label, backend="stub", workers=2, nice=0, chunk_size=2, batch_size=1)
+    assert tagger.run(Checkpoint(None)) == 3
+    assert labels(engine) == ["joy", "sadness", "anger"]
+    with engine.connect() as conn:
+        assert conn.execute(select(entries.c.emotion_score)).scalars().all() == [0.9, 0.9, 0.9]
@@ -0,0 +1,84 @@
+import threading
+import time
+
+import pytest
+from sqlalchemy import Column, Integer, MetaData, String, Table, create_engine, select
+
+from write_behind import WriteBehindQueue, WriteQueueFull
+
+
+@pytest.fixture()
+def tables(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'writes.db'}")
+    metadata = MetaData()
+    events = Table("events", metadata, Column("id", Integer, primary_key=True), Column("name", String(50)))
+    notes = Table("notes", metadata, Column("id", Integer, primary_key=True), Column("text", String(50)))
+    metadata.create_all(engine)
+    return engine, events, notes
+
+
+def test_inserts_are_batched_per_table(tables):
+    engine, events, notes = tables
+    queue = WriteBehindQueue(engine, max_batch=100, flush_interval=0.5)
+    hooked = []
+    queue.add_insert_hook(events, lambda conn, rows: hooked.append(len(rows)))
+
+    for i in range(10):
+        queue.insert(events, {"name": f"e{i}"})
+    queue.insert(notes, {"text": "n"}, sync=True).result(timeout=5)
+
+    assert queue.stats()["batches"] == 1
+    assert hooked == [10]
+    with engine.connect() as conn:
+        assert len(conn.execute(select(events)).fetchall()) == 10
+        assert conn.execute(select(notes.c.text)).scalar_one() == "n"
+
+    queue.insert(notes, {"text": "later"})
+    queue.close()
+    with engine.connect() as conn:
+        assert len(conn.execute(select(notes)).fetchall()) == 2
+
+
+def test_failed_row_is_isolated_from_its_batch(tables):
+    engine, events, notes = tables
+    queue = WriteBehindQueue(engine, flush_interval=0.5)
+    good = queue.insert(events, {"id": 1, "name": "ok"})
+    bad = queue.insert(events, {"id": 1, "name": "duplicate"}, sync=True)
+
+    good.result(timeout=5)
+    with pytest.raises(Exception):
+        bad.result(timeout=5)
+    assert queue.stats()["failures"] == 1
+    queue.close()
+
+
+def test_full_queue_raises_after_enqueue_timeout(tables):
+    engine, events, notes = tables
+    queue = WriteBehindQueue(engine, max_pending=2, enqueue_timeout=0.05)
+    writing, blocked = threading.Event(), threading.Event()
+    queue.add_insert_hook(events, lambda conn, rows: (writing.set(), blocked.wait(5)))
+
+    # Hold the writer inside its first flush so later writes pile up
+    queue.insert(events, {"name": "held"}, sync=True)
+    assert writing.wait(5)
+    queue.insert(events, {"name": "a"})
+    queue.insert(events, {"name": "b"})
+    with pytest.raises(WriteQueueFull):
+        queue.insert(events, {"name": "c"})
+    blocked.set()
+    queue.close()
+
+
+def test_flush_waits_for_the_batch_being_written(tables):
+    engine, events, notes = tables
+    queue = WriteBehindQueue(engine, flush_interval=0.01)
+    writing = threading.Event()
+    queue.add_insert_hook(events, lambda conn, rows: (writing.set(), time.sleep(0.3)))
+
+    queue.insert(events, {"name": "slow"})
+    assert writing.wait(5)
+    # The batch has left the queue but hasn't committed yet
+    queue.flush(timeout=5)
+    with engine.connect() as conn:
+        assert conn.execute(select(events.c.name)).scalar_one() == "slow"
+    queue.close()
@@ -0,0 +1,220 @@
+"""Write-behind queue that batches row writes into multi-row statements.
+
+Requests enqueue inserts and return immediately (or wait for the flush when
+``sync=True``). A single writer thread drains the queue when it holds
+``max_batch`` operations or ``flush_interval`` has passed, and writes each batch
+in one transaction with one executemany insert per table.
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class WriteQueueFull(Exception):
+    """Raised when the queue stays full for longer than the enqueue timeout"""
+
+
+class _Op:
+    __slots__ = ('table', 'row', 'future')
+
+    def __init__(self, table, row):
+        self.table = table
+        self.row = row
+        self.future = Future()
+
+
+class WriteBehindQueue:
+    def __init__(
+        self,
+        engine,
+        max_batch: int = 500,
+        flush_interval: float = 0.05,
+        max_pending: int = 10000,
+        enqueue_timeout: float = 2.0,
+    ):
+        self.engine = engine
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.enqueue_timeout = enqueue_timeout
+
+        self._ops: List[_Op] = []
+        # The batch the writer has taken off _ops and is writing now
+        self._in_flight: List[_Op] = []
+        self._cond = threading.Condition()
+        self._flush_requested = False
+        self._closed = False
+        self._worker = None
+        self._worker_pid = None
+        self._hooks: Dict[str, List[Callable]] = defaultdict(list)
+
+        self.batches = 0
+        self.rows_written = 0
+        self.failures = 0
+        self.max_pending_seen = 0
+        self.flush_seconds = 0.0
+
+    def add_insert_hook(self, table, hook: Callable):
+        """Call ``hook(conn, rows)`` in the same transaction after rows are inserted into ``table``"""
+        self._hooks[table.name].append(hook)
+
+    def _ensure_worker(self):
+        # Like the emotion batcher, the writer thread is per process so it
+        # survives gunicorn forking a preloaded app
+        if self._worker is not None and self._worker_pid == os.getpid() and self._worker.is_alive():
+            return
+        self._worker_pid = os.getpid()
+        self._worker = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._worker.start()
+
+    def insert(self, table, row: Dict, sync: bool = False) -> Future:
+        return self._submit(_Op(table, row), sync)
+
+    def _submit(self, op: _Op, sync: bool) -> Future:
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("write-behind queue is closed")
+            self._ensure_worker()
+            deadline = time.monotonic() + self.enqueue_timeout
+            # Backpressure: block the caller while the writer catches up
+            while len(self._ops) >= self.max_pending:
+                self._flush_requested = True
+                self._cond.notify_all()
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise WriteQueueFull(f"{len(self._ops)} writes pending")
+                self._cond.wait(remaining)
+            self._ops.append(op)
+            self.max_pending_seen = max(self.max_pending_seen, len(self._ops))
+            if sync or len(self._ops) >= self.max_batch:
+                self._flush_requested = True
+            self._cond.notify_all()
+        return op.future
+
+    def flush(self, timeout: Optional[float] = None):
+        """Block until everything queued so far has been written"""
+        with self._cond:
+            if self._ops:
+                # Batches are written in order, so this is done after the one in flight
+                last = self._ops[-1].future
+                self._flush_requested = True
+                self._cond.notify_all()
+            elif self._in_flight:
+                last = self._in_flight[-1].future
+            else:
+                return
+        try:
+            last.result(timeout=timeout)
+        except Exception:
+            pass
+
+    def close(self, timeout: float = 10.0):
+        """Flush pending writes and stop accepting new ones"""
+        self.flush(timeout=timeout)
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def _take_batch(self) -> List[_Op]:
+        with self._cond:
+            while not self._ops and not self._closed:
+                self._cond.wait()
+            # Give concurrent writers one flush interval to join this batch
+            deadline = time.monotonic() + self.flush_interval
+            while not self._flush_requested and not self._closed and len(self._ops) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            batch = self._ops[:self.max_batch]
+            del self._ops[:len(batch)]
+            self._in_flight = batch
+            if not self._ops:
+                self._flush_requested = False
+            # Wake callers blocked on a full queue
+            self._cond.notify_all()
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            if not batch:
+                if self._closed:
+                    return
+                continue
+            started = time.perf_counter()
+            try:
+                with self.engine.begin() as conn:
+                    self._write(conn, batch)
+            except Exception:
+                logger.exception("Batched write of %d rows failed; retrying individually", len(batch))
+                errors = self._write_individually(batch)
+            else:
+                errors = [None] * len(batch)
+                self.rows_written += len(batch)
+            self._finish(time.perf_counter() - started)
+            for op, error in zip(batch, errors):
+                if error is None:
+                    op.future.set_result(None)
+                else:
+                    op.future.set_exception(error)
+            with self._cond:
+                self._in_flight = []
+
+    def _write_individually(self, batch: List[_Op]) -> List[Optional[Exception]]:
+        # Isolate the bad row so one failure doesn't drop the rest of the batch
+        errors = []
+        for op in batch:
+            try:
+                with self.engine.begin() as conn:
+                    self._write(conn, [op])
+            except Exception as e:
+                self.failures += 1
+                logger.exception("Write to %s failed", op.table.name)
+                errors.append(e)
+            else:
+                self.rows_written += 1
+                errors.append(None)
+        return errors
+
+    def _finish(self, seconds: float):
+        with self._cond:
+            self.batches += 1
+            self.flush_seconds += seconds
+
+    def _write(self, conn, batch: List[_Op]):
+        inserts = OrderedDict()
+        for op in batch:
+            inserts.setdefault(op.table.name, (op.table, []))[1].append(op.row)
+
+        for table, rows in inserts.values():
+            conn.execute(table.insert(), rows)
+            for hook in self._hooks.get(table.name, ()):
+                hook(conn, rows)
+
+    def stats(self) -> Dict:
+        with self._cond:
+            return {
+                'pending': len(self._ops),
+                'max_pending_seen': self.max_pending_seen,
+                'batches': self.batches,
+                'rows_written': self.rows_written,
+                'failures': self.failures,
+                'mean_flush_seconds': (self.flush_seconds / self.batches) if self.batches else 0.0,
+                'config': {
+                    'max_batch': self.max_batch,
+                    'flush_interval_ms': self.flush_interval * 1000.0,
+                    'max_pending': self.max_pending,
+                },
+            }
+
+    def register_atexit(self):
+        atexit.register(self.close)
+        return self